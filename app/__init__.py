@@ -3,11 +3,12 @@ from typing import TYPE_CHECKING, Type
 from flask import Flask
 
 from helpers.files import enforce_directory_creation
+from helpers.parallel_execution import configure_executors
 
 from app import middlewares
 from app.api.exceptions import BaseAPIException
-from app.api.routes import tasks_bp
-from app.extensions import spec
+from app.api.routes import metrics_bp, tasks_bp, uploads_bp
+from app.extensions import metrics_init_app, spec
 from app.extensions.celery import celery_init_app
 
 if TYPE_CHECKING:
@@ -24,10 +25,18 @@ def create_app(config: Type["Config"] | str) -> Flask:
     enforce_directory_creation(app.config["UPLOAD_FOLDER"], app.config["DOWNLOAD_FOLDER"])
 
     app.register_blueprint(tasks_bp)
+    app.register_blueprint(uploads_bp)
+    app.register_blueprint(metrics_bp)
     spec.register(app)
 
     app.config.from_prefixed_env()
+    configure_executors(
+        thread_workers=app.config["EXECUTOR_THREAD_WORKERS"],
+        process_workers=app.config["EXECUTOR_PROCESS_WORKERS"],
+        max_pending=app.config["EXECUTOR_MAX_PENDING"],
+    )
     celery_init_app(app)
+    metrics_init_app(app)
 
     app.register_error_handler(400, middlewares.handle_404)
     app.register_error_handler(Exception, middlewares.handle_bare_excpetions)
@@ -44,6 +44,11 @@ class ResourceNotAvailableAPIException(BaseAPIException):
     message = "Resouce not available."
 
 
+class ConflictAPIException(BaseAPIException):
+    http_status = HTTPStatus.CONFLICT
+    message = "The request conflicts with the current state of the resource."
+
+
 class NotFoundAPIException(BaseAPIException):
     http_status = HTTPStatus.NOT_FOUND
 
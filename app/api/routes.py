@@ -3,17 +3,24 @@ from flask_pydantic_spec import MultipartFormRequest, Response
 
 import dtos
 import services
-from daos import TasksMongoDAO
+from daos import TasksMongoDAO, UploadsMongoDAO
 
-from app.extensions import db, spec
+from app.extensions import db, metrics, spec
 
 tasks_bp = Blueprint("tasks_bp", __name__, url_prefix="/api/v1/file-processing/tasks")
+uploads_bp = Blueprint("uploads_bp", __name__, url_prefix="/api/v1/file-processing/uploads")
+metrics_bp = Blueprint("metrics_bp", __name__)
 
 
 @tasks_bp.route("/", methods=["POST"])
 @spec.validate(
     body=MultipartFormRequest(),
-    resp=Response(HTTP_202=dtos.TaskAPIResponse, HTTP_400=dtos.ErrorResponse),
+    resp=Response(
+        HTTP_200=dtos.TaskAPIResponse,
+        HTTP_202=dtos.TaskAPIResponse,
+        HTTP_400=dtos.ErrorResponse,
+        HTTP_422=dtos.TaskAPIResponse,
+    ),
     tags=["Tasks"],
 )
 def create_task():
@@ -22,8 +29,13 @@ def create_task():
 
     This endpoint allows users to create a new task by uploading a CSV file.
     The uploaded file will be processed asynchronously in the background.
+    An optional `engine` form field (PARTITION, EXTERNAL, STREAMING, IN_MEMORY or AUTO) selects the processing
+    engine for this task.
     Upon successful submission, the API will return a response with HTTP status 202 Accepted,
     indicating that the task has been created and will be processed.
+    Files up to CSV_INLINE_MAX_SIZE bytes are processed right away instead, the API returns HTTP status 200 OK
+    with the finished task and a link to download its result, or HTTP status 422 Unprocessable Entity with the
+    errors of the task if it failed.
     """
     dao = TasksMongoDAO(db=db)
     service = services.CreateTaskService(
@@ -31,6 +43,10 @@ def create_task():
         dao=dao,
         upload_folder=current_app.config["UPLOAD_FOLDER"],
         download_folder=current_app.config["DOWNLOAD_FOLDER"],
+        inline_max_size=current_app.config["CSV_INLINE_MAX_SIZE"],
+        heavy_task_size=current_app.config["CSV_HEAVY_TASK_SIZE"],
+        light_queue=current_app.config["CELERY_LIGHT_QUEUE"],
+        heavy_queue=current_app.config["CELERY_HEAVY_QUEUE"],
     )
     return service.create_task()
 
@@ -66,3 +82,78 @@ def download_task_results(task_id: str):
     dao = TasksMongoDAO(db=db)
     service = services.DownloadTaskResultService(dao=dao)
     return service.download(task_id=task_id)
+
+
+def make_chunked_upload_service() -> "services.ChunkedUploadService":
+    return services.ChunkedUploadService(
+        request=request,
+        dao=UploadsMongoDAO(db=db),
+        tasks_dao=TasksMongoDAO(db=db),
+        upload_folder=current_app.config["UPLOAD_FOLDER"],
+        heavy_task_size=current_app.config["CSV_HEAVY_TASK_SIZE"],
+        light_queue=current_app.config["CELERY_LIGHT_QUEUE"],
+        heavy_queue=current_app.config["CELERY_HEAVY_QUEUE"],
+    )
+
+
+@uploads_bp.route("/", methods=["POST"])
+@spec.validate(resp=Response(HTTP_201=dtos.UploadAPIResponse, HTTP_400=dtos.ErrorResponse), tags=["Uploads"])
+def start_upload():
+    """
+    Start a chunked upload of a CSV file.
+
+    The JSON body holds the `filename` and, optionally, the `engine` of the task.
+    The API returns HTTP status 201 Created with the upload, whose chunks are then sent to the `next` endpoint.
+    """
+    return make_chunked_upload_service().start_upload()
+
+
+# Not validated by the spec on purpose, it would read the whole body in memory instead of streaming it to the file.
+@uploads_bp.route("/<upload_id>", methods=["PUT"])
+def upload_chunk(upload_id: str):
+    """
+    Upload the next chunk of a file.
+
+    The raw body is the chunk and the `Upload-Offset` header the offset of its first byte in the file, which must be
+    the current offset of the upload. The API returns HTTP status 200 OK with the new offset of the upload (also in
+    the `Upload-Offset` header), or HTTP status 409 Conflict if the offset is not the expected one.
+    """
+    return make_chunked_upload_service().upload_chunk(upload_id=upload_id)
+
+
+@uploads_bp.route("/<upload_id>", methods=["GET"])
+@spec.validate(resp=Response(HTTP_200=dtos.UploadAPIResponse), tags=["Uploads"])
+def get_upload_status(upload_id: str):
+    """
+    Check the status of an upload.
+
+    The API returns HTTP status 200 OK with the upload and its offset (also in the `Upload-Offset` header, so a HEAD
+    request is enough), from where an interrupted upload is resumed.
+    """
+    return make_chunked_upload_service().get_upload_status(upload_id=upload_id)
+
+
+@uploads_bp.route("/<upload_id>/finalize", methods=["POST"])
+@spec.validate(
+    resp=Response(HTTP_202=dtos.TaskAPIResponse, HTTP_400=dtos.ErrorResponse, HTTP_409=dtos.ErrorResponse),
+    tags=["Uploads"],
+)
+def finalize_upload(upload_id: str):
+    """
+    Finalize an upload and create the task processing its file.
+
+    The optional `checksum` of the JSON body (the crc32 of the whole file) is checked against the running checksum
+    of the upload. The API returns HTTP status 202 Accepted with the task, as the task creation endpoint does.
+    """
+    return make_chunked_upload_service().finalize_upload(upload_id=upload_id)
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def get_metrics():
+    """
+    Expose the metrics of the API in the Prometheus text format.
+
+    The latency of every route, and the disk used by the uploaded, result and temporary files. The metrics of the
+    celery workers are served by the workers themselves, on CELERY_METRICS_PORT.
+    """
+    return metrics.generate_metrics(current_app.config["UPLOAD_FOLDER"], current_app.config["DOWNLOAD_FOLDER"])
@@ -1,3 +1,4 @@
 from .celery import celery_init_app
+from .metrics import metrics_init_app
 from .mongo_db import db
 from .spec import spec
@@ -0,0 +1,209 @@
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+
+from celery.signals import (
+    task_postrun,
+    task_prerun,
+    worker_init,
+    worker_process_shutdown,
+    worker_ready,
+)
+from flask import Flask, Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from dtos import Task, TaskStatus
+
+# Set for services running many processes (gunicorn workers, celery prefork pool): every process writes its metrics
+# to memory-mapped files of this directory, aggregated at scrape time. It must be set before the first import of
+# `prometheus_client`, and must not be shared by two services.
+MULTIPROCESS_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+REQUEST_LATENCY = Histogram(
+    "csv_api_request_duration_seconds",
+    "Time spent by the API handling a request, until the response is returned (not streamed).",
+    ["method", "route", "status"],
+)
+TASK_QUEUE_WAIT = Histogram(
+    "csv_task_queue_wait_seconds",
+    "Time between queueing a processing task and a worker starting it.",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+TASKS_IN_FLIGHT = Gauge("csv_celery_tasks_in_flight", "Celery tasks running.", ["task"], multiprocess_mode="livesum")
+TASK_DURATION = Histogram(
+    "csv_celery_task_duration_seconds",
+    "Time spent running a celery task.",
+    ["task", "state"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+PROCESSING_TIME = Histogram(
+    "csv_processing_duration_seconds",
+    "Time spent processing a csv file by a single worker.",
+    ["engine"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+PROCESSING_THROUGHPUT = Histogram(
+    "csv_processing_throughput_bytes_per_second",
+    "Bytes of input file (decompressed) processed per second by a single worker.",
+    ["engine"],
+    buckets=tuple(2**power * 1024**2 for power in range(0, 11)),
+)
+PROCESSED_BYTES = Counter("csv_processed_bytes", "Bytes of input files (decompressed) processed.", ["engine"])
+PROCESSED_ROWS = Counter(
+    "csv_processed_rows", "Rows of input files processed (by every engine but STREAMING).", ["engine"]
+)
+
+_task_start_times: Dict[str, float] = {}
+
+
+def metrics_init_app(app: Flask) -> None:
+    """
+    Measures the latency of every request of the app, and exposes the metrics of the celery workers of the app on
+    CELERY_METRICS_PORT (0 disables it).
+    """
+    app.before_request(_start_request_timer)
+    app.after_request(_observe_request_latency)
+
+    @worker_init.connect(weak=False, dispatch_uid="clear_multiprocess_dir")
+    def clear_multiprocess_dir(**kwargs) -> None:
+        # The files left by the previous run of the worker would be aggregated with the new ones.
+        if multiprocess_dir := os.getenv(MULTIPROCESS_DIR_ENV):
+            for file_path in Path(multiprocess_dir).glob("*.db"):
+                file_path.unlink(missing_ok=True)
+
+    @worker_ready.connect(weak=False, dispatch_uid="start_metrics_server")
+    def start_metrics_server(**kwargs) -> None:
+        if port := app.config["CELERY_METRICS_PORT"]:
+            start_http_server(port, registry=make_registry(app.config["UPLOAD_FOLDER"], app.config["DOWNLOAD_FOLDER"]))
+
+
+def make_registry(upload_folder: Path, download_folder: Path) -> CollectorRegistry:
+    """
+    Builds the registry to be exposed: the metrics of every process of the service (or of this one, without
+    PROMETHEUS_MULTIPROC_DIR) and the disk usage of the files of the tasks, measured when scraped.
+
+    Args:
+        upload_folder (Path): The folder of the uploaded files.
+        download_folder (Path): The folder of the result files, and of the temporary files of the tasks.
+
+    Returns:
+        CollectorRegistry: The registry.
+    """
+    registry = CollectorRegistry()
+    if os.getenv(MULTIPROCESS_DIR_ENV):
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(REGISTRY)
+
+    registry.register(DiskUsageCollector(upload_folder, download_folder))
+    return registry
+
+
+def generate_metrics(upload_folder: Path, download_folder: Path) -> Response:
+    registry = make_registry(upload_folder, download_folder)
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+class DiskUsageCollector:
+    """
+    Collects the bytes used by the files of the tasks: the uploaded files ("input"), the result files ("output") and
+    the temporary files ("tmp", the directories of the tasks inside the download folder).
+
+    The folders are walked at every scrape, files deleted meanwhile (e.g. by a task that just finished) are skipped.
+    """
+
+    def __init__(self, upload_folder: Path, download_folder: Path):
+        self.upload_folder = upload_folder
+        self.download_folder = download_folder
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        output_bytes, tmp_bytes = _get_folder_usage(self.download_folder)
+        input_bytes, _ = _get_folder_usage(self.upload_folder)
+
+        usage = GaugeMetricFamily("csv_disk_usage_bytes", "Bytes used by the files of the tasks.", labels=["directory"])
+        usage.add_metric(["input"], input_bytes)
+        usage.add_metric(["output"], output_bytes)
+        usage.add_metric(["tmp"], tmp_bytes)
+        yield usage
+
+
+def _get_folder_usage(folder: Path) -> Tuple[int, int]:
+    """
+    Returns the bytes of the files directly inside the folder, and of the files of its sub-directories.
+    """
+    files_bytes = tree_bytes = 0
+    for root, _, file_names in os.walk(folder):
+        size = 0
+        for file_name in file_names:
+            try:
+                size += os.stat(os.path.join(root, file_name)).st_size
+            except FileNotFoundError:
+                continue
+
+        if root == str(folder):
+            files_bytes += size
+        else:
+            tree_bytes += size
+
+    return files_bytes, tree_bytes
+
+
+def observe_queue_wait(task: Task) -> None:
+    # A task delivered again after its worker died is already IN_PROGRESS, it did not wait in the queue since then.
+    if task.status == TaskStatus.QUEUED and task.queued_at is not None:
+        TASK_QUEUE_WAIT.observe(max((datetime.utcnow() - task.queued_at).total_seconds(), 0.0))
+
+
+def observe_processed_file(engine: str, *, elapsed: float, input_bytes: int, rows: int | None) -> None:
+    PROCESSING_TIME.labels(engine).observe(elapsed)
+    PROCESSED_BYTES.labels(engine).inc(input_bytes)
+    # The STREAMING engine does not count the rows of the file.
+    if rows is not None:
+        PROCESSED_ROWS.labels(engine).inc(rows)
+    if elapsed > 0:
+        PROCESSING_THROUGHPUT.labels(engine).observe(input_bytes / elapsed)
+
+
+def _start_request_timer() -> None:
+    g.request_start_time = time.perf_counter()
+
+
+def _observe_request_latency(response: Response) -> Response:
+    if (start_time := g.pop("request_start_time", None)) is not None:
+        # The rule (e.g. '/api/v1/file-processing/tasks/<task_id>/status') keeps the number of series bounded.
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        REQUEST_LATENCY.labels(request.method, route, response.status_code).observe(time.perf_counter() - start_time)
+
+    return response
+
+
+@task_prerun.connect
+def _track_task_start(task_id: str, task, **kwargs) -> None:
+    _task_start_times[task_id] = time.perf_counter()
+    TASKS_IN_FLIGHT.labels(task.name).inc()
+
+
+@task_postrun.connect
+def _track_task_end(task_id: str, task, state: str | None = None, **kwargs) -> None:
+    TASKS_IN_FLIGHT.labels(task.name).dec()
+    if (start_time := _task_start_times.pop(task_id, None)) is not None:
+        TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - start_time)
+
+
+@worker_process_shutdown.connect
+def _mark_process_dead(pid: int | None = None, **kwargs) -> None:
+    if os.getenv(MULTIPROCESS_DIR_ENV):
+        multiprocess.mark_process_dead(pid or os.getpid())
@@ -0,0 +1,191 @@
+import threading
+from pathlib import Path
+from typing import Iterator, Set, TextIO, TypeVar
+
+import polars as pl
+
+import helpers
+from background_tasks.manifest import PartitionEntry, PartitionManifest
+from background_tasks.partitioning import bucket_expression, partition_by_bucket
+from logger import get_logger
+
+logger = get_logger(__file__)
+pl.enable_string_cache(True)
+
+FrameT = TypeVar("FrameT", pl.DataFrame, pl.LazyFrame)
+
+
+def sum_plays_by_song_and_date(dataframe: FrameT, count_column: str | None = None) -> FrameT:
+    """
+    Aggregates the dataframe by "Song" and "Date", summing the "Number of Plays".
+
+    Args:
+        dataframe (pl.DataFrame | pl.LazyFrame): The rows (or partial aggregates) to be aggregated.
+        count_column (str | None, optional): Also counts the rows of each (Song, Date) pair in this column, e.g. to
+            know the rows of a file read by a single query. Defaults to None.
+
+    Returns:
+        pl.DataFrame | pl.LazyFrame: A dataframe with one row for each (Song, Date) pair.
+    """
+    if count_column is not None:
+        return dataframe.groupby("Song", "Date").agg(pl.sum("Number of Plays"), pl.count().alias(count_column))
+
+    return dataframe.groupby("Song", "Date").agg(pl.sum("Number of Plays"))
+
+
+def collect_group_aggregates(
+    manifest: PartitionManifest, entry: PartitionEntry, num_sub_partitions: int
+) -> Iterator[pl.DataFrame]:
+    """
+    Aggregates the record batches of a temporary group, yielding its (Song, Date) sums.
+
+    A hot group also has `sub_partitions`: record batches holding its rows written after it became hot, split by
+    the hash of their "Date" into `num_sub_partitions` sub-partitions. Such a group is aggregated one sub-partition
+    at a time: the rows of the group itself with the same "Date" hash (memory-mapped, so only the filtered rows are
+    copied) plus the record batches of the sub-partition, so only one of them is in memory at once.
+
+    Args:
+        manifest (PartitionManifest): The manifest of the temporary groups.
+        entry (PartitionEntry): The group.
+        num_sub_partitions (int): The number of sub-partitions used by the splitter.
+
+    Yields:
+        pl.DataFrame: The (Song, Date) sums, of the whole group or of one sub-partition.
+    """
+    # A group only becomes hot after some of its own rows were written.
+    group_rows = helpers.read_ipc_record_batches(manifest.get_fragments([entry]))
+    if not entry.sub_partitions:
+        yield sum_plays_by_song_and_date(group_rows)
+        return
+
+    for sub_partition in range(num_sub_partitions):
+        sources = [group_rows.filter(bucket_expression(num_sub_partitions, columns=("Date",)) == sub_partition)]
+        if sub_partition in entry.sub_partitions:
+            sources.append(helpers.read_ipc_record_batches(manifest.get_fragments([entry], sub_partition)))
+
+        yield sum_plays_by_song_and_date(pl.concat(sources))
+
+
+class ExternalHashAggregator:
+    """
+    Aggregates (Song, Date) -> sum("Number of Plays") with a hard ceiling on the memory used by the aggregates.
+
+    The partial aggregates are kept in memory while their estimated size stays under `memory_budget`. Once the
+    budget is exceeded they are hashed into `num_partitions` runs and the memory is released (spilled). Each
+    spill adds one Arrow IPC fragment to every run. At the end every run is merged on its own, since a given
+    (Song, Date) pair always lands in the same run. A run that is still larger than the budget is re-partitioned
+    with a different hash function.
+
+    If nothing was spilled, the result is written straight from memory and no temporary file is read at all.
+
+    Example:
+        >>> aggregator = ExternalHashAggregator(tmp_dir, memory_budget=256 * 1024**2)
+        >>> for chunk in chunks:
+        ...     aggregator.add(chunk)
+        >>> with open("result.csv", "a") as f:
+        ...     aggregator.write_result(f, lock)
+    """
+
+    MAX_DEPTH = 3
+
+    def __init__(
+        self,
+        spill_dir: Path,
+        *,
+        memory_budget: int,
+        num_partitions: int = 64,
+        depth: int = 0,
+    ):
+        self.spill_dir = spill_dir
+        self.memory_budget = memory_budget
+        self.num_partitions = num_partitions
+        self.depth = depth
+        self.spill_count = 0
+        self._aggregates: pl.DataFrame | None = None
+        self._runs: Set[int] = set()
+
+    @property
+    def has_spilled(self) -> bool:
+        return self.spill_count > 0
+
+    def add(self, dataframe: pl.DataFrame) -> None:
+        """
+        Merges the rows of the dataframe into the in-memory partial aggregates, spilling them to disk if the
+        memory budget is exceeded.
+
+        Args:
+            dataframe (pl.DataFrame): The rows to be aggregated.
+        """
+        aggregates = sum_plays_by_song_and_date(dataframe)
+        if self._aggregates is not None:
+            aggregates = sum_plays_by_song_and_date(pl.concat([self._aggregates, aggregates]))
+
+        self._aggregates = aggregates
+        if aggregates.estimated_size() > self.memory_budget:
+            self.spill()
+
+    def spill(self) -> None:
+        """
+        Hashes the in-memory partial aggregates into the runs and releases them from memory.
+        """
+        if self._aggregates is None or self._aggregates.is_empty():
+            return
+
+        logger.debug(f"Spilling {self._aggregates.height} partial aggregates to '{self.spill_dir}'.")
+        partitions = partition_by_bucket(self._aggregates, self.num_partitions, salt=self.depth)
+        self._aggregates = None
+
+        helpers.execute_in_thread_pool(
+            fn=helpers.save_dataframe_to_fragment,
+            args_list=[
+                (partition, self._run_dir(bucket), f"{self.spill_count:06d}")
+                for bucket, partition in partitions.items()
+            ],
+        )
+        self._runs.update(partitions)
+        self.spill_count += 1
+
+    def _run_dir(self, bucket: int) -> Path:
+        return self.spill_dir / f"run{bucket:05d}"
+
+    def write_result(self, file: TextIO, lock: threading.Lock) -> None:
+        """
+        Writes the final aggregates (without headers) to the opened file.
+
+        Args:
+            file (TextIO): The opened result file.
+            lock (threading.Lock): The lock object to ensure thread safety when writing to the file.
+        """
+        if not self.has_spilled:
+            if self._aggregates is not None:
+                helpers.write_rows_to_an_opened_file(
+                    self._aggregates.write_csv(file=None, has_header=False), file, lock
+                )
+                self._aggregates = None
+            return
+
+        # Once something was spilled, the aggregates still in memory may share pairs with the runs.
+        self.spill()
+
+        for bucket in sorted(self._runs):
+            self._merge_run(self._run_dir(bucket), file, lock)
+
+    def _merge_run(self, run_dir: Path, file: TextIO, lock: threading.Lock) -> None:
+        if helpers.get_directory_size(run_dir) > self.memory_budget and self.depth < self.MAX_DEPTH:
+            # The pairs of this run may not fit in memory, re-partition it using a different hash function.
+            aggregator = ExternalHashAggregator(
+                run_dir / "split",
+                memory_budget=self.memory_budget,
+                num_partitions=self.num_partitions,
+                depth=self.depth + 1,
+            )
+            for fragment in sorted(run_dir.glob("*.arrow")):
+                aggregator.add(pl.read_ipc(fragment, memory_map=True))
+
+            aggregator.write_result(file, lock)
+
+        else:
+            query = sum_plays_by_song_and_date(helpers.scan_group_fragments(run_dir))
+            helpers.write_rows_to_an_opened_file(query.collect().write_csv(file=None, has_header=False), file, lock)
+
+        helpers.remove_tmp_dir_and_files(run_dir)
@@ -1,15 +1,36 @@
-import glob
+import os
+import resource
 import threading
+import time
 import traceback
 from pathlib import Path
-from typing import Any, Dict, Literal, Protocol, Set, Tuple
+from typing import Any, Dict, Iterator, List, Literal, Protocol, Tuple
 
-import pandas as pd
 import polars as pl
 
 import helpers
+from background_tasks.aggregation import (
+    ExternalHashAggregator,
+    collect_group_aggregates,
+    sum_plays_by_song_and_date,
+)
 from background_tasks.exceptions import ProcessingError
-from dtos import Task, TaskStatus
+from background_tasks.instrumentation import Instrumentation, profile_to_file
+from background_tasks.manifest import PartitionManifest
+from background_tasks.planning import plan_processing
+from background_tasks.progress import ProgressReporter
+from background_tasks.scheduling import AggregationBatch, plan_aggregation_batches
+from background_tasks.splitting import PartitionSplitter, make_chunk_size_controller
+from dtos import (
+    ProcessingEngine,
+    ProcessingPlan,
+    ProcessingStage,
+    SplitCheckpoint,
+    StageMetrics,
+    Task,
+    TaskProgress,
+    TaskStatus,
+)
 from dtos.types import ErrorsDict
 from logger import get_logger
 
@@ -24,12 +45,50 @@ class TaskDAO(Protocol):
     def update_task(self, task: Task) -> Task:
         ...
 
+    def increment_completed_ranges(self, task_id: str) -> int:
+        ...
+
+    def start_attempt(self, task_id: str) -> Task:
+        ...
+
+    def save_checkpoint(self, task_id: str, checkpoint: SplitCheckpoint) -> None:
+        ...
+
+    def update_task_progress(self, task_id: str, progress: TaskProgress) -> None:
+        ...
+
 
 class CSVProcessor:
     """
     CSVProcessor class processes a CSV file by splitting it into multiple temporary files
     and generating a result file by executing queries on the temporary files.
 
+    With `engine=ProcessingEngine.EXTERNAL` the file is aggregated in a single pass instead, keeping the partial
+    aggregates in memory up to `memory_budget` bytes and spilling them to disk only when the budget is exceeded.
+    With `engine=ProcessingEngine.STREAMING` the whole job is a single lazy polars query run by the streaming engine.
+    With `engine=ProcessingEngine.IN_MEMORY` the whole file is read and aggregated in memory, and with
+    `engine=ProcessingEngine.AUTO` a planner chooses between IN_MEMORY (for files whose rows and aggregates are
+    estimated to fit in `in_memory_limit` bytes) and PARTITION, see `plan_processing`.
+    The engine set on the task itself, if any, takes precedence over the `engine` argument.
+
+    Large files can also be processed by many workers (see `plan_distributed_split`): every byte range of the input
+    is split by its own subtask (map) into the shared temporary directory, and a last subtask aggregates the
+    temporary groups into the result file (reduce).
+
+    With `checkpoint_interval > 0` the (single process) split stage is checkpointed every `checkpoint_interval` bytes
+    of input: the input offset, the chunks split and the partition manifest are recorded on the task. A worker dying
+    midway (e.g. killed for running out of memory) never runs `__exit__`, so the task stays IN_PROGRESS along with
+    its temporary files, and the next attempt (see `begin_attempt`) resumes the split from the last checkpoint.
+
+    The progress of every stage (bytes read, rows parsed, groups aggregated, throughput and ETA) is published to the
+    task at most once every `progress_interval` seconds, see `ProgressReporter`.
+
+    The wall and CPU time, the bytes in and out, the partitions and the peak RSS of every stage ("validate", "plan",
+    "split" and its "split_read", "split_partition" and "split_write" stages, "aggregate" and "output") are recorded
+    on the task once it is finished (see `Instrumentation`). The sub-stages of a split run by many processes are not
+    recorded. With a `profile_dir`, the task is profiled with cProfile as well and the stats are dumped to
+    `profile_dir/<task id>.pstats`.
+
     This class is meant to be used with the 'with' statement in order to clean tmp files and handle
     exceptions in the right way.
 
@@ -39,6 +98,13 @@ class CSVProcessor:
         >>> print('Temporary files and exceptions handled succesfully!')
     """
 
+    RESULT_FILE_HEADER = "Song,Date,Total Number of Plays for Date\n"
+    # Group directories are named after hexadecimal ids, so this directory can never clash with a group.
+    RESULT_PARTS_DIR = "result-parts"
+    # The manifest of each byte range of a distributed task, named after the first byte of the range.
+    RANGE_MANIFEST_FILE = "manifest-{start}.json"
+    MIN_BYTE_RANGE_SIZE = 64 * 1024**2
+
     def __init__(
         self,
         task_id: str,
@@ -46,30 +112,156 @@ class CSVProcessor:
         *,
         output_dir: Path | str,
         chunk_size: int | None = 2_000_000,
+        partitioning: Literal["song", "hash"] = "song",
+        num_buckets: int = 64,
+        engine: ProcessingEngine | str = ProcessingEngine.PARTITION,
+        memory_budget: int = 256 * 1024**2,
+        combine_chunks: bool = True,
+        split_workers: int = 1,
+        keep_tmp_files: bool = False,
+        chunk_memory_target: int | None = None,
+        memory_limit: int | None = None,
+        hot_group_size: int = 0,
+        num_sub_partitions: int = 16,
+        aggregation_batch_size: int = 8 * 1024**2,
+        in_memory_limit: int = 512 * 1024**2,
+        checkpoint_interval: int = 0,
+        max_attempts: int = 3,
+        progress_interval: float = 2.0,
+        profile_dir: Path | str | None = None,
     ):
+        if partitioning not in ("song", "hash"):
+            raise ValueError(f"'partitioning' must be 'song' or 'hash', got {partitioning!r}.")
+
+        if num_buckets < 1:
+            raise ValueError(f"'num_buckets' must be a positive integer, got {num_buckets}.")
+
+        if num_sub_partitions < 1:
+            raise ValueError(f"'num_sub_partitions' must be a positive integer, got {num_sub_partitions}.")
+
         self.dao = dao
         self.task = self.dao.get_task(task_id)
         self.output_dir = output_dir if isinstance(output_dir, Path) else Path(output_dir).resolve()
         self.chunk_size = chunk_size
+        self.partitioning = partitioning
+        self.num_buckets = num_buckets
+        self.engine = ProcessingEngine(self.task.engine or engine)
+        self.memory_budget = memory_budget
+        self.combine_chunks = combine_chunks
+        self.split_workers = split_workers
+        self.keep_tmp_files = keep_tmp_files
+        self.chunk_memory_target = chunk_memory_target
+        self.memory_limit = memory_limit
+        self.hot_group_size = hot_group_size
+        self.num_sub_partitions = num_sub_partitions
+        self.aggregation_batch_size = aggregation_batch_size
+        self.in_memory_limit = in_memory_limit
+        self.checkpoint_interval = checkpoint_interval
+        self.max_attempts = max_attempts
+        self.progress = ProgressReporter(
+            self.task.id, dao, total_bytes=self.get_input_size(), min_interval=progress_interval
+        )
+        self.metrics = Instrumentation()
+        self.profile_dir = Path(profile_dir) if profile_dir is not None else None
         self.__lock = threading.Lock()
         self.__tmp_dir = self.output_dir / f"{self.task.id}"
+        self.__byte_range: Tuple[int, int] | None = None
+        # The result part file of each pool thread (see `process_and_generate_result_file`).
+        self.__part_files: Dict[int, Path] = {}
         helpers.enforce_directory_creation(self.__tmp_dir)
 
     def execute(self):
         self.update_task(status=TaskStatus.IN_PROGRESS)
 
-        self.validate_task()
+        with self.metrics.measure("validate"):
+            self.validate_task()
+
+        start_time = time.perf_counter()
+        with profile_to_file(self.get_profile_file()):
+            result_file_path = self.process_task()
+        elapsed_time = time.perf_counter() - start_time
+        self.progress.finish()
+
+        # ru_maxrss is reported in kilobytes on Linux.
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        logger.info(
+            f"Task '{self.task.id}' processed by the {self.engine.value} engine in {elapsed_time:.3f} seconds "
+            f"(peak RSS of the worker process: {peak_rss_mb:.1f} MB)."
+        )
 
-        result_file_path = self.process_task()
+        self.update_task(status=TaskStatus.COMPLETED, output_file_path=result_file_path, metrics=self.metrics.stages)
 
-        self.update_task(status=TaskStatus.COMPLETED, output_file_path=result_file_path)
+    def get_rows_parsed(self) -> int | None:
+        """
+        Returns the rows of the input file parsed so far, None if the engine does not count them (the STREAMING
+        engine runs a single query, its rows are never seen).
+        """
+        if self.engine == ProcessingEngine.STREAMING:
+            return None
+
+        return self.progress.progress.rows_parsed
+
+    def get_profile_file(self) -> Path | None:
+        return self.profile_dir / f"{self.task.id}.pstats" if self.profile_dir is not None else None
+
+    def begin_attempt(self) -> bool:
+        """
+        Starts a new attempt at processing the task, discarding whatever a previous attempt wrote after its last
+        checkpoint.
+
+        A task whose message is delivered again (the worker died before acknowledging it) may already be finished,
+        or be in the hands of its distributed subtasks, then there is nothing to do.
+
+        Raises:
+            ProcessingError: If the task was already attempted `max_attempts` times (e.g. a file that always gets
+                the worker killed).
+
+        Returns:
+            bool: Whether the task must be processed.
+        """
+        if self.task.status in (TaskStatus.COMPLETED, TaskStatus.DOWNLOADED, TaskStatus.FAILED):
+            return False
+
+        if self.task.status == TaskStatus.IN_PROGRESS and self.task.distributed_ranges:
+            # The temporary files are shared with the subtasks.
+            self.keep_tmp_files = True
+            return False
+
+        self.task = self.dao.start_attempt(self.task.id)
+        if self.task.attempts > self.max_attempts:
+            raise ProcessingError(
+                errors={"error": f"The csv file could not be processed in {self.max_attempts} attempts."}
+            )
+
+        if self.task.attempts > 1:
+            logger.info(f"Task '{self.task.id}': attempt {self.task.attempts}, last checkpoint {self.task.checkpoint}.")
+
+        self.discard_uncommitted_files()
+        return True
+
+    def discard_uncommitted_files(self) -> None:
+        """
+        Deletes the temporary files not covered by the last checkpoint of the task: all of them without a checkpoint,
+        the fragments written after its offset otherwise. The partial results are always deleted.
+        """
+        checkpoint = self.task.checkpoint
+        if checkpoint is None:
+            helpers.remove_tmp_dir_and_files(self.__tmp_dir)
+            helpers.enforce_directory_creation(self.__tmp_dir)
+            return
+
+        if not checkpoint.completed:
+            discarded = self._make_splitter().discard_fragments(checkpoint.offset)
+            logger.debug(f"Task '{self.task.id}': {discarded} fragments written after the checkpoint discarded.")
+
+        helpers.remove_tmp_dir_and_files(self.__tmp_dir / self.RESULT_PARTS_DIR)
 
     def validate_task(self):
         errors = {}
         if self.task.input_file_path is None:
             errors["input_file"] = ["Cannot process a csv without the input file."]
 
-        elif not self.task.input_file_path.endswith(".csv"):
+        elif not self.task.input_file_path.lower().endswith(helpers.CSV_SUFFIXES):
             errors["input_file"] = ["File format not supported."]
 
         if errors:
@@ -82,75 +274,542 @@ class CSVProcessor:
         Returns:
             Path: The path to the result file.
         """
+        self.resolve_engine()
+
+        if self.engine == ProcessingEngine.IN_MEMORY:
+            return self.aggregate_in_memory()
+
+        if self.engine == ProcessingEngine.EXTERNAL:
+            return self.aggregate_within_memory_budget()
+
+        if self.engine == ProcessingEngine.STREAMING:
+            return self.aggregate_with_streaming_query()
+
         self.split_file_into_multiple_tmp_files_by_name()
         return self.process_and_generate_result_file()
 
-    def split_file_into_multiple_tmp_files_by_name(self) -> None:
+    def resolve_engine(self) -> ProcessingEngine:
+        """
+        Replaces the AUTO engine with the one chosen by the planner (see `plan_processing`), recording the plan on
+        the task. A task with a checkpoint is always resumed by the PARTITION engine.
+
+        Returns:
+            ProcessingEngine: The engine the task will be processed with.
+        """
+        if self.task.checkpoint is not None:
+            # A previous attempt checkpointed the split stage, it is resumed.
+            self.engine = ProcessingEngine.PARTITION
+
+        if self.engine == ProcessingEngine.STREAMING and self.is_input_compressed():
+            # polars cannot scan compressed files, the EXTERNAL engine reads them in chunks instead.
+            logger.info(f"Task '{self.task.id}': the STREAMING engine cannot read compressed files, using EXTERNAL.")
+            self.engine = ProcessingEngine.EXTERNAL
+
+        if self.engine == ProcessingEngine.AUTO:
+            self.progress.start_stage(ProcessingStage.PLANNING)
+            with self.metrics.measure("plan"):
+                plan = plan_processing(
+                    self.task.input_file_path,
+                    dtypes=self._get_dtypes(engine="polars"),
+                    in_memory_limit=self.in_memory_limit,
+                )
+            logger.info(f"Task '{self.task.id}': planned {plan}.")
+            self.engine = plan.engine
+            self.update_task(plan=plan)
+
+        return self.engine
+
+    def is_input_compressed(self) -> bool:
+        return helpers.get_compression(self.task.input_file_path) is not None
+
+    def get_input_size(self) -> int | None:
+        """
+        Returns the size of the input csv in bytes, None if it is unknown (no input file, or a compressed one).
+        """
+        if self.task.input_file_path is None or not os.path.exists(self.task.input_file_path):
+            return None
+
+        return None if self.is_input_compressed() else os.path.getsize(self.task.input_file_path)
+
+    def get_bytes_read(self) -> int:
+        """
+        Returns the bytes of csv read from the input file. A compressed file is counted decompressed (the offset
+        its reader reached), so its throughput compares with the one of an uncompressed file.
+        """
+        if self.is_input_compressed():
+            return self.progress.progress.bytes_read
+
+        return os.path.getsize(self.task.input_file_path)
+
+    def read_chunks(self) -> Iterator[pl.DataFrame]:
+        """
+        Reads the input file in chunks of (about) `chunk_size` rows.
+
+        Each chunk is parsed by the polars csv parser straight into a polars dataframe with the final dtypes,
+        there is no pandas dataframe (nor a conversion between the two) in between.
+
+        Yields:
+            pl.DataFrame: The next chunk of the input file.
+        """
+        reader = helpers.CSVChunkReader(
+            self.task.input_file_path,
+            dtypes=self._get_dtypes(engine="polars"),
+            chunk_size=self.chunk_size,
+            chunk_size_controller=make_chunk_size_controller(
+                self.chunk_size, self.chunk_memory_target, self.memory_limit
+            ),
+        )
+        for chunk in reader:
+            self.progress.advance(bytes_read=chunk.end, rows=chunk.dataframe.height)
+            yield chunk.dataframe
+
+    def split_file_into_multiple_tmp_files_by_name(self) -> PartitionManifest:
         """
         Splits the input file into multiple temporary files.
 
         This method reads the CSV file in chunks, converts it to a polars dataframe,
-        partitions the dataframe by "Song", and creates a temporary file for each partition.
+        partitions the dataframe and saves the chunk as a single Arrow IPC file holding one record batch per
+        partition, so there is no csv formatting/parsing between the stages.
+
+        With `partitioning="song"` there is one temporary group per "Song". With `partitioning="hash"`
+        each (Song, Date) pair is hashed into one of `num_buckets` groups, so the number of groups
+        stays the same whatever the number of distinct songs. Every (Song, Date) pair always lands
+        in the same bucket, so each bucket can still be aggregated on its own.
+
+        With `combine_chunks=True` each chunk is pre-aggregated by (Song, Date) before being partitioned, so a pair
+        repeated within a chunk is written (and read again in the next stage) only once.
+
+        With `split_workers > 1` the file is cut into byte ranges aligned on row boundaries (of at least
+        `MIN_BYTE_RANGE_SIZE` bytes) and each range is parsed and partitioned by its own process. Compressed files
+        cannot be cut, they are decompressed (on the fly) and split sequentially.
+
+        With `checkpoint_interval > 0` the sequential split is checkpointed (see `save_checkpoint`) and a split with
+        a checkpoint resumes from its offset, sequentially. The file is not split again at all once the checkpoint
+        is completed.
+
+        Every chunk is stored in a single file holding one record batch per group, and each group is listed in the
+        partition manifest (saved as `manifest.json`) with its record batches and its row and byte counts.
+
+        With `hot_group_size > 0` the rows of a group (e.g. a viral song) written after it reached
+        `hot_group_size` bytes are sub-partitioned by "Date" into `num_sub_partitions` record batches per chunk,
+        so no single group has to be aggregated at once in the next stage.
 
         Note:
-            This code has a bottleneck which is the tmp file per song, if one of these files are
-            larger than memory, the application may run out of memory while processing it in the next
-            processing stage.
+            In "song" mode without `hot_group_size` this code has a bottleneck which is the rows of each song,
+            if the rows of a song are larger than memory, the application may run out of memory while processing
+            it in the next processing stage.
+
+        Returns:
+            PartitionManifest: The manifest of the temporary groups.
         """
-        seen_groups: Set[str | Tuple[str, str]] = set()
+        checkpoint = self.task.checkpoint
+        if checkpoint is not None and checkpoint.completed:
+            logger.info(f"Task '{self.task.id}': the file was already split by a previous attempt.")
+            return PartitionManifest.load(self.__tmp_dir, checkpoint.manifest_file)
+
+        splitter = self._make_splitter()
+        self.progress.start_stage(ProcessingStage.SPLITTING, bytes_read=checkpoint.offset if checkpoint else 0)
+
+        with self.metrics.measure("split") as run:
+            byte_ranges = []
+            if checkpoint is None and not self.is_input_compressed():
+                byte_ranges = helpers.split_file_into_byte_ranges(
+                    self.task.input_file_path, self.split_workers, min_range_size=self.MIN_BYTE_RANGE_SIZE
+                )
+
+            if len(byte_ranges) > 1:
+                logger.debug(f"Splitting '{self.task.input_file_path}' with {len(byte_ranges)} processes.")
+                manifests = helpers.execute_in_process_pool(
+                    fn=splitter.split,
+                    args_list=[(self.task.input_file_path, start, end) for start, end in byte_ranges],
+                )
+                self.progress.advance(bytes_read=byte_ranges[-1][1])
 
-        # Read csv in chunks using pandas
-        for chunk in pd.read_csv(
-            self.task.input_file_path, chunksize=self.chunk_size, dtype=self._get_dtypes(engine="pandas")
-        ):
-            # Convert the pandas dataframe into polars dataframe since polars is faster and handles memory usage better.
-            dataframe = pl.from_pandas(chunk, schema_overrides=self._get_dtypes(engine="polars")).sort("Song")
+            else:
+                manifests = [self._split_from_checkpoint(splitter)]
 
-            # Remove the pandas dataframe chunk from memory since we are not going to use it anymore.
-            del chunk
+            manifest = self._save_manifest(manifests)
+            run.bytes_in += self.get_bytes_read()
+            run.partitions += len(manifest)
 
-            #
+        if (checkpoint := self.task.checkpoint) is not None:
+            self.save_checkpoint(checkpoint.offset, checkpoint.chunks, manifest, completed=True)
 
-            # Partitioning the dataframe by "Song" and create a temporary csv file for each "Song".
-            partitions = dataframe.partition_by("Song", as_dict=True, maintain_order=False)
+        return manifest
 
-            helpers.execute_in_thread_pool(
-                fn=helpers.save_dataframe_to_group_file,
-                args_list=[
-                    (group, dataframe, self.__tmp_dir, seen_groups, self.__lock)
-                    for group, dataframe in partitions.items()
-                ],
+    def _split_from_checkpoint(self, splitter: PartitionSplitter) -> PartitionManifest:
+        checkpoint = self.task.checkpoint
+        if checkpoint is None:
+            return splitter.split(
+                self.task.input_file_path,
+                on_checkpoint=self.save_checkpoint,
+                on_chunk=self._report_chunk,
+                metrics=self.metrics,
             )
 
-            # Avoid keeping things in memory
-            del partitions
+        logger.info(
+            f"Task '{self.task.id}': resuming the split from offset {checkpoint.offset} "
+            f"({checkpoint.chunks} chunks, {checkpoint.rows} rows already split)."
+        )
+        return splitter.split(
+            self.task.input_file_path,
+            checkpoint.offset,
+            manifest=PartitionManifest.load(self.__tmp_dir, checkpoint.manifest_file),
+            on_checkpoint=lambda offset, chunks, manifest: self.save_checkpoint(
+                offset, checkpoint.chunks + chunks, manifest
+            ),
+            on_chunk=self._report_chunk,
+            metrics=self.metrics,
+        )
+
+    def _report_chunk(self, offset: int, rows: int) -> None:
+        self.progress.advance(bytes_read=offset, rows=rows)
+
+    def save_checkpoint(
+        self, offset: int, chunks: int, manifest: PartitionManifest, completed: bool = False
+    ) -> SplitCheckpoint:
+        """
+        Records a checkpoint of the split stage on the task.
+
+        The manifest is saved next to the fragments first (in a file of its own, named after the offset), and only
+        then recorded on the task, so the checkpoint of the task always points to a complete manifest. The manifest
+        of the previous checkpoint is deleted afterwards. A partition manifest may list hundreds of thousands of
+        groups (one per song), more than a document can hold, which is why it is not embedded in the task.
+
+        Note:
+            The fragments are not synced to disk, a checkpoint survives the death of the worker process (the files
+            are in the page cache) but not a crash of the host.
+
+        Args:
+            offset (int): The offset of the input file up to which every row is split.
+            chunks (int): The number of chunks split up to the offset.
+            manifest (PartitionManifest): The groups written up to the offset.
+            completed (bool, optional): Whether the whole file is split. Defaults to False.
+
+        Returns:
+            SplitCheckpoint: The checkpoint.
+        """
+        manifest_file = PartitionManifest.FILE_NAME if completed else f"checkpoint-{offset:015d}.json"
+        manifest.save(manifest_file)
+
+        previous_checkpoint = self.task.checkpoint
+        self.task.checkpoint = SplitCheckpoint(
+            offset=offset, chunks=chunks, rows=manifest.rows, manifest_file=manifest_file, completed=completed
+        )
+        self.dao.save_checkpoint(self.task.id, self.task.checkpoint)
+        logger.debug(f"Task '{self.task.id}': checkpoint {self.task.checkpoint}.")
+
+        if previous_checkpoint is not None and previous_checkpoint.manifest_file != manifest_file:
+            (self.__tmp_dir / previous_checkpoint.manifest_file).unlink(missing_ok=True)
+
+        return self.task.checkpoint
+
+    def _save_manifest(self, manifests: List[PartitionManifest]) -> PartitionManifest:
+        manifest = PartitionManifest(self.__tmp_dir)
+        for range_manifest in manifests:
+            manifest.merge(range_manifest)
+
+        manifest.save()
+        return manifest
+
+    def _make_splitter(self) -> PartitionSplitter:
+        return PartitionSplitter(
+            self.__tmp_dir,
+            dtypes=self._get_dtypes(engine="polars"),
+            chunk_size=self.chunk_size,
+            partitioning=self.partitioning,
+            num_buckets=self.num_buckets,
+            combine_chunks=self.combine_chunks,
+            chunk_memory_target=self.chunk_memory_target,
+            memory_limit=self.memory_limit,
+            hot_group_size=self.hot_group_size,
+            num_sub_partitions=self.num_sub_partitions,
+            checkpoint_interval=self.checkpoint_interval,
+        )
+
+    def plan_distributed_split(self, range_size: int, max_ranges: int) -> List[Tuple[int, int]]:
+        """
+        Plans the byte ranges of the input file to be split by separate subtasks.
+
+        Only the PARTITION engine (chosen or planned) can be distributed, only uncompressed files can be cut into
+        byte ranges, and only files of at least two ranges are worth it.
+
+        Args:
+            range_size (int): The minimum size of each range in bytes, 0 disables the distributed mode.
+            max_ranges (int): The maximum number of ranges (subtasks).
+
+        Returns:
+            List[Tuple[int, int]]: The (start, end) byte ranges, or an empty list if the task should be processed
+                by a single worker.
+        """
+        if range_size <= 0 or self.engine not in (ProcessingEngine.PARTITION, ProcessingEngine.AUTO):
+            return []
+
+        self.validate_task()
+        if self.is_input_compressed() or self.resolve_engine() != ProcessingEngine.PARTITION:
+            return []
+
+        byte_ranges = helpers.split_file_into_byte_ranges(
+            self.task.input_file_path, max_ranges, min_range_size=range_size
+        )
+        return byte_ranges if len(byte_ranges) > 1 else []
+
+    def start_distributed_processing(self, num_ranges: int) -> None:
+        """
+        Marks the task as distributed in `num_ranges` byte ranges. The temporary files are kept from now on, since
+        they are shared with the subtasks.
+
+        Args:
+            num_ranges (int): The number of byte ranges (subtasks).
+        """
+        self.keep_tmp_files = True
+        self.task.distributed_ranges = num_ranges
+        self.update_task(status=TaskStatus.IN_PROGRESS)
+
+    def split_byte_range(self, start: int, end: int) -> str:
+        """
+        Splits the rows of a byte range of the input file into the shared temporary groups (map phase).
+
+        The fragments of the range left by a previous run of the subtask (delivered again after its worker died)
+        are deleted first. The manifest of the range is saved next to the groups rather than returned, since the
+        manifest of a file with many songs does not fit in a message of the result backend.
+
+        Args:
+            start (int): The first byte of the range.
+            end (int): The end (exclusive) of the range.
+
+        Returns:
+            str: The name of the manifest file of the byte range, inside the temporary directory of the task.
+        """
+        self.__byte_range = (start, end)
+        splitter = self._make_splitter()
+        splitter.discard_fragments(start, end)
+        manifest = splitter.split(self.task.input_file_path, start, end)
+        manifest_file = manifest.save(self.RANGE_MANIFEST_FILE.format(start=start))
+
+        completed_ranges = self.dao.increment_completed_ranges(self.task.id)
+        logger.debug(
+            f"Task '{self.task.id}': byte range [{start}, {end}) split ({manifest.rows} rows), "
+            f"{completed_ranges}/{self.task.distributed_ranges} ranges done."
+        )
+        return manifest_file.name
+
+    def generate_result_file_from_byte_ranges(self, manifest_files: List[str]) -> None:
+        """
+        Aggregates the temporary groups written by every byte range into the result file (reduce phase).
+
+        Args:
+            manifest_files (List[str]): The names of the manifest files of the byte ranges (see `split_byte_range`).
+
+        Raises:
+            ProcessingError: If not every byte range was split.
+        """
+        if self.task.status == TaskStatus.FAILED:
+            # A byte range failed and the task is already marked as failed, only the tmp files must go.
+            self.keep_tmp_files = False
+            return
+
+        if self.task.completed_ranges != self.task.distributed_ranges:
+            raise ProcessingError(
+                errors={
+                    "error": f"Only {self.task.completed_ranges} of {self.task.distributed_ranges} byte ranges "
+                    "of the csv file were processed."
+                }
+            )
+
+        self._save_manifest([PartitionManifest.load(self.__tmp_dir, manifest_file) for manifest_file in manifest_files])
+        with profile_to_file(self.get_profile_file()):
+            result_file_path = self.process_and_generate_result_file()
+        self.progress.finish()
+        self.update_task(status=TaskStatus.COMPLETED, output_file_path=result_file_path, metrics=self.metrics.stages)
 
     def process_and_generate_result_file(self) -> Path:
         """
         Processes the temporary files and generates the result file.
 
-        This method creates a query for each temporary file, executes the queries in parallel,
-        and appends the query results to the result file.
+        The temporary groups are read from the partition manifest and planned in batches, the heaviest first:
+        large groups on their own and small groups packed together in batches of up to `aggregation_batch_size`
+        bytes (see `plan_aggregation_batches`). A batch is only submitted to the shared thread pool once its
+        estimated memory fits in `memory_budget` next to the batches still running, so a few huge groups never
+        run at the same time. Each task collects the (Song, Date) sums of its batch and appends them to the part
+        file of its pool thread, so there are as many part files as threads, not one per batch, and no write lock
+        is needed. The result file is the header followed by the part files, concatenated by the kernel.
 
         Returns:
             Path: The path to the result file.
         """
-        queries = [
-            pl.scan_csv(file, dtypes=self._get_dtypes(engine="polars"))
-            .groupby("Song", "Date")
-            .agg(pl.sum("Number of Plays"))
-            for file in glob.glob(f"{self.__tmp_dir}/*.csv")
-        ]
+        manifest = PartitionManifest.load(self.__tmp_dir)
+        batches = plan_aggregation_batches(
+            manifest, num_sub_partitions=self.num_sub_partitions, batch_size=self.aggregation_batch_size
+        )
+        logger.debug(f"Task '{self.task.id}': aggregating {len(manifest)} groups in {len(batches)} batches.")
+        self.progress.start_stage(ProcessingStage.AGGREGATING, total_rows=manifest.rows, total_partitions=len(manifest))
 
-        output_file = helpers.make_output_file_path(output_dir=self.output_dir, file_name=self.task.id)
-        with open(output_file, "a") as f:
-            # Write the output csv headers
-            f.write("Song,Date,Total Number of Plays for Date\n")
+        # The part files are appended to, the ones of a previous run must go.
+        parts_dir = self.__tmp_dir / self.RESULT_PARTS_DIR
+        helpers.remove_tmp_dir_and_files(parts_dir)
+        parts_dir.mkdir()
+        self.__part_files = {}
 
+        with self.metrics.measure("aggregate"):
             helpers.execute_in_thread_pool(
-                helpers.write_rows_to_an_opened_file,
-                [(query.collect().write_csv(file=None, has_header=False), f, self.__lock) for query in queries],
+                self._write_batch_result,
+                [(manifest, batch, parts_dir) for batch in batches],
+                memory_budget=helpers.MemoryBudget(self.memory_budget),
+                weights=[batch.weight for batch in batches],
             )
+        part_files = sorted(self.__part_files.values())
+
+        output_file = helpers.make_output_file_path(output_dir=self.output_dir, file_name=self.task.id)
+        with self.metrics.measure("output") as run:
+            with open(output_file, "w") as f:
+                # Write the output csv headers
+                f.write(self.RESULT_FILE_HEADER)
+
+            helpers.append_files_to_file(part_files, output_file)
+            run.bytes_in += sum(os.path.getsize(part_file) for part_file in part_files)
+            run.bytes_out += os.path.getsize(output_file)
+
+        return output_file
+
+    def _get_part_file(self, parts_dir: Path) -> Path:
+        # One part file per pool thread, numbered in the order the threads first write to them.
+        with self.__lock:
+            thread_id = threading.get_ident()
+            if thread_id not in self.__part_files:
+                self.__part_files[thread_id] = parts_dir / f"{len(self.__part_files):06d}.csv"
+
+            return self.__part_files[thread_id]
+
+    def _write_batch_result(self, manifest: PartitionManifest, batch: AggregationBatch, parts_dir: Path) -> Path:
+        if len(batch.entries) == 1:
+            aggregates = collect_group_aggregates(manifest, batch.entries[0], self.num_sub_partitions)
+
+        else:
+            # The groups do not share any (Song, Date) pair, so they can be aggregated by a single query, reading
+            # each chunk file once for all of them.
+            rows = helpers.read_ipc_record_batches(manifest.get_fragments(batch.entries))
+            aggregates = iter([sum_plays_by_song_and_date(rows)])
+
+        part_file = self._get_part_file(parts_dir)
+        with open(part_file, "ab") as f:
+            start = f.tell()
+            for dataframe in aggregates:
+                dataframe.write_csv(f, has_header=False)
+            written = f.tell() - start
+
+        self.progress.advance(rows=sum(entry.rows for entry in batch.entries), partitions=len(batch.entries))
+        self.metrics.record(
+            "aggregate",
+            bytes_in=sum(entry.bytes for entry in batch.entries),
+            bytes_out=written,
+            partitions=len(batch.entries),
+        )
+        return part_file
+
+    def aggregate_within_memory_budget(self) -> Path:
+        """
+        Aggregates the input file in a single pass and generates the result file.
+
+        The partial aggregates are kept in memory while they fit in `memory_budget` bytes and are spilled to
+        hashed runs otherwise, so the memory used by the aggregation has a hard ceiling no matter how skewed
+        the input file is. Note that the chunk being read is not part of the budget, it is bounded by `chunk_size`.
+
+        Returns:
+            Path: The path to the result file.
+        """
+        self.progress.start_stage(ProcessingStage.READING)
+        aggregator = ExternalHashAggregator(
+            self.__tmp_dir,
+            memory_budget=self.memory_budget,
+            num_partitions=self.num_buckets,
+        )
+        with self.metrics.measure("aggregate") as run:
+            for dataframe in self.read_chunks():
+                aggregator.add(dataframe)
+
+            run.bytes_in += self.get_bytes_read()
+
+        output_file = helpers.make_output_file_path(output_dir=self.output_dir, file_name=self.task.id)
+        with self.metrics.measure("output") as run:
+            with open(output_file, "w") as f:
+                f.write(self.RESULT_FILE_HEADER)
+                aggregator.write_result(f, self.__lock)
+
+            run.bytes_out += os.path.getsize(output_file)
+
+        return output_file
+
+    def aggregate_in_memory(self) -> Path:
+        """
+        Reads and aggregates the whole input file in memory and generates the result file.
+
+        The file is parsed by the multithreaded polars csv reader and aggregated in a single pass, no temporary file
+        is written at all. It is only meant for files whose rows (and aggregates) fit in memory. Compressed files are
+        decompressed on the fly and aggregated chunk by chunk instead.
+
+        Returns:
+            Path: The path to the result file.
+        """
+        self.progress.start_stage(ProcessingStage.READING)
+        with self.metrics.measure("aggregate") as run:
+            if self.is_input_compressed():
+                dataframe = sum_plays_by_song_and_date(
+                    pl.concat([sum_plays_by_song_and_date(chunk) for chunk in self.read_chunks()])
+                )
+
+            else:
+                query = sum_plays_by_song_and_date(
+                    pl.scan_csv(self.task.input_file_path, dtypes=self._get_dtypes(engine="polars")),
+                    count_column="Rows",
+                )
+                dataframe = query.collect()
+                self.progress.advance(
+                    bytes_read=os.path.getsize(self.task.input_file_path), rows=dataframe["Rows"].sum()
+                )
+                dataframe = dataframe.drop("Rows")
+
+            run.bytes_in += self.get_bytes_read()
+
+        output_file = helpers.make_output_file_path(output_dir=self.output_dir, file_name=self.task.id)
+        with self.metrics.measure("output") as run:
+            with open(output_file, "wb") as f:
+                f.write(self.RESULT_FILE_HEADER.encode())
+                dataframe.write_csv(f, has_header=False)
+
+            run.bytes_out += os.path.getsize(output_file)
+
+        return output_file
+
+    def aggregate_with_streaming_query(self) -> Path:
+        """
+        Aggregates the input file with a single lazy polars query and generates the result file.
+
+        The query (scan -> group by -> sum) is executed by the polars streaming engine and sunk into an Arrow IPC
+        file, since polars cannot sink to csv. That file is then appended to the result file one record batch at
+        a time, so neither the input nor the result have to fit in memory.
+
+        Returns:
+            Path: The path to the result file.
+        """
+        self.progress.start_stage(ProcessingStage.AGGREGATING)
+        query = sum_plays_by_song_and_date(
+            pl.scan_csv(self.task.input_file_path, dtypes=self._get_dtypes(engine="polars"))
+        )
+        ipc_file = self.__tmp_dir / "result.arrow"
+        with self.metrics.measure("aggregate") as run:
+            query.sink_ipc(ipc_file, compression=None)
+            run.bytes_in += self.get_bytes_read()
+            run.bytes_out += ipc_file.stat().st_size
+
+        output_file = helpers.make_output_file_path(output_dir=self.output_dir, file_name=self.task.id)
+        with self.metrics.measure("output") as run:
+            with open(output_file, "w") as f:
+                f.write(self.RESULT_FILE_HEADER)
+                helpers.append_ipc_file_to_csv_file(ipc_file, f, self.__lock)
+
+            run.bytes_in += ipc_file.stat().st_size
+            run.bytes_out += os.path.getsize(output_file)
 
         return output_file
 
@@ -159,6 +818,8 @@ class CSVProcessor:
         status: TaskStatus | None = None,
         output_file_path: Path | str | None = None,
         errors: ErrorsDict | None = None,
+        plan: ProcessingPlan | None = None,
+        metrics: Dict[str, StageMetrics] | None = None,
     ) -> None:
         """
         Updates the task with the provided parameters.
@@ -167,8 +828,10 @@ class CSVProcessor:
             status (TaskStatus | None, optional): The status of the task. Defaults to None.
             output_file_path (Path | str | None, optional): The path to the output file. Defaults to None.
             errors (ErrorsDict | None, optional): The dictionary containing error messages. Defaults to None.
+            plan (ProcessingPlan | None, optional): The plan chosen for the AUTO engine. Defaults to None.
+            metrics (Dict[str, StageMetrics] | None, optional): The metrics of the stages. Defaults to None.
         """
-        task_has_changes = status is not None or output_file_path is not None or errors is not None
+        task_has_changes = any(value is not None for value in (status, output_file_path, errors, plan, metrics))
         if task_has_changes:
             if status:
                 self.task.status = status
@@ -183,6 +846,12 @@ class CSVProcessor:
                 else:
                     self.task.errors.update(errors)
 
+            if plan:
+                self.task.plan = plan
+
+            if metrics:
+                self.task.metrics = metrics
+
             self.task = self.dao.update_task(self.task)
 
     @staticmethod
@@ -217,15 +886,20 @@ class CSVProcessor:
 
     def __exit__(self, exc, exc_val, exc_tb):
         if exc is not None:
-            if isinstance(exc, ProcessingError):
-                errors = exc.errors
+            if isinstance(exc_val, ProcessingError):
+                errors = exc_val.errors
 
             else:
                 logger.error(f"{exc_val}. For more information, check the DEBUG level log.")
                 logger.debug(traceback.format_exc())
                 errors = {"error": "Something went wrong while processing the csv file."}
 
-            self.update_task(status=TaskStatus.FAILED, errors=errors)
+            self.update_task(status=TaskStatus.FAILED, errors=errors, metrics=self.metrics.stages)
 
-        helpers.remove_tmp_dir_and_files(self.__tmp_dir)
+        if exc is not None and self.__byte_range is not None:
+            # The temporary files are shared with the other byte ranges, a failed one only discards its own
+            # fragments. The reduce deletes the rest once it finds the task failed.
+            self._make_splitter().discard_fragments(*self.__byte_range)
+        elif exc is not None or not self.keep_tmp_files:
+            helpers.remove_tmp_dir_and_files(self.__tmp_dir)
         return True
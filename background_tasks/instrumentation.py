@@ -0,0 +1,109 @@
+import cProfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator
+
+import helpers
+from dtos import StageMetrics
+
+
+class Instrumentation:
+    """
+    Records the timing and memory metrics of the stages of a task (see `StageMetrics`), keyed by stage name.
+
+    A stage may be measured many times, e.g. once per chunk, and by many threads at once: the wall and CPU times, the
+    bytes and the partitions of its runs add up, and its peak RSS is the highest RSS sampled at the end of a run.
+    Stages running sequentially are measured with the CPU time of the whole process (polars threads included),
+    stages running next to others (`threaded=True`) with the CPU time of the thread running them only.
+
+    The RSS is sampled rather than traced (e.g. with tracemalloc) because the rows live in Arrow buffers allocated by
+    polars, which tracemalloc does not see.
+
+    Example:
+        >>> metrics = Instrumentation()
+        >>> with metrics.measure("split_write", threaded=True) as run:
+        ...     fragment_path = save_dataframe_to_fragment(dataframe, directory, fragment)
+        ...     run.bytes_out += fragment_path.stat().st_size
+        >>> metrics.stages["split_write"].wall_time
+        0.012
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, StageMetrics] = {}
+
+    @property
+    def stages(self) -> Dict[str, StageMetrics]:
+        with self._lock:
+            return {name: stage.copy() for name, stage in self._stages.items()}
+
+    @contextmanager
+    def measure(self, stage: str, *, threaded: bool = False) -> Iterator[StageMetrics]:
+        """
+        Measures a run of a stage. The counters (bytes, partitions) set on the yielded metrics are added to the stage.
+
+        Args:
+            stage (str): The name of the stage.
+            threaded (bool, optional): Whether to count the CPU time of the calling thread only. Defaults to False.
+
+        Yields:
+            StageMetrics: The metrics of the run.
+        """
+        cpu_clock = time.thread_time if threaded else time.process_time
+        run = StageMetrics()
+        start_wall, start_cpu = time.perf_counter(), cpu_clock()
+        try:
+            yield run
+        finally:
+            run.wall_time = time.perf_counter() - start_wall
+            run.cpu_time = cpu_clock() - start_cpu
+            run.runs = 1
+            self._add(stage, run)
+
+    def record(self, stage: str, *, bytes_in: int = 0, bytes_out: int = 0, partitions: int = 0) -> None:
+        """
+        Adds counters to a stage outside of a run (e.g. for each batch of a stage measured as a whole), sampling the
+        RSS as well.
+        """
+        self._add(stage, StageMetrics(bytes_in=bytes_in, bytes_out=bytes_out, partitions=partitions))
+
+    def _add(self, stage: str, run: StageMetrics) -> None:
+        rss = helpers.get_rss_bytes()
+        with self._lock:
+            metrics = self._stages.setdefault(stage, StageMetrics())
+            metrics.wall_time += run.wall_time
+            metrics.cpu_time += run.cpu_time
+            metrics.runs += run.runs
+            metrics.bytes_in += run.bytes_in
+            metrics.bytes_out += run.bytes_out
+            metrics.partitions += run.partitions
+            if rss is not None:
+                metrics.peak_rss = max(metrics.peak_rss or 0, rss)
+
+
+@contextmanager
+def profile_to_file(dump_file: Path | None) -> Iterator[None]:
+    """
+    Profiles the calling thread with cProfile and dumps the stats to `dump_file` (read them with `python -m pstats`).
+    Nothing is profiled without a file.
+
+    Note:
+        Only the calling thread is profiled: the work of the thread pools shows up as the time spent waiting for it.
+
+    Args:
+        dump_file (Path | None): The pstats file.
+    """
+    if dump_file is None:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        dump_file.parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(dump_file)
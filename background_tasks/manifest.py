@@ -0,0 +1,174 @@
+import json
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+# A record batch holding rows of a group: the offset of the chunk that wrote it (naming the chunk file), the index of
+# the record batch in the chunk file and the sub-partition of its rows (None for the rows of the group itself).
+Fragment = Tuple[int, int, int | None]
+
+
+@dataclass
+class PartitionEntry:
+    # The group as partitioned (e.g. the song name).
+    group: str
+    # Rows and (in memory) bytes written to the group, its sub-partitions included.
+    rows: int = 0
+    bytes: int = 0
+    # Sub-partitions (by the hash of "Date") of a hot group, see `PartitionSplitter`.
+    sub_partitions: List[int] = field(default_factory=list)
+    # The record batches holding the rows of the group, in the order they were written.
+    fragments: List[Fragment] = field(default_factory=list)
+
+
+class PartitionManifest:
+    """
+    Index of the partition groups written to a temporary directory.
+
+    Every chunk split is saved as a single Arrow IPC file named after the offset of the chunk, holding one record
+    batch per group (or sub-partition of a hot group) of the chunk. The manifest maps each group to its record
+    batches (see `Fragment`) along with its row and byte counts, so the aggregation stage reads it instead of
+    listing files, and can use the stats to schedule the groups. The number of files grows with the chunks, not
+    with the groups times the chunks.
+
+    Manifests built by different workers (e.g. one per byte range) are combined with `merge`.
+
+    Example:
+        >>> manifest = PartitionManifest(tmp_dir)
+        >>> manifest.record("AC/DC", rows=10, size=120, fragment=(0, 3))
+        >>> manifest.save()
+        >>> PartitionManifest.load(tmp_dir).get_fragments([manifest.entries["AC/DC"]])
+        [(PosixPath('/tmp/task/000000000000000.arrow'), 3)]
+    """
+
+    FILE_NAME = "manifest.json"
+
+    def __init__(self, base_dir: Path, entries: Dict[str, PartitionEntry] | None = None):
+        self.base_dir = base_dir
+        self.entries: Dict[str, PartitionEntry] = entries or {}
+
+    def chunk_file(self, offset: int) -> Path:
+        return self.base_dir / f"{offset:015d}.arrow"
+
+    def get_group_size(self, group: Any) -> int:
+        entry = self.entries.get(str(group))
+        return entry.bytes if entry is not None else 0
+
+    def get_fragments(
+        self, entries: Iterable[PartitionEntry], sub_partition: int | None = None
+    ) -> List[Tuple[Path, int]]:
+        """
+        Returns the chunk files and record batch indexes holding the rows of the groups, either the rows of the
+        groups themselves or the ones of one of their sub-partitions.
+
+        Args:
+            entries (Iterable[PartitionEntry]): The groups.
+            sub_partition (int | None, optional): The sub-partition. Defaults to None.
+
+        Returns:
+            List[Tuple[Path, int]]: The chunk files and the indexes of their record batches.
+        """
+        return [
+            (self.chunk_file(offset), batch_index)
+            for entry in entries
+            for offset, batch_index, fragment_sub_partition in entry.fragments
+            if fragment_sub_partition == sub_partition
+        ]
+
+    def record(
+        self, group: Any, *, rows: int, size: int, fragment: Tuple[int, int], sub_partition: int | None = None
+    ) -> None:
+        """
+        Records rows written to a group (or to one of its sub-partitions).
+
+        Args:
+            group (Any): The group, its string representation is the key of the manifest.
+            rows (int): The number of rows written.
+            size (int): The size of the rows written, in bytes.
+            fragment (Tuple[int, int]): The offset of the chunk file and the index of the record batch the rows
+                were written to.
+            sub_partition (int | None, optional): The sub-partition the rows were written to. Defaults to None.
+        """
+        group = str(group)
+        entry = self.entries.get(group)
+        if entry is None:
+            entry = self.entries[group] = PartitionEntry(group=group)
+
+        entry.rows += rows
+        entry.bytes += size
+        entry.fragments.append((*fragment, sub_partition))
+        if sub_partition is not None and sub_partition not in entry.sub_partitions:
+            entry.sub_partitions.append(sub_partition)
+            entry.sub_partitions.sort()
+
+    def merge(self, other: "PartitionManifest") -> None:
+        """
+        Adds the groups (and counts) of another manifest of the same directory to this one.
+
+        Args:
+            other (PartitionManifest): The manifest to be merged.
+        """
+        for group, other_entry in other.entries.items():
+            entry = self.entries.get(group)
+            if entry is None:
+                self.entries[group] = PartitionEntry(**asdict(other_entry))
+                continue
+
+            entry.rows += other_entry.rows
+            entry.bytes += other_entry.bytes
+            entry.fragments += other_entry.fragments
+            entry.sub_partitions = sorted(set(entry.sub_partitions) | set(other_entry.sub_partitions))
+
+    def __iter__(self) -> Iterator[PartitionEntry]:
+        return iter(self.entries.values())
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def rows(self) -> int:
+        return sum(entry.rows for entry in self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"entries": [asdict(entry) for entry in self]}
+
+    @classmethod
+    def from_dict(cls, base_dir: Path, data: Dict[str, Any]) -> "PartitionManifest":
+        entries = [
+            PartitionEntry(**{**entry, "fragments": [tuple(fragment) for fragment in entry["fragments"]]})
+            for entry in data["entries"]
+        ]
+        return cls(base_dir, {entry.group: entry for entry in entries})
+
+    def save(self, file_name: str = FILE_NAME) -> Path:
+        """
+        Saves the manifest as `file_name` (`manifest.json` by default) inside its directory.
+
+        Args:
+            file_name (str, optional): The name of the manifest file, e.g. the one of a checkpoint.
+
+        Returns:
+            Path: The path to the manifest file.
+        """
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        manifest_file = self.base_dir / file_name
+        manifest_file.write_text(json.dumps(self.to_dict()))
+        return manifest_file
+
+    @classmethod
+    def load(cls, base_dir: Path, file_name: str = FILE_NAME) -> "PartitionManifest":
+        """
+        Loads the manifest saved inside the directory, an empty one if there is none.
+
+        Args:
+            base_dir (Path): The directory of the manifest.
+            file_name (str, optional): The name of the manifest file. Defaults to `manifest.json`.
+
+        Returns:
+            PartitionManifest: The manifest.
+        """
+        manifest_file = base_dir / file_name
+        if not manifest_file.exists():
+            return cls(base_dir)
+
+        return cls.from_dict(base_dir, json.loads(manifest_file.read_text()))
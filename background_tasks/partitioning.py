@@ -0,0 +1,56 @@
+from typing import Dict, Sequence, Tuple
+
+import polars as pl
+
+# Fixed seeds so the bucket of a given (Song, Date) pair is the same for every chunk, thread and process.
+BUCKET_HASH_SEEDS: Tuple[int, int, int, int] = (0x5EED, 0xB0C, 0xCE7, 0x5)
+
+
+def bucket_expression(num_buckets: int, salt: int = 0, columns: Sequence[str] = ("Song", "Date")) -> pl.Expr:
+    """
+    Builds the expression that assigns each (Song, Date) pair to one of `num_buckets` buckets.
+
+    The string values (and not the categorical physical codes) are hashed, this way the bucket of a given
+    (Song, Date) pair does not depend on the string cache of the process that computed it.
+
+    Args:
+        num_buckets (int): The number of buckets.
+        salt (int, optional): Changes the hash function, use it to re-partition the rows of a single bucket.
+            Defaults to 0.
+        columns (Sequence[str], optional): The hashed columns. Defaults to ("Song", "Date").
+
+    Returns:
+        pl.Expr: An UInt64 expression with values in the range [0, num_buckets).
+    """
+    seed, *more_seeds = BUCKET_HASH_SEEDS
+    return pl.struct([pl.col(column).cast(pl.Utf8) for column in columns]).hash(seed + salt, *more_seeds) % pl.lit(
+        num_buckets, dtype=pl.UInt64
+    )
+
+
+def partition_by_bucket(
+    dataframe: pl.DataFrame, num_buckets: int, salt: int = 0, columns: Sequence[str] = ("Song", "Date")
+) -> Dict[int, pl.DataFrame]:
+    """
+    Partitions the dataframe by hashing each (Song, Date) pair into one of `num_buckets` buckets.
+
+    Args:
+        dataframe (pl.DataFrame): The dataframe to be partitioned.
+        num_buckets (int): The number of buckets.
+        salt (int, optional): Changes the hash function. Defaults to 0.
+        columns (Sequence[str], optional): The hashed columns, e.g. ("Date",) to split the rows of a single song.
+            Defaults to ("Song", "Date").
+
+    Returns:
+        Dict[int, pl.DataFrame]: The non-empty partitions keyed by their bucket number.
+
+    Example:
+        >>> partitions = partition_by_bucket(df, num_buckets=64)
+        >>> sorted(partitions)
+        [0, 1, 3, ..., 63]
+    """
+    bucket_column = "__bucket"
+    partitions = dataframe.with_columns(
+        bucket_expression(num_buckets, salt, columns).alias(bucket_column)
+    ).partition_by(bucket_column, as_dict=True, maintain_order=False)
+    return {bucket: partition.drop(bucket_column) for bucket, partition in partitions.items()}
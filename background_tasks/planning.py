@@ -0,0 +1,80 @@
+import math
+import os
+from pathlib import Path
+from typing import Any, Dict
+
+import polars as pl
+
+import helpers
+from dtos import ProcessingEngine, ProcessingPlan
+
+# Rows of the first chunk used to estimate the shape of the whole file.
+SAMPLE_ROWS = 100_000
+# Compressed files are assumed to be this many times smaller than their csv, the higher end of the usual ratios.
+ASSUMED_COMPRESSION_RATIO = 10
+
+
+def estimate_csv_size(file_path: Path | str) -> int:
+    """
+    Returns the size of the csv of the file in bytes: the size of the file, times `ASSUMED_COMPRESSION_RATIO` for a
+    compressed file (its csv size is unknown until it is decompressed).
+    """
+    file_size = os.path.getsize(file_path)
+    return file_size * ASSUMED_COMPRESSION_RATIO if helpers.get_compression(file_path) else file_size
+
+
+def plan_processing(file_path: Path | str, *, dtypes: Dict[str, Any], in_memory_limit: int) -> ProcessingPlan:
+    """
+    Chooses the engine of the AUTO mode from the file size and a sample of its first rows.
+
+    The number of distinct (Song, Date) pairs of the sample is estimated with a HyperLogLog sketch (polars
+    `approx_unique`) over the hash of the pairs, and extrapolated linearly to the estimated number of rows of the
+    whole file, which is an upper bound as long as the sample is representative. The file is aggregated in memory
+    when the whole parsed file plus its aggregates are estimated to fit in `in_memory_limit` bytes, otherwise it is
+    split into partition files first, so the split-to-disk-then-rescan path is only paid for files that need it.
+    The size of compressed files is multiplied by `ASSUMED_COMPRESSION_RATIO`, since their csv size is unknown.
+
+    Args:
+        file_path (Path | str): The csv file.
+        dtypes (Dict[str, Any]): The polars dtypes of the columns.
+        in_memory_limit (int): The most memory (in bytes) the in-memory aggregation may use, 0 disables it.
+
+    Returns:
+        ProcessingPlan: The chosen engine and the estimates it was chosen from.
+
+    Example:
+        >>> plan_processing("input.csv", dtypes=dtypes, in_memory_limit=1024**3).engine
+        <ProcessingEngine.IN_MEMORY: 'IN_MEMORY'>
+    """
+    file_size = os.path.getsize(file_path)
+    csv_size = estimate_csv_size(file_path)
+    reader = helpers.CSVChunkReader(file_path, dtypes=dtypes, chunk_size=SAMPLE_ROWS)
+    sample = next(iter(reader), None)
+
+    if sample is None or sample.dataframe.height == 0:
+        return ProcessingPlan(
+            engine=ProcessingEngine.IN_MEMORY,
+            file_size=file_size,
+            estimated_rows=0,
+            estimated_groups=0,
+            estimated_memory=0,
+        )
+
+    dataframe = sample.dataframe
+    estimated_rows = max(math.ceil(dataframe.height * (csv_size - sample.start) / (sample.end - sample.start)), 1)
+
+    sample_groups = dataframe.select(pl.struct("Song", "Date").hash().approx_unique()).item()
+    estimated_groups = min(math.ceil(sample_groups * estimated_rows / dataframe.height), estimated_rows)
+
+    # Categoricals would be sized with the whole (global) string cache, the strings are sized instead.
+    row_size = dataframe.with_columns(pl.col(pl.Categorical).cast(pl.Utf8)).estimated_size() / dataframe.height
+    estimated_memory = int((estimated_rows + estimated_groups) * row_size)
+
+    engine = ProcessingEngine.IN_MEMORY if estimated_memory <= in_memory_limit else ProcessingEngine.PARTITION
+    return ProcessingPlan(
+        engine=engine,
+        file_size=file_size,
+        estimated_rows=estimated_rows,
+        estimated_groups=estimated_groups,
+        estimated_memory=estimated_memory,
+    )
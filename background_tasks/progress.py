@@ -0,0 +1,139 @@
+import threading
+import time
+from typing import Callable, Protocol
+
+from dtos import ProcessingStage, TaskProgress
+
+# Stages whose progress is measured in bytes of the input file, the others in rows of the partition manifest.
+READING_STAGES = (ProcessingStage.READING, ProcessingStage.SPLITTING)
+
+
+class ProgressDAO(Protocol):
+    def update_task_progress(self, task_id: str, progress: TaskProgress) -> None:
+        ...
+
+
+class ProgressReporter:
+    """
+    Keeps the progress of a task and publishes it to the task, at most once every `min_interval` seconds.
+
+    Progress is reported from the hot loops of the stages (every chunk read, every batch of groups aggregated),
+    possibly by many threads at once, while clients polling the status endpoint only need a fresh value every few
+    seconds. A write is only issued when a stage starts or ends, or when `min_interval` seconds went by since the last
+    one, so a task never issues more than one write every `min_interval` seconds, whatever the number of chunks.
+
+    The throughput is the number of rows processed per second since the start of the current stage. The ETA is the
+    remaining time of the current stage: extrapolated from the bytes read for the stages reading the input file (if
+    its size is known), from the rows aggregated otherwise.
+
+    Example:
+        >>> progress = ProgressReporter(task_id, dao, total_bytes=os.path.getsize(file_path))
+        >>> progress.start_stage(ProcessingStage.SPLITTING)
+        >>> progress.advance(bytes_read=chunk.end, rows=chunk.dataframe.height)
+    """
+
+    def __init__(
+        self,
+        task_id: str,
+        dao: ProgressDAO,
+        *,
+        total_bytes: int | None = None,
+        min_interval: float = 2.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.task_id = task_id
+        self.dao = dao
+        self.min_interval = min_interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._progress = TaskProgress(stage=ProcessingStage.PLANNING, total_bytes=total_bytes)
+        self._stage_started = self._last_published = clock()
+        self._stage_bytes = self._stage_rows = 0
+        self._stage_total_rows: int | None = None
+
+    @property
+    def progress(self) -> TaskProgress:
+        with self._lock:
+            return self._snapshot(self.clock())
+
+    def start_stage(
+        self,
+        stage: ProcessingStage,
+        *,
+        bytes_read: int | None = None,
+        total_rows: int | None = None,
+        total_partitions: int | None = None,
+    ) -> None:
+        """
+        Starts a stage, publishing the progress right away.
+
+        Args:
+            stage (ProcessingStage): The stage.
+            bytes_read (int | None, optional): Bytes of the input already read, e.g. when resuming from a checkpoint.
+            total_rows (int | None, optional): The rows the stage will process, if known.
+            total_partitions (int | None, optional): The partition groups the stage will aggregate, if any.
+        """
+        with self._lock:
+            self._progress.stage = stage
+            if bytes_read is not None:
+                self._progress.bytes_read = bytes_read
+
+            if total_partitions is not None:
+                self._progress.total_partitions = total_partitions
+
+            self._stage_started = self.clock()
+            self._stage_bytes, self._stage_rows = self._progress.bytes_read, 0
+            self._stage_total_rows = total_rows
+            self._publish(force=True)
+
+    def advance(self, *, bytes_read: int | None = None, rows: int = 0, partitions: int = 0) -> None:
+        """
+        Records the work done, publishing the progress if the last write is older than `min_interval` seconds.
+
+        Args:
+            bytes_read (int | None, optional): The offset of the input file read so far.
+            rows (int, optional): The rows parsed (reading stages) or aggregated since the last call.
+            partitions (int, optional): The partition groups aggregated since the last call.
+        """
+        with self._lock:
+            if bytes_read is not None:
+                self._progress.bytes_read = bytes_read
+
+            if self._progress.stage in READING_STAGES:
+                self._progress.rows_parsed += rows
+
+            self._stage_rows += rows
+            self._progress.partitions_aggregated += partitions
+            self._publish(force=False)
+
+    def finish(self) -> None:
+        self.start_stage(ProcessingStage.DONE)
+
+    def _publish(self, force: bool) -> None:
+        now = self.clock()
+        if not force and now - self._last_published < self.min_interval:
+            return
+
+        self._last_published = now
+        self.dao.update_task_progress(self.task_id, self._snapshot(now))
+
+    def _snapshot(self, now: float) -> TaskProgress:
+        progress = self._progress.copy()
+        elapsed = now - self._stage_started
+        if progress.stage == ProcessingStage.DONE:
+            progress.throughput, progress.eta = None, 0.0
+            return progress
+
+        progress.throughput = self._stage_rows / elapsed if elapsed > 0 and self._stage_rows else None
+
+        stage_bytes = progress.bytes_read - self._stage_bytes
+        if progress.stage in READING_STAGES and progress.total_bytes and stage_bytes > 0:
+            progress.eta = max(progress.total_bytes - progress.bytes_read, 0) * elapsed / stage_bytes
+
+        elif progress.stage not in READING_STAGES and self._stage_total_rows and self._stage_rows:
+            progress.eta = max(self._stage_total_rows - self._stage_rows, 0) * elapsed / self._stage_rows
+
+        else:
+            progress.eta = None
+
+        return progress
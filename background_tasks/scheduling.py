@@ -0,0 +1,76 @@
+from typing import Iterable, List, NamedTuple
+
+from background_tasks.manifest import PartitionEntry
+
+# Every fragment of a batch is memory-mapped by the same query, this bounds the number of maps of a single query.
+MAX_GROUPS_PER_BATCH = 1024
+
+
+class AggregationBatch(NamedTuple):
+    entries: List[PartitionEntry]
+    # The memory expected to be used while aggregating the batch, in bytes.
+    weight: int
+
+
+def group_weight(entry: PartitionEntry, num_sub_partitions: int) -> int:
+    """
+    Estimates the memory used to aggregate a group, in bytes.
+
+    Args:
+        entry (PartitionEntry): The group.
+        num_sub_partitions (int): The number of sub-partitions of hot groups.
+
+    Returns:
+        int: The estimated memory, the in-memory size of its rows (or of a single sub-partition for a hot group,
+            since those are aggregated one sub-partition at a time).
+    """
+    if entry.sub_partitions:
+        return entry.bytes // num_sub_partitions
+
+    return entry.bytes
+
+
+def plan_aggregation_batches(
+    entries: Iterable[PartitionEntry], *, num_sub_partitions: int, batch_size: int
+) -> List[AggregationBatch]:
+    """
+    Plans the aggregation of the temporary groups, largest first.
+
+    Starting with the largest groups minimizes the time the stage takes (a huge group never starts last, when
+    every other thread is idle). Groups smaller than `batch_size` bytes are packed together in batches of up to
+    `batch_size` bytes (and `MAX_GROUPS_PER_BATCH` groups), aggregated by a single query, since the overhead of a
+    query (scan, plan, part file) is larger than its work for tiny groups. Hot groups are never batched.
+
+    Args:
+        entries (Iterable[PartitionEntry]): The groups of the partition manifest.
+        num_sub_partitions (int): The number of sub-partitions of hot groups.
+        batch_size (int): The maximum size of a batch of small groups in bytes, 0 disables the batching.
+
+    Returns:
+        List[AggregationBatch]: The batches, the heaviest first.
+
+    Example:
+        >>> [batch.weight for batch in plan_aggregation_batches(manifest, num_sub_partitions=16, batch_size=100)]
+        [5000, 1200, 100, 100, 40]
+    """
+    batches: List[AggregationBatch] = []
+    small_entries: List[PartitionEntry] = []
+    small_weight = 0
+
+    for entry in sorted(entries, key=lambda entry: group_weight(entry, num_sub_partitions), reverse=True):
+        weight = group_weight(entry, num_sub_partitions)
+        if entry.sub_partitions or weight >= batch_size:
+            batches.append(AggregationBatch([entry], weight))
+            continue
+
+        if small_entries and (small_weight + weight > batch_size or len(small_entries) == MAX_GROUPS_PER_BATCH):
+            batches.append(AggregationBatch(small_entries, small_weight))
+            small_entries, small_weight = [], 0
+
+        small_entries.append(entry)
+        small_weight += weight
+
+    if small_entries:
+        batches.append(AggregationBatch(small_entries, small_weight))
+
+    return batches
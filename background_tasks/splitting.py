@@ -0,0 +1,307 @@
+import concurrent.futures
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterator, List, Literal, Tuple
+
+import polars as pl
+
+import helpers
+from background_tasks.aggregation import sum_plays_by_song_and_date
+from background_tasks.instrumentation import Instrumentation
+from background_tasks.manifest import PartitionManifest
+from background_tasks.partitioning import partition_by_bucket
+
+# Called with the end offset and the number of rows of every chunk split.
+ChunkCallback = Callable[[int, int], None]
+# Called with the input offset up to which every fragment is written, the number of chunks split up to it (by this
+# split) and the manifest of the groups written so far.
+CheckpointCallback = Callable[[int, int, PartitionManifest], None]
+
+
+def make_chunk_size_controller(
+    chunk_size: int | None, chunk_memory_target: int | None, memory_limit: int | None
+) -> helpers.ChunkSizeController | None:
+    """
+    Builds the controller adapting `chunk_size` to `chunk_memory_target`, if there is a target (and chunks at all).
+    """
+    if not chunk_memory_target or chunk_size is None:
+        return None
+
+    return helpers.ChunkSizeController(chunk_size, memory_target=chunk_memory_target, memory_limit=memory_limit)
+
+
+class PartitionSplitter:
+    """
+    Splits a csv file (or a byte range of it) into the partition groups of `tmp_dir`.
+
+    Every chunk read is (optionally) pre-aggregated, partitioned and saved as a single Arrow IPC file (a chunk
+    file) named after the byte offset of the chunk, holding one record batch per partition. The record batches
+    of each group are listed in the manifest, so a chunk needs one file however many groups it has. Chunk file
+    names are unique across byte ranges, and since instances only hold plain settings they can be pickled, so
+    different processes can split different byte ranges of the same file into the same groups. Every split
+    returns the manifest of the groups it wrote (see `PartitionManifest`), the manifests of all the byte ranges
+    are merged afterwards.
+
+    The stages run as a bounded pipeline: the next chunks are read and parsed by a background thread (at most
+    `MAX_QUEUED_CHUNKS` ahead) while the current one is partitioned, and the chunk files are written by the shared
+    thread pool while the following chunks are processed. At most `MAX_PENDING_WRITES` chunks may be waiting to be
+    written, after that the partition stage waits for the oldest writes (backpressure), so the memory used stays
+    bounded.
+
+    The splitter keeps the size of every group it wrote. Once a group reaches `hot_group_size` bytes (0 disables
+    it), its following rows are sub-partitioned by the hash of their "Date" into `num_sub_partitions` record
+    batches per chunk, so a hot song does not end up in a single partition larger than memory while the
+    groups of the long tail stay coarse (see `collect_group_aggregates`).
+
+    With a `chunk_memory_target` (in bytes) the first chunk is read with `chunk_size` rows and the following ones
+    with as many rows as fit in the target, shrinking further when the RSS gets close to `memory_limit`.
+
+    With `checkpoint_interval > 0`, every time at least `checkpoint_interval` bytes of input were read since the last
+    checkpoint (and at the end of the split), the pending writes are drained and the `on_checkpoint` callback of the
+    split is called: every chunk up to that offset is then written and listed in the manifest, so a later split can
+    resume from it.
+
+    The stages of the split are measured into the `metrics` of the split, if any: "split_read" (reading and parsing
+    the chunks), "split_partition" and "split_write" (see `Instrumentation`).
+
+    Example:
+        >>> splitter = PartitionSplitter(tmp_dir, dtypes=dtypes, chunk_size=2_000_000, partitioning="hash")
+        >>> splitter.split("input.csv", start=0, end=1024**3)
+    """
+
+    MAX_QUEUED_CHUNKS = 1
+    MAX_PENDING_WRITES = 1
+
+    def __init__(
+        self,
+        tmp_dir: Path,
+        *,
+        dtypes: Dict[str, Any],
+        chunk_size: int | None,
+        partitioning: Literal["song", "hash"] = "song",
+        num_buckets: int = 64,
+        combine_chunks: bool = True,
+        chunk_memory_target: int | None = None,
+        memory_limit: int | None = None,
+        hot_group_size: int = 0,
+        num_sub_partitions: int = 16,
+        checkpoint_interval: int = 0,
+    ):
+        self.tmp_dir = tmp_dir
+        self.dtypes = dtypes
+        self.chunk_size = chunk_size
+        self.partitioning = partitioning
+        self.num_buckets = num_buckets
+        self.combine_chunks = combine_chunks
+        self.chunk_memory_target = chunk_memory_target
+        self.memory_limit = memory_limit
+        self.hot_group_size = hot_group_size
+        self.num_sub_partitions = num_sub_partitions
+        self.checkpoint_interval = checkpoint_interval
+
+    def split(
+        self,
+        file_path: Path | str,
+        start: int | None = None,
+        end: int | None = None,
+        *,
+        manifest: PartitionManifest | None = None,
+        on_checkpoint: CheckpointCallback | None = None,
+        on_chunk: ChunkCallback | None = None,
+        metrics: Instrumentation | None = None,
+    ) -> PartitionManifest:
+        """
+        Splits the rows of the byte range [start, end) of the file (the whole file by default).
+
+        Args:
+            file_path (Path | str): The csv file.
+            start (int | None, optional): The first byte of the range, it must be the start of a row.
+            end (int | None, optional): The end (exclusive) of the range, it must be the end of a row.
+            manifest (PartitionManifest | None, optional): The manifest of the groups already written, when resuming
+                from a checkpoint. The new rows are recorded in it.
+            on_checkpoint (CheckpointCallback | None, optional): Called at every checkpoint (see
+                `checkpoint_interval`).
+            on_chunk (ChunkCallback | None, optional): Called for every chunk split, e.g. to report the progress.
+            metrics (Instrumentation | None, optional): Records the metrics of the stages of the split.
+
+        Returns:
+            PartitionManifest: The groups written by this split, to be merged with the ones of other byte ranges.
+        """
+        reader = helpers.CSVChunkReader(
+            file_path,
+            dtypes=self.dtypes,
+            chunk_size=self.chunk_size,
+            start=start,
+            end=end,
+            chunk_size_controller=make_chunk_size_controller(
+                self.chunk_size, self.chunk_memory_target, self.memory_limit
+            ),
+        )
+        pending_writes: Deque[concurrent.futures.Future] = deque()
+        manifest = manifest if manifest is not None else PartitionManifest(self.tmp_dir)
+        metrics = metrics if metrics is not None else Instrumentation()
+        last_checkpoint = chunk_end = start or 0
+        chunks = 0
+
+        writer = helpers.get_executor("thread")
+        try:
+            # Reader stage: the next chunks are read and parsed in the background.
+            chunks_read = self._read_chunks(reader, metrics)
+            for chunk in helpers.iterate_in_background(chunks_read, max_queued=self.MAX_QUEUED_CHUNKS):
+                # Partition stage.
+                with metrics.measure("split_partition", threaded=True) as run:
+                    dataframe = chunk.dataframe
+                    if self.combine_chunks:
+                        dataframe = sum_plays_by_song_and_date(dataframe)
+
+                    partitions = self.partition(dataframe)
+                    run.bytes_in += chunk.end - chunk.start
+                    run.partitions += len(partitions)
+
+                chunk_start = chunk.start
+                chunk_end = chunk.end
+                chunks += 1
+                if on_chunk:
+                    on_chunk(chunk_end, chunk.dataframe.height)
+                # The size of a categorical partition would include the whole (global) string cache, so the groups
+                # are sized by their rows instead, at the average row size of the chunk.
+                row_size = dataframe.estimated_size() / max(dataframe.height, 1)
+
+                # Writer stage: the chunk file is written while the next chunk is partitioned.
+                pending_writes.append(
+                    writer.submit(
+                        self._write_chunk_file,
+                        metrics,
+                        self._partitions_to_write(partitions, chunk_start, manifest, row_size),
+                        manifest.chunk_file(chunk_start),
+                    )
+                )
+
+                # Avoid keeping things in memory
+                del chunk, dataframe, partitions
+
+                # Backpressure: wait for the writes of the oldest chunk before taking another one.
+                while len(pending_writes) > self.MAX_PENDING_WRITES:
+                    helpers.wait_for_futures([pending_writes.popleft()])
+
+                read_since_checkpoint = chunk_end - last_checkpoint
+                if on_checkpoint and self.checkpoint_interval and read_since_checkpoint >= self.checkpoint_interval:
+                    # Every chunk file up to the end of this chunk must be written before the checkpoint.
+                    while pending_writes:
+                        helpers.wait_for_futures([pending_writes.popleft()])
+
+                    on_checkpoint(chunk_end, chunks, manifest)
+                    last_checkpoint = chunk_end
+
+            while pending_writes:
+                helpers.wait_for_futures([pending_writes.popleft()])
+
+            if on_checkpoint and self.checkpoint_interval and chunk_end > last_checkpoint:
+                on_checkpoint(chunk_end, chunks, manifest)
+
+        finally:
+            # Do not leave writes of a failed split running in the shared pool.
+            for future in pending_writes:
+                future.cancel()
+
+        return manifest
+
+    @staticmethod
+    def _read_chunks(reader: helpers.CSVChunkReader, metrics: Instrumentation) -> Iterator[helpers.CSVChunk]:
+        chunks = iter(reader)
+        while True:
+            with metrics.measure("split_read", threaded=True) as run:
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    run.bytes_in += chunk.end - chunk.start
+
+            if chunk is None:
+                return
+
+            yield chunk
+
+    @staticmethod
+    def _write_chunk_file(metrics: Instrumentation, partitions: List[pl.DataFrame], chunk_file: Path) -> Path:
+        with metrics.measure("split_write", threaded=True) as run:
+            helpers.save_dataframes_to_ipc_file(partitions, chunk_file)
+            run.bytes_out += chunk_file.stat().st_size
+            run.partitions += len(partitions)
+
+        return chunk_file
+
+    def discard_fragments(self, start: int, end: int | None = None) -> int:
+        """
+        Deletes the chunk files of the chunks starting in [start, end) (from `start` on by default), e.g. the ones a
+        dead worker wrote after its last checkpoint, so the rows are not counted twice once split again.
+
+        Args:
+            start (int): The first offset of the range.
+            end (int | None, optional): The end (exclusive) of the range.
+
+        Returns:
+            int: The number of chunk files deleted.
+        """
+        discarded = 0
+        for chunk_file in self.tmp_dir.glob("*.arrow"):
+            # Chunk files are named after the offset of their chunk.
+            if not chunk_file.stem.isdigit():
+                continue
+
+            offset = int(chunk_file.stem)
+            if start <= offset and (end is None or offset < end):
+                chunk_file.unlink()
+                discarded += 1
+
+        return discarded
+
+    def _partitions_to_write(
+        self, partitions: Dict[str, pl.DataFrame], offset: int, manifest: PartitionManifest, row_size: float
+    ) -> List[pl.DataFrame]:
+        """
+        Records every partition of the chunk starting at `offset` in the manifest, as the record batch of the chunk
+        file at the same position of the returned list.
+
+        The rows of a group that already holds `hot_group_size` bytes (e.g. a viral song) are split by the hash
+        of their "Date" into sub-partitions of the group, so each of them can be aggregated on its own.
+        """
+        to_write: List[pl.DataFrame] = []
+        for group, partition in partitions.items():
+            if self.hot_group_size and manifest.get_group_size(group) >= self.hot_group_size:
+                sub_partitions = partition_by_bucket(partition, self.num_sub_partitions, columns=("Date",))
+                for sub_partition, rows in sub_partitions.items():
+                    manifest.record(
+                        group,
+                        rows=rows.height,
+                        size=int(rows.height * row_size),
+                        fragment=(offset, len(to_write)),
+                        sub_partition=sub_partition,
+                    )
+                    to_write.append(rows)
+
+            else:
+                manifest.record(
+                    group,
+                    rows=partition.height,
+                    size=int(partition.height * row_size),
+                    fragment=(offset, len(to_write)),
+                )
+                to_write.append(partition)
+
+        return to_write
+
+    def partition(self, dataframe: pl.DataFrame) -> Dict[str, pl.DataFrame]:
+        """
+        Partitions the dataframe according to the configured partitioning mode.
+
+        Args:
+            dataframe (pl.DataFrame): The chunk to be partitioned.
+
+        Returns:
+            Dict[str, pl.DataFrame]: The partitions, keyed by the name of the group they will be saved to.
+        """
+        if self.partitioning == "song":
+            # Partitioning the dataframe by "Song" and create a temporary group for each "Song".
+            return dataframe.sort("Song").partition_by("Song", as_dict=True, maintain_order=False)
+
+        partitions = partition_by_bucket(dataframe, self.num_buckets)
+        return {f"bucket{bucket:05d}": partition for bucket, partition in partitions.items()}
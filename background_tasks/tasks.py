@@ -1,20 +1,160 @@
-from celery import shared_task
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from celery import chord, shared_task
 from flask import current_app
 
+import helpers
 import helpers.files
 from background_tasks.csv_processor import CSVProcessor
-from daos import TasksMongoDAO
-from dtos import Task
+from background_tasks.planning import estimate_csv_size
+from daos import TasksMongoDAO, UploadsMongoDAO
+from dtos import Task, TaskStatus
+from logger import get_logger
+
+from app.extensions import db, metrics
+
+logger = get_logger(__file__)
+
+
+def make_csv_processor(task_id: str, dao: TasksMongoDAO, **kwargs) -> CSVProcessor:
+    profile_dir = None
+    if task_id in current_app.config["CSV_PROFILE_TASK_IDS"] or "*" in current_app.config["CSV_PROFILE_TASK_IDS"]:
+        profile_dir = current_app.config["BASE_DIR"] / current_app.config["CSV_PROFILE_DIR"]
+
+    # The memory of the container is shared by the tasks processed at once, each one only gets its share.
+    concurrent_tasks = current_app.config["CSV_CONCURRENT_TASKS"] or current_app.config["CELERY"]["worker_concurrency"]
+    memory_limit = helpers.get_task_memory_limit(
+        current_app.config["CSV_MEMORY_LIMIT"] or helpers.get_memory_limit(), concurrent_tasks
+    )
+    in_memory_limit = current_app.config["CSV_IN_MEMORY_LIMIT"]
+    memory_budget = current_app.config["CSV_AGGREGATION_MEMORY_BUDGET"]
+    if memory_limit is not None:
+        in_memory_limit = min(in_memory_limit, memory_limit // 2)
+        memory_budget = min(memory_budget, memory_limit // 4)
+
+    return CSVProcessor(
+        task_id,
+        dao,
+        output_dir=current_app.config["DOWNLOAD_FOLDER"],
+        chunk_size=current_app.config["CSV_CHUNK_SIZE"],
+        partitioning=current_app.config["CSV_PARTITIONING"],
+        num_buckets=current_app.config["CSV_PARTITION_BUCKETS"],
+        engine=current_app.config["CSV_PROCESSING_ENGINE"],
+        memory_budget=memory_budget,
+        combine_chunks=current_app.config["CSV_COMBINE_CHUNKS"],
+        split_workers=current_app.config["CSV_SPLIT_WORKERS"],
+        chunk_memory_target=current_app.config["CSV_CHUNK_MEMORY_TARGET"],
+        memory_limit=memory_limit,
+        hot_group_size=current_app.config["CSV_HOT_GROUP_SIZE"],
+        num_sub_partitions=current_app.config["CSV_HOT_GROUP_SUB_PARTITIONS"],
+        aggregation_batch_size=current_app.config["CSV_AGGREGATION_BATCH_SIZE"],
+        in_memory_limit=in_memory_limit,
+        checkpoint_interval=current_app.config["CSV_CHECKPOINT_INTERVAL"],
+        max_attempts=current_app.config["CSV_MAX_TASK_ATTEMPTS"],
+        progress_interval=current_app.config["CSV_PROGRESS_INTERVAL"],
+        profile_dir=profile_dir,
+        **kwargs,
+    )
+
+
+@shared_task(ignore_result=True)
+def process_csv(task_id: str, distribute: bool = True):
+    """
+    Processes the csv file of the task. Files of at least two CSV_DISTRIBUTED_RANGE_SIZE byte ranges are
+    distributed across the workers: a chord of `split_csv_byte_range` subtasks (map) followed by
+    `reduce_csv_byte_ranges` (reduce). The workers must share the DOWNLOAD_FOLDER volume. With `distribute=False`
+    (e.g. a task processed within a request, which must be finished when the call returns) it is never distributed.
+
+    Tasks are only acknowledged once done, so the task of a worker that died midway is delivered again, and resumed
+    from its last checkpoint (see `CSVProcessor.begin_attempt`).
+    """
+    dao = TasksMongoDAO(db=db)
+    with make_csv_processor(task_id, dao) as file_processor:
+        if not file_processor.begin_attempt():
+            return
+
+        metrics.observe_queue_wait(file_processor.task)
+        byte_ranges = file_processor.plan_distributed_split(
+            range_size=current_app.config["CSV_DISTRIBUTED_RANGE_SIZE"] if distribute else 0,
+            max_ranges=current_app.config["CSV_DISTRIBUTED_MAX_RANGES"],
+        )
+        if not byte_ranges:
+            start_time = time.perf_counter()
+            file_processor.execute()
+            metrics.observe_processed_file(
+                file_processor.engine.value,
+                elapsed=time.perf_counter() - start_time,
+                input_bytes=file_processor.get_bytes_read(),
+                rows=file_processor.get_rows_parsed(),
+            )
+
+        else:
+            file_processor.start_distributed_processing(len(byte_ranges))
+            # Only large files are distributed, their subtasks run on the workers of the heavy queue.
+            queue = current_app.config["CELERY_HEAVY_QUEUE"]
+            chord(split_csv_byte_range.s(task_id, start, end).set(queue=queue) for start, end in byte_ranges)(
+                reduce_csv_byte_ranges.s(task_id).set(queue=queue)
+            )
+
 
-from app.extensions import db
+@shared_task(ignore_result=False)
+def split_csv_byte_range(task_id: str, start: int, end: int) -> str | None:
+    """
+    Map phase of a distributed task: splits a byte range of the csv file into the shared temporary files, returning
+    the name of the partition manifest file of the byte range (the manifest itself may be too large for the result
+    backend).
+    """
+    dao = TasksMongoDAO(db=db)
+    with make_csv_processor(task_id, dao, keep_tmp_files=True) as file_processor:
+        return file_processor.split_byte_range(start, end)
 
 
 @shared_task(ignore_result=True)
-def process_csv(task_id: str):
+def reduce_csv_byte_ranges(manifest_files: List[str | None], task_id: str):
+    """
+    Reduce phase of a distributed task: merges the partition manifest files of every byte range and aggregates the
+    temporary files into the result file.
+    """
     dao = TasksMongoDAO(db=db)
-    output_dir = current_app.config["DOWNLOAD_FOLDER"]
-    with CSVProcessor(task_id, dao, output_dir=output_dir) as file_processor:
-        file_processor.execute()
+    with make_csv_processor(task_id, dao) as file_processor:
+        file_processor.generate_result_file_from_byte_ranges([file_name for file_name in manifest_files if file_name])
+
+
+@shared_task(ignore_result=True)
+def requeue_stuck_tasks():
+    """
+    Requeues the tasks left IN_PROGRESS by a worker that died (e.g. killed for running out of memory) and whose
+    message was lost: tasks not updated for CSV_STUCK_TASK_TIMEOUT seconds. The new attempt resumes from the last
+    checkpoint of the task, and gives up after CSV_MAX_TASK_ATTEMPTS attempts. A task whose input file is gone
+    cannot be resumed, it is marked as failed instead.
+
+    Distributed tasks are never requeued: their subtasks may wait in the queue for longer than the timeout, and
+    their messages are delivered again by the broker if a worker dies.
+    """
+    dao = TasksMongoDAO(db=db)
+    updated_before = datetime.utcnow() - timedelta(seconds=current_app.config["CSV_STUCK_TASK_TIMEOUT"])
+    for task in dao.get_stuck_tasks(updated_before):
+        try:
+            csv_size = estimate_csv_size(task.input_file_path)
+        except (OSError, TypeError):
+            logger.error(f"Task '{task.id}' is stuck and its input file is missing, marking it as failed.")
+            task.status = TaskStatus.FAILED
+            task.errors = {"input_file": ["The input file of the task is missing."]}
+            dao.update_task(task)
+            continue
+
+        heavy_task_size = current_app.config["CSV_HEAVY_TASK_SIZE"]
+        queue = current_app.config["CELERY_LIGHT_QUEUE"]
+        if heavy_task_size and csv_size >= heavy_task_size:
+            queue = current_app.config["CELERY_HEAVY_QUEUE"]
+
+        if not dao.requeue_task(task):
+            # The task was updated in the meantime, it is not stuck.
+            continue
+
+        process_csv.apply_async(args=(task.id,), queue=queue)
 
 
 @shared_task(ignore_result=True)
@@ -23,6 +163,9 @@ def cleanup_files():
     This task will remove any files related to a task that has completed their worflow or has the status 'FAILED'.
     At the end of this process, the task would still be inside the database but with
     input_file_path=None and output_file_path=None.
+
+    It also removes the files of the chunked uploads that were never finalized: uploads with no chunk written for
+    CSV_UPLOAD_EXPIRY seconds are marked as EXPIRED.
     """
     dao = TasksMongoDAO(db=db)
     tasks = dao.get_tasks_with_their_workflow_done()
@@ -30,3 +173,10 @@ def cleanup_files():
         helpers.files.delete_files(task.input_file_path, task.output_file_path)
         task.mark_as_finished()
         dao.update_task(task)
+
+    uploads_dao = UploadsMongoDAO(db=db)
+    updated_before = datetime.utcnow() - timedelta(seconds=current_app.config["CSV_UPLOAD_EXPIRY"])
+    for upload in uploads_dao.get_expired_uploads(updated_before):
+        # A chunk written in the meantime keeps the upload alive.
+        if uploads_dao.expire_upload(upload):
+            helpers.files.delete_files(upload.file_path)
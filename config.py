@@ -21,20 +21,115 @@ class Config:
     BASE_DIR = Path(__file__).resolve().parent
     CSV_OUTPUT_DIR = os.getenv("CSV_OUTPUT_DIR", "static/output")
     CSV_INPUT_DIR = os.getenv("CSV_INPUT_DIR", "static/input")
+    # Uploads up to this size (in bytes) are processed within the request, which returns a link to the result right
+    # away instead of queueing the task (0 disables it). Like CSV_HEAVY_TASK_SIZE, it applies to the csv: compressed
+    # uploads are assumed to be 10 times larger once decompressed.
+    CSV_INLINE_MAX_SIZE = int(os.getenv("CSV_INLINE_MAX_SIZE", 8 * 1024**2))
+    # Chunked uploads with no chunk written for CSV_UPLOAD_EXPIRY seconds (and not finalized) expire, their file is
+    # deleted by the cleanup task.
+    CSV_UPLOAD_EXPIRY = int(os.getenv("CSV_UPLOAD_EXPIRY", 24 * 60 * 60))
+
+    # How the split stage partitions the input file: "song" (one tmp file per song) or "hash" (a fixed number of
+    # tmp files, each (Song, Date) pair hashed into one of CSV_PARTITION_BUCKETS buckets).
+    CSV_PARTITIONING = os.getenv("CSV_PARTITIONING", "song")
+    CSV_PARTITION_BUCKETS = int(os.getenv("CSV_PARTITION_BUCKETS", 64))
+    # Rows of the first chunk read. The following chunks hold as many rows as fit in CSV_CHUNK_MEMORY_TARGET bytes once
+    # parsed (0 keeps CSV_CHUNK_SIZE rows) and shrink when the RSS gets close to CSV_MEMORY_LIMIT bytes (0 uses the
+    # memory limit of the container, if any).
+    CSV_CHUNK_SIZE = int(os.getenv("CSV_CHUNK_SIZE", 2_000_000))
+    CSV_CHUNK_MEMORY_TARGET = int(os.getenv("CSV_CHUNK_MEMORY_TARGET", 64 * 1024**2))
+    CSV_MEMORY_LIMIT = int(os.getenv("CSV_MEMORY_LIMIT", 0))
+    # Tasks processed at once in a container (0 uses the celery worker concurrency), which share its memory: each task
+    # gets CSV_MEMORY_LIMIT / CSV_CONCURRENT_TASKS bytes, and CSV_IN_MEMORY_LIMIT and CSV_AGGREGATION_MEMORY_BUDGET
+    # are capped to a half and a quarter of it, the rest being the worker process itself and headroom.
+    CSV_CONCURRENT_TASKS = int(os.getenv("CSV_CONCURRENT_TASKS", 0))
+    # Once CSV_HOT_GROUP_SIZE bytes were written to a partition (e.g. a viral song), its following rows are split by
+    # the hash of their "Date" into CSV_HOT_GROUP_SUB_PARTITIONS sub-partitions (0 disables it).
+    CSV_HOT_GROUP_SIZE = int(os.getenv("CSV_HOT_GROUP_SIZE", 128 * 1024**2))
+    CSV_HOT_GROUP_SUB_PARTITIONS = int(os.getenv("CSV_HOT_GROUP_SUB_PARTITIONS", 16))
+    # Pre-aggregates each chunk by (Song, Date) before writing it to the tmp files.
+    CSV_COMBINE_CHUNKS = os.getenv("CSV_COMBINE_CHUNKS", "true").lower() == "true"
+    # Number of processes parsing byte ranges of the input file in the split stage. Processes cannot be started from
+    # the children of a prefork celery worker, run the worker with "--pool solo" (or threads) to use more than one.
+    CSV_SPLIT_WORKERS = int(os.getenv("CSV_SPLIT_WORKERS", 1))
+
+    # Files of at least two ranges of CSV_DISTRIBUTED_RANGE_SIZE bytes are split by up to CSV_DISTRIBUTED_MAX_RANGES
+    # celery subtasks (possibly on other nodes sharing the output volume), 0 disables the distributed mode. It needs
+    # a result backend supporting chords (e.g. mongodb or redis, not rpc).
+    CSV_DISTRIBUTED_RANGE_SIZE = int(os.getenv("CSV_DISTRIBUTED_RANGE_SIZE", 0))
+    CSV_DISTRIBUTED_MAX_RANGES = int(os.getenv("CSV_DISTRIBUTED_MAX_RANGES", 16))
+
+    # "PARTITION" splits the input file into partition files before aggregating them, "EXTERNAL" aggregates in a
+    # single pass and only spills to disk when the partial aggregates exceed CSV_AGGREGATION_MEMORY_BUDGET bytes and
+    # "STREAMING" runs the whole job as a single polars streaming query, "IN_MEMORY" reads and aggregates the whole file
+    # in memory and "AUTO" picks IN_MEMORY for files estimated (from a sample) to fit in CSV_IN_MEMORY_LIMIT bytes and
+    # PARTITION otherwise. Tasks may override it with their own engine.
+    CSV_PROCESSING_ENGINE = os.getenv("CSV_PROCESSING_ENGINE", "AUTO")
+    CSV_IN_MEMORY_LIMIT = int(os.getenv("CSV_IN_MEMORY_LIMIT", 512 * 1024**2))
+    # It also bounds the (estimated) memory of the groups aggregated at the same time by the PARTITION engine, where
+    # groups smaller than CSV_AGGREGATION_BATCH_SIZE bytes are aggregated together, by a single query.
+    CSV_AGGREGATION_MEMORY_BUDGET = int(os.getenv("CSV_AGGREGATION_MEMORY_BUDGET", 256 * 1024**2))
+    CSV_AGGREGATION_BATCH_SIZE = int(os.getenv("CSV_AGGREGATION_BATCH_SIZE", 8 * 1024**2))
+
+    # Size of the thread and process pools shared by every task of a worker process, and the maximum number of calls
+    # pending in each of them (submitting more calls blocks until one of them finishes).
+    EXECUTOR_THREAD_WORKERS = int(os.getenv("EXECUTOR_THREAD_WORKERS", min(32, (os.cpu_count() or 1) + 4)))
+    EXECUTOR_PROCESS_WORKERS = int(os.getenv("EXECUTOR_PROCESS_WORKERS", os.cpu_count() or 1))
+    EXECUTOR_MAX_PENDING = int(os.getenv("EXECUTOR_MAX_PENDING", 64))
+
+    # The split stage of the PARTITION engine is checkpointed every CSV_CHECKPOINT_INTERVAL bytes of input (0 disables
+    # it), so a worker killed midway is resumed from its last checkpoint. Tasks IN_PROGRESS that were not updated for
+    # CSV_STUCK_TASK_TIMEOUT seconds are requeued, and a task fails after CSV_MAX_TASK_ATTEMPTS attempts. The timeout
+    # must be longer than the longest stage without checkpoints (e.g. the aggregation of the largest file).
+    CSV_CHECKPOINT_INTERVAL = int(os.getenv("CSV_CHECKPOINT_INTERVAL", 256 * 1024**2))
+    CSV_STUCK_TASK_TIMEOUT = int(os.getenv("CSV_STUCK_TASK_TIMEOUT", 30 * 60))
+    CSV_MAX_TASK_ATTEMPTS = int(os.getenv("CSV_MAX_TASK_ATTEMPTS", 3))
+
+    # The progress of a task is written to its document at most once every CSV_PROGRESS_INTERVAL seconds.
+    CSV_PROGRESS_INTERVAL = float(os.getenv("CSV_PROGRESS_INTERVAL", 2.0))
+
+    # The tasks listed in CSV_PROFILE_TASK_IDS (comma separated ids, "*" for every task) are profiled with cProfile,
+    # their stats are dumped to CSV_PROFILE_DIR/<task id>.pstats.
+    CSV_PROFILE_TASK_IDS = [task_id for task_id in os.getenv("CSV_PROFILE_TASK_IDS", "").split(",") if task_id]
+    CSV_PROFILE_DIR = os.getenv("CSV_PROFILE_DIR", "static/profiles")
+
+    # Port of the Prometheus metrics endpoint of the celery workers (0 disables it), the API serves them on /metrics.
+    CELERY_METRICS_PORT = int(os.getenv("CELERY_METRICS_PORT", 0))
 
     SECRET_KEY = os.getenv("SECRET_KEY", uuid.uuid4().hex)
 
+    # Uploads of at least CSV_HEAVY_TASK_SIZE bytes are processed by the workers of CELERY_HEAVY_QUEUE, the others (and
+    # every other task) by the workers of CELERY_LIGHT_QUEUE, so a huge file never holds up the small ones.
+    CSV_HEAVY_TASK_SIZE = int(os.getenv("CSV_HEAVY_TASK_SIZE", 256 * 1024**2))
+    CELERY_LIGHT_QUEUE = os.getenv("CELERY_LIGHT_QUEUE", "light")
+    CELERY_HEAVY_QUEUE = os.getenv("CELERY_HEAVY_QUEUE", "heavy")
+
     CELERY = {
         "broker_url": os.getenv("CELERY_BROKER_URL"),
         "result_backend": os.getenv("RESULT_BACKEND"),
         "task_ignore_result": True,
+        "task_default_queue": CELERY_LIGHT_QUEUE,
+        # Set for each pool of workers: many processes prefetching a few tasks each for the light queue, a single
+        # process taking one task at a time for the heavy queue (a prefetched task would wait for the running one).
+        "worker_concurrency": int(os.getenv("CELERY_WORKER_CONCURRENCY", os.cpu_count() or 1)),
+        "worker_prefetch_multiplier": int(os.getenv("CELERY_WORKER_PREFETCH_MULTIPLIER", 4)),
+        # Tasks are acknowledged once done, so the tasks of a worker that died (e.g. killed for running out of
+        # memory) are delivered again instead of being lost.
+        "task_acks_late": True,
+        "task_reject_on_worker_lost": True,
         # Scheduling a task to clean up files related to a task that has completed their workflow.
         "beat_schedule": {
             "cleanup-files-every-90-seconds": {
                 "task": "background_tasks.tasks.cleanup_files",
                 "schedule": 90.0,
                 "options": {"expires": 15.0},
-            }
+            },
+            # Requeuing the tasks left in progress by a dead worker.
+            "requeue-stuck-tasks-every-5-minutes": {
+                "task": "background_tasks.tasks.requeue_stuck_tasks",
+                "schedule": 300.0,
+                "options": {"expires": 60.0},
+            },
         },
     }
 
@@ -1 +1 @@
-from .mongo_db import TasksMongoDAO
+from .mongo_db import TasksMongoDAO, UploadsMongoDAO
@@ -7,6 +7,8 @@ for testing, debugging, or as a temporary placeholder until the actual DAO imple
 
 The DummyDAO class provides basic functionality for creating, retrieving, and updating tasks. It does not
 interact with a real data source and is only used to simulate the behavior of a DAO for testing purposes.
+The tasks it creates (and their updates) are kept in memory, so a task can be processed by a `CSVProcessor` and
+read back afterwards, e.g. by the benchmarks. Unknown tasks are made up.
 
 Usage example:
     dao = DummyDAO(input_file_path="/path/to/input/file.csv")
@@ -20,7 +22,9 @@ Usage example:
 Author: Luiz Henrique Longo
 """
 import uuid
+from datetime import datetime
 from pathlib import Path
+from typing import Dict
 
 import dtos
 from logger import get_logger
@@ -31,15 +35,22 @@ logger = get_logger(__file__)
 class DummyDAO:
     def __init__(self, input_dir: Path | str):
         self.input_dir = str(input_dir)
+        self.tasks: Dict[str, dtos.Task] = {}
 
-    def create_new_task(self, task_id: str, input_file_path: str) -> dtos.Task:
-        task = dtos.Task(id=task_id, input_file_path=input_file_path)
+    def create_new_task(
+        self, task_id: str, input_file_path: str, engine: dtos.ProcessingEngine | None = None
+    ) -> dtos.Task:
+        task = dtos.Task(id=task_id, input_file_path=input_file_path, engine=engine, queued_at=datetime.utcnow())
         logger.debug("Creating fake task...")
         logger.debug(f"Task info: {task.dict()}")
+        self.tasks[task_id] = task.copy(deep=True)
         return task
 
     def get_task(self, task_id: str) -> dtos.Task:
         logger.debug("Getting fake task...")
+        if task_id in self.tasks:
+            return self.tasks[task_id].copy(deep=True)
+
         task = dtos.Task(id=task_id, input_file_path=f"{self.input_dir}/{str(uuid.uuid4())}.csv")
         logger.debug(f"Task info: {task.dict()}")
         return task
@@ -47,4 +58,44 @@ class DummyDAO:
     def update_task(self, task: dtos.Task) -> dtos.Task:
         logger.debug("Fake updating a task...")
         logger.debug(f"Task info: {task.dict()}")
+        # As in the database, the counters, checkpoint and progress are only written by their own methods.
+        task.updated_at = datetime.utcnow()
+        stored_task = self.tasks.get(task.id)
+        self.tasks[task.id] = task.copy(
+            deep=True,
+            update={
+                "completed_ranges": stored_task.completed_ranges if stored_task else 0,
+                "attempts": stored_task.attempts if stored_task else 0,
+                "checkpoint": stored_task.checkpoint if stored_task else None,
+                "progress": stored_task.progress if stored_task else None,
+            },
+        )
         return task
+
+    def start_attempt(self, task_id: str) -> dtos.Task:
+        stored_task = self._get_stored_task(task_id)
+        stored_task.attempts += 1
+        stored_task.updated_at = datetime.utcnow()
+        return stored_task.copy(deep=True)
+
+    def increment_completed_ranges(self, task_id: str) -> int:
+        stored_task = self._get_stored_task(task_id)
+        stored_task.completed_ranges += 1
+        stored_task.updated_at = datetime.utcnow()
+        return stored_task.completed_ranges
+
+    def save_checkpoint(self, task_id: str, checkpoint: dtos.SplitCheckpoint) -> None:
+        stored_task = self._get_stored_task(task_id)
+        stored_task.checkpoint = checkpoint.copy()
+        stored_task.updated_at = datetime.utcnow()
+
+    def update_task_progress(self, task_id: str, progress: dtos.TaskProgress) -> None:
+        if task_id in self.tasks:
+            self.tasks[task_id].progress = progress.copy()
+
+    def _get_stored_task(self, task_id: str) -> dtos.Task:
+        # A made up task is kept from its first change on.
+        if task_id not in self.tasks:
+            self.tasks[task_id] = self.get_task(task_id)
+
+        return self.tasks[task_id]
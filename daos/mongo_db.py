@@ -1,8 +1,18 @@
+from datetime import datetime
 from typing import List
 
 from flask_pymongo.wrappers import Collection, Database
+from pymongo import ReturnDocument
 
-from dtos import Task
+from dtos import (
+    ProcessingEngine,
+    SplitCheckpoint,
+    Task,
+    TaskProgress,
+    TaskStatus,
+    Upload,
+    UploadStatus,
+)
 
 
 class MongoDAO:
@@ -20,15 +30,62 @@ class TasksMongoDAO(MongoDAO):
         return Task(**task)
 
     def update_task(self, task: Task) -> Task:
-        task_data = task.dict(exclude={"id"})
+        # Counters and checkpoints are only changed by their own methods, a stale copy of the task must not overwrite
+        # them.
+        task.updated_at = datetime.utcnow()
+        task_data = task.dict(exclude={"id", "completed_ranges", "attempts", "checkpoint", "progress"})
         self.collection.update_one({"id": task.id}, {"$set": task_data})
         return task
 
-    def create_new_task(self, task_id: str, input_file_path: str) -> Task:
-        task = Task(id=task_id, input_file_path=input_file_path)
+    def start_attempt(self, task_id: str) -> Task:
+        task = self.collection.find_one_and_update(
+            {"id": task_id},
+            {"$inc": {"attempts": 1}, "$set": {"updated_at": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER,
+        )
+        return Task(**task)
+
+    def save_checkpoint(self, task_id: str, checkpoint: SplitCheckpoint) -> None:
+        self.collection.update_one(
+            {"id": task_id}, {"$set": {"checkpoint": checkpoint.dict(), "updated_at": datetime.utcnow()}}
+        )
+
+    def increment_completed_ranges(self, task_id: str) -> int:
+        task = self.collection.find_one_and_update(
+            {"id": task_id},
+            {"$inc": {"completed_ranges": 1}, "$set": {"updated_at": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER,
+        )
+        return task["completed_ranges"]
+
+    def create_new_task(self, task_id: str, input_file_path: str, engine: ProcessingEngine | None = None) -> Task:
+        task = Task(id=task_id, input_file_path=input_file_path, engine=engine, queued_at=datetime.utcnow())
         self.collection.insert_one(task.dict())
         return task
 
+    def update_task_progress(self, task_id: str, progress: TaskProgress) -> None:
+        # Throttled by the caller (see `ProgressReporter`), it also tells the task is alive.
+        self.collection.update_one(
+            {"id": task_id}, {"$set": {"progress": progress.dict(), "updated_at": datetime.utcnow()}}
+        )
+
+    def get_stuck_tasks(self, updated_before: datetime) -> List[Task]:
+        # Distributed tasks are left to their subtasks, which may wait in the queue for a long time.
+        tasks = self.collection.find(
+            {"status": TaskStatus.IN_PROGRESS, "updated_at": {"$lt": updated_before}, "distributed_ranges": None}
+        )
+        return [Task(**task) for task in tasks]
+
+    def requeue_task(self, task: Task) -> bool:
+        # Only requeues the task if nothing updated it since it was found stuck (distributed tasks are never stuck,
+        # see `get_stuck_tasks`).
+        now = datetime.utcnow()
+        result = self.collection.update_one(
+            {"id": task.id, "status": TaskStatus.IN_PROGRESS, "updated_at": task.updated_at},
+            {"$set": {"status": TaskStatus.QUEUED, "updated_at": now, "queued_at": now}},
+        )
+        return result.modified_count == 1
+
     def get_tasks_with_their_workflow_done(self) -> List[Task]:
         query = {
             "$and": [
@@ -41,3 +98,47 @@ class TasksMongoDAO(MongoDAO):
         # Fetch the tasks
         tasks = self.collection.find(query)
         return [Task(**task) for task in tasks]
+
+
+class UploadsMongoDAO(MongoDAO):
+    def __init__(self, db: Database):
+        super().__init__(db)
+        self.collection: Collection = self._db.uploads
+
+    def create_upload(self, upload_id: str, file_path: str, engine: ProcessingEngine | None = None) -> Upload:
+        upload = Upload(id=upload_id, file_path=file_path, engine=engine, updated_at=datetime.utcnow())
+        self.collection.insert_one(upload.dict())
+        return upload
+
+    def get_upload(self, upload_id: str) -> Upload:
+        upload = self.collection.find_one_or_404({"id": upload_id})
+        return Upload(**upload)
+
+    def advance_upload(self, upload_id: str, *, offset: int, new_offset: int, checksum: int) -> Upload | None:
+        # Only moves forward from the offset the chunk was written at, None if another chunk got there first.
+        upload = self.collection.find_one_and_update(
+            {"id": upload_id, "offset": offset, "status": UploadStatus.IN_PROGRESS},
+            {"$set": {"offset": new_offset, "checksum": checksum, "updated_at": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER,
+        )
+        return Upload(**upload) if upload is not None else None
+
+    def finalize_upload(self, upload_id: str) -> Upload | None:
+        upload = self.collection.find_one_and_update(
+            {"id": upload_id, "status": UploadStatus.IN_PROGRESS},
+            {"$set": {"status": UploadStatus.FINALIZED}},
+            return_document=ReturnDocument.AFTER,
+        )
+        return Upload(**upload) if upload is not None else None
+
+    def get_expired_uploads(self, updated_before: datetime) -> List[Upload]:
+        uploads = self.collection.find({"status": UploadStatus.IN_PROGRESS, "updated_at": {"$lt": updated_before}})
+        return [Upload(**upload) for upload in uploads]
+
+    def expire_upload(self, upload: Upload) -> bool:
+        # Only expires the upload if no chunk was written since it was found expired.
+        result = self.collection.update_one(
+            {"id": upload.id, "status": UploadStatus.IN_PROGRESS, "updated_at": upload.updated_at},
+            {"$set": {"status": UploadStatus.EXPIRED}},
+        )
+        return result.modified_count == 1
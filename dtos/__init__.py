@@ -1,2 +1,13 @@
-from .responses import ErrorResponse, TaskAPIResponse
-from .tasks import PublicTaskInfo, Task, TaskStatus
+from .responses import ErrorResponse, TaskAPIResponse, UploadAPIResponse
+from .tasks import (
+    ProcessingEngine,
+    ProcessingPlan,
+    ProcessingStage,
+    PublicTaskInfo,
+    SplitCheckpoint,
+    StageMetrics,
+    Task,
+    TaskProgress,
+    TaskStatus,
+)
+from .uploads import PublicUploadInfo, Upload, UploadStatus
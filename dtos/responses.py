@@ -3,6 +3,7 @@ from typing import Dict, List
 from pydantic import BaseModel, Field
 
 from dtos.tasks import PublicTaskInfo
+from dtos.uploads import PublicUploadInfo
 
 
 class ErrorResponse(BaseModel):
@@ -29,3 +30,20 @@ class TaskAPIResponse(BaseWorkflowResponse):
                 "task": {"id": "aa5322dd-d3fc-405a-b79d-c24c87ba201e", "status": "IN_PROGRESS"},
             }
         }
+
+
+class UploadAPIResponse(BaseWorkflowResponse):
+    upload: PublicUploadInfo
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "next": "/api/v1/file-processing/uploads/aa5322dd-d3fc-405a-b79d-c24c87ba201e",
+                "upload": {
+                    "id": "aa5322dd-d3fc-405a-b79d-c24c87ba201e",
+                    "status": "IN_PROGRESS",
+                    "offset": 67108864,
+                    "checksum": 2917346520,
+                },
+            }
+        }
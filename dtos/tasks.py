@@ -1,4 +1,6 @@
+from datetime import datetime
 from enum import Enum
+from typing import Dict
 
 from pydantic import BaseModel
 
@@ -13,12 +15,106 @@ class TaskStatus(str, Enum):
     DOWNLOADED = "DOWNLOADED"
 
 
+class ProcessingEngine(str, Enum):
+    # Splits the input file into partition files and aggregates each one of them.
+    PARTITION = "PARTITION"
+    # Aggregates in memory up to a memory budget, spilling the partial aggregates to disk when it is exceeded.
+    EXTERNAL = "EXTERNAL"
+    # Runs the whole job as a single lazy polars query executed by the streaming engine.
+    STREAMING = "STREAMING"
+    # Reads and aggregates the whole file in memory, in a single pass.
+    IN_MEMORY = "IN_MEMORY"
+    # Lets a planner choose between IN_MEMORY and PARTITION from the file size and a sample of its rows.
+    AUTO = "AUTO"
+
+
+class ProcessingStage(str, Enum):
+    # Sampling the input file to choose the engine (AUTO engine).
+    PLANNING = "PLANNING"
+    # Reading and aggregating the input file in a single pass (IN_MEMORY and EXTERNAL engines).
+    READING = "READING"
+    # Splitting the input file into the partition groups (PARTITION engine).
+    SPLITTING = "SPLITTING"
+    # Aggregating the partition groups (PARTITION engine), or running the whole query (STREAMING engine).
+    AGGREGATING = "AGGREGATING"
+    # The result file is written.
+    DONE = "DONE"
+
+
+class TaskProgress(BaseModel):
+    stage: ProcessingStage
+    # Bytes of the input file read (of its decompressed stream, for compressed files), out of its size (unknown for
+    # compressed files), and rows parsed.
+    bytes_read: int = 0
+    total_bytes: int | None
+    rows_parsed: int = 0
+    # Partition groups aggregated, out of the groups of the partition manifest.
+    partitions_aggregated: int = 0
+    total_partitions: int | None
+    # Rows processed per second by the current stage, and its estimated remaining time in seconds.
+    throughput: float | None
+    eta: float | None
+
+
+class StageMetrics(BaseModel):
+    # Wall and CPU time of the stage in seconds. A stage run many times (e.g. once per chunk, possibly by many threads
+    # at once) adds up the time of its runs, and only counts the CPU time of the threads running it then.
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+    runs: int = 0
+    # Bytes read and written by the stage, and the partition groups (or fragments) it read or wrote.
+    bytes_in: int = 0
+    bytes_out: int = 0
+    partitions: int = 0
+    # Highest RSS of the worker process sampled at the end of the runs of the stage, in bytes.
+    peak_rss: int | None
+
+
+class ProcessingPlan(BaseModel):
+    # The engine chosen by the planner, and the estimates it was chosen from.
+    engine: ProcessingEngine
+    file_size: int
+    estimated_rows: int
+    estimated_groups: int
+    estimated_memory: int
+
+
+class SplitCheckpoint(BaseModel):
+    # Offset of the input file (of its decompressed stream, for compressed files) up to which every row was split,
+    # and the number of chunks and rows split up to that offset.
+    offset: int
+    chunks: int
+    rows: int
+    # Name of the partition manifest saved with the checkpoint, inside the temporary directory of the task.
+    manifest_file: str
+    # Whether the whole input file was split.
+    completed: bool = False
+
+
 class Task(BaseModel):
     id: str
     status: TaskStatus = TaskStatus.QUEUED
     input_file_path: str | None
     output_file_path: str | None
     errors: ErrorsDict | None
+    # Overrides the engine configured for the worker, when set.
+    engine: ProcessingEngine | None
+    # Number of byte ranges split by separate subtasks when the task is distributed, and how many of them are done.
+    distributed_ranges: int | None
+    completed_ranges: int = 0
+    # The plan chosen for the AUTO engine.
+    plan: ProcessingPlan | None
+    # The last checkpoint of the split stage, a new attempt resumes from it.
+    checkpoint: SplitCheckpoint | None
+    # Number of attempts started (a worker may die midway), and the last time the task was updated.
+    attempts: int = 0
+    updated_at: datetime | None
+    # The last time the task was queued for processing.
+    queued_at: datetime | None
+    # The progress of the task, updated every few seconds while it is processed.
+    progress: TaskProgress | None
+    # Timing and memory metrics of every stage the task went through, keyed by the name of the stage.
+    metrics: Dict[str, StageMetrics] | None
 
     def mark_as_finished(self):
         self.input_file_path = None
@@ -29,8 +125,9 @@ class PublicTaskInfo(BaseModel):
     id: str
     status: TaskStatus
     errors: ErrorsDict | None
+    progress: TaskProgress | None
 
     @classmethod
     def from_task(cls, task: Task):
-        visible_fields = ("id", "status", "errors")
+        visible_fields = ("id", "status", "errors", "progress")
         return cls(**{field: getattr(task, field) for field in visible_fields})
@@ -0,0 +1,38 @@
+from datetime import datetime
+from enum import Enum
+
+from pydantic import BaseModel
+
+from dtos.tasks import ProcessingEngine
+
+
+class UploadStatus(str, Enum):
+    IN_PROGRESS = "IN_PROGRESS"
+    FINALIZED = "FINALIZED"
+    # Not finalized in time, its file was deleted.
+    EXPIRED = "EXPIRED"
+
+
+class Upload(BaseModel):
+    id: str
+    file_path: str
+    status: UploadStatus = UploadStatus.IN_PROGRESS
+    # Bytes received so far, which is also the offset of the next chunk, and their running crc32.
+    offset: int = 0
+    checksum: int = 0
+    # The engine of the task created once the upload is finalized.
+    engine: ProcessingEngine | None
+    # When the upload was started or its last chunk written, uploads left IN_PROGRESS for too long expire.
+    updated_at: datetime | None
+
+
+class PublicUploadInfo(BaseModel):
+    id: str
+    status: UploadStatus
+    offset: int
+    checksum: int
+
+    @classmethod
+    def from_upload(cls, upload: Upload):
+        visible_fields = ("id", "status", "offset", "checksum")
+        return cls(**{field: getattr(upload, field) for field in visible_fields})
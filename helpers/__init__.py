@@ -1,10 +1,32 @@
+from .compression import CSV_SUFFIXES, get_compression, open_input_file
+from .csv_reader import CSVChunk, CSVChunkReader, split_file_into_byte_ranges
 from .files import (
+    append_files_to_file,
+    append_ipc_file_to_csv_file,
     enforce_directory_creation,
+    get_directory_size,
     make_output_file_path,
+    read_ipc_record_batches,
     remove_tmp_dir_and_files,
-    save_dataframe_to_group_file,
+    save_dataframe_to_fragment,
+    save_dataframes_to_ipc_file,
+    scan_group_fragments,
     write_dataframe_to_file,
     write_rows_to_an_opened_file,
 )
-from .parallel_execution import execute_in_thread_pool
-from .strings import remove_non_alphanumeric_chars
+from .memory import (
+    ChunkSizeController,
+    get_memory_limit,
+    get_rss_bytes,
+    get_task_memory_limit,
+)
+from .parallel_execution import (
+    BoundedExecutor,
+    MemoryBudget,
+    configure_executors,
+    execute_in_process_pool,
+    execute_in_thread_pool,
+    get_executor,
+    iterate_in_background,
+    wait_for_futures,
+)
@@ -0,0 +1,68 @@
+import gzip
+import io
+from pathlib import Path
+from typing import BinaryIO, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Suffixes of the supported csv files, compressed or not.
+CSV_SUFFIXES: Tuple[str, ...] = (".csv", ".csv.gz", ".csv.zst")
+# Size of the buffer of the decompressed stream, large enough to peek at a sample of rows.
+DECOMPRESSION_BUFFER_SIZE = 1024**2
+
+
+def get_compression(file_path: Path | str) -> str | None:
+    """
+    Get the compression of a file from its suffix.
+
+    Args:
+        file_path (Path | str): The file.
+
+    Returns:
+        str | None: "gzip", "zstd" or None for an uncompressed file.
+    """
+    suffix = Path(file_path).suffix.lower()
+    if suffix == ".gz":
+        return "gzip"
+
+    if suffix == ".zst":
+        return "zstd"
+
+    return None
+
+
+def open_input_file(file_path: Path | str) -> BinaryIO:
+    """
+    Open a (possibly compressed) file for reading, decompressing it on the fly.
+
+    The decompressed stream is never written anywhere, and only `DECOMPRESSION_BUFFER_SIZE` bytes of it are buffered.
+    Compressed streams cannot seek (cheaply), they must be read sequentially, but support `peek`.
+
+    Args:
+        file_path (Path | str): The file.
+
+    Raises:
+        RuntimeError: For a zstd file when the `zstandard` package is not installed.
+
+    Returns:
+        BinaryIO: The (decompressed) binary stream.
+
+    Example:
+        >>> with open_input_file("input.csv.gz") as file:
+        ...     header = file.readline()
+    """
+    compression = get_compression(file_path)
+    if compression is None:
+        return open(file_path, "rb")
+
+    if compression == "gzip":
+        return io.BufferedReader(gzip.open(file_path, "rb"), buffer_size=DECOMPRESSION_BUFFER_SIZE)  # type: ignore
+
+    if zstandard is None:
+        raise RuntimeError("Reading zstd files requires the 'zstandard' package.")
+
+    reader = zstandard.ZstdDecompressor().stream_reader(open(file_path, "rb"), closefd=True)
+    return io.BufferedReader(reader, buffer_size=DECOMPRESSION_BUFFER_SIZE)  # type: ignore
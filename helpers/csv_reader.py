@@ -0,0 +1,170 @@
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Tuple
+
+import polars as pl
+from polars.type_aliases import PolarsDataType
+
+from helpers.compression import get_compression, open_input_file
+from helpers.memory import ChunkSizeController
+
+
+class CSVChunk(NamedTuple):
+    dataframe: pl.DataFrame
+    # Byte offsets of the chunk in the file, `end` is exclusive.
+    start: int
+    end: int
+
+
+class CSVChunkReader:
+    """
+    Reads a csv file in chunks of whole rows.
+
+    Each chunk is a block of raw bytes extended up to the end of its last row and parsed (with multiple threads) by
+    the polars csv parser straight into Arrow memory, with the requested dtypes (e.g. categoricals are encoded while
+    parsing). There is neither an intermediate pandas dataframe nor a conversion step between two representations.
+
+    The number of bytes read for each chunk is derived from `chunk_size` (in rows) and the average size of the rows
+    seen so far. With a `chunk_size_controller`, `chunk_size` is adapted after every chunk to the memory the rows
+    really take once parsed (see `ChunkSizeController`). Chunks also carry their byte offsets, so a byte range of the file can be read on its own through
+    `start` and `end` (which must be aligned on row boundaries).
+
+    Compressed files (`.csv.gz`, `.csv.zst`) are decompressed on the fly while reading, the offsets of their chunks
+    are offsets in the decompressed stream, which is only read sequentially: they can be read from a `start` (the
+    rows before it are decompressed and skipped, but not parsed) but not up to an `end`.
+
+    Note:
+        Rows are assumed not to contain quoted line breaks.
+
+    Example:
+        >>> reader = CSVChunkReader("input.csv", dtypes={"Song": pl.Categorical}, chunk_size=2_000_000)
+        >>> for chunk in reader:
+        ...     print(chunk.start, chunk.end, chunk.dataframe.height)
+    """
+
+    SAMPLE_SIZE = 64 * 1024
+    SKIP_BLOCK_SIZE = 1024**2
+
+    def __init__(
+        self,
+        file_path: Path | str,
+        *,
+        dtypes: Dict[str, PolarsDataType],
+        chunk_size: int | None,
+        start: int | None = None,
+        end: int | None = None,
+        chunk_size_controller: ChunkSizeController | None = None,
+    ):
+        self.file_path = file_path
+        self.dtypes = dtypes
+        self.chunk_size = chunk_size
+        self.start = start
+        self.end = end
+        self.chunk_size_controller = chunk_size_controller
+        self.bytes_read = 0
+        self.rows_read = 0
+        self.column_names: List[str] = []
+
+    def __iter__(self) -> Iterator[CSVChunk]:
+        compressed = get_compression(self.file_path) is not None
+        if compressed and self.end is not None:
+            raise ValueError("Compressed files cannot be read up to an end offset.")
+
+        with open_input_file(self.file_path) as file:
+            header = file.readline()
+            self.column_names = pl.read_csv(header).columns
+
+            position = max(self.start or 0, len(header))
+            # The end of a compressed file is only known once it is reached.
+            end = self.end if self.end is not None or compressed else file.seek(0, 2)
+            if compressed:
+                self._skip(file, position - len(header))
+
+            chunk_bytes = self._estimate_chunk_bytes(file, position)
+            if not compressed:
+                file.seek(position)
+
+            while end is None or position < end:
+                block = file.read(chunk_bytes if end is None else min(chunk_bytes, end - position))
+                if not block:
+                    break
+
+                if not block.endswith(b"\n"):
+                    # Complete the last row of the block.
+                    block += file.readline()
+
+                chunk = CSVChunk(self._parse(block), start=position, end=position + len(block))
+                position = chunk.end
+                self.bytes_read += len(block)
+                self.rows_read += chunk.dataframe.height
+                del block
+
+                if self.chunk_size_controller is not None and self.chunk_size is not None:
+                    self.chunk_size = self.chunk_size_controller.update(chunk.dataframe, chunk.end - chunk.start)
+
+                yield chunk
+
+                chunk_bytes = self._estimate_chunk_bytes(file, position)
+
+    def _skip(self, file: BinaryIO, size: int) -> None:
+        while size > 0 and (block := file.read(min(size, self.SKIP_BLOCK_SIZE))):
+            size -= len(block)
+
+    def _parse(self, block: bytes) -> pl.DataFrame:
+        return pl.read_csv(block, has_header=False, new_columns=self.column_names, dtypes=self.dtypes)
+
+    def _estimate_chunk_bytes(self, file: BinaryIO, position: int) -> int:
+        if self.chunk_size is None:
+            # The whole range in a single chunk, or the whole file (-1 reads up to its end).
+            return self.end - position if self.end is not None else -1
+
+        if self.rows_read:
+            average_row_size = self.bytes_read / self.rows_read
+
+        else:
+            # Nothing read yet, sample the rows right after the current position.
+            if file.seekable() and get_compression(self.file_path) is None:
+                file.seek(position)
+                sample = file.read(self.SAMPLE_SIZE)
+            else:
+                sample = file.peek(self.SAMPLE_SIZE)[: self.SAMPLE_SIZE]  # type: ignore
+            average_row_size = len(sample) / max(sample.count(b"\n"), 1)
+
+        return max(int(self.chunk_size * average_row_size), 1)
+
+
+def split_file_into_byte_ranges(
+    file_path: Path | str, num_ranges: int, *, min_range_size: int = 1
+) -> List[Tuple[int, int]]:
+    """
+    Split the rows of a csv file (skipping its header) into byte ranges aligned on row boundaries.
+
+    Args:
+        file_path (Path | str): The csv file.
+        num_ranges (int): The maximum number of ranges.
+        min_range_size (int, optional): The minimum size of each range in bytes, fewer ranges are returned for small
+            files. Defaults to 1.
+
+    Returns:
+        List[Tuple[int, int]]: The (start, end) offsets of each non-empty range, `end` is exclusive.
+
+    Example:
+        >>> split_file_into_byte_ranges("input.csv", 4)
+        [(26, 262170), (262170, 524310), (524310, 786452), (786452, 1048576)]
+    """
+    with open(file_path, "rb") as file:
+        start = len(file.readline())
+        file_size = file.seek(0, 2)
+
+        num_ranges = max(1, min(num_ranges, (file_size - start) // max(min_range_size, 1)))
+        range_size = (file_size - start) // num_ranges
+
+        boundaries = [start]
+        for _ in range(num_ranges - 1):
+            file.seek(max(boundaries[-1] + range_size, boundaries[-1]))
+            # Move the boundary to the start of the next row.
+            file.readline()
+            boundaries.append(min(file.tell(), file_size))
+
+        boundaries.append(file_size)
+
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
@@ -1,13 +1,14 @@
+import errno
 import os
 import shutil
 import threading
 from pathlib import Path
-from typing import Literal, TextIO, Tuple
+from typing import Dict, Iterable, List, Literal, Sequence, TextIO, Tuple
 
+import polars as pl
+import pyarrow as pa
 from polars import DataFrame
 
-import helpers.strings as string_helper
-
 
 def write_rows_to_an_opened_file(rows: str, file: TextIO, lock: threading.Lock) -> None:
     """
@@ -65,34 +66,209 @@ def write_dataframe_to_file(
             write_rows_to_an_opened_file(rows, f, lock)
 
 
-def save_dataframe_to_group_file(
-    group: str | Tuple[str, str],
-    dataframe: DataFrame,
-    base_path: Path,
-    seen_groups: set,
-    lock: threading.Lock,
-) -> None:
+def append_ipc_file_to_csv_file(ipc_file: Path | str, file: TextIO, lock: threading.Lock) -> None:
     """
-    Save a DataFrame to a group file based on the specified group. The group can be a string or a tuple of strings.
+    Append the rows of an Arrow IPC file to an opened csv file, one record batch at a time, so the IPC file
+    never has to be fully loaded into memory.
 
     Args:
-        group (str | Tuple[str, str]): The group identifier.
-        dataframe (DataFrame): The DataFrame to be saved.
-        base_path (Path): The base path where the group files will be saved.
-        seen_groups (set): A set to keep track of seen groups to determine if a header should be added.
+        ipc_file (Path | str): The Arrow IPC file to read from.
+        file (TextIO): The opened csv file to write to.
         lock (threading.Lock): The lock object to ensure thread safety when writing to the file.
 
     Returns:
         None
     """
-    if isinstance(group, tuple):
-        group = "".join(group)
+    with pa.memory_map(str(ipc_file)) as source:
+        reader = pa.ipc.open_file(source)
+        for batch_index in range(reader.num_record_batches):
+            rows = pl.from_arrow(reader.get_batch(batch_index)).write_csv(file=None, has_header=False)
+            write_rows_to_an_opened_file(rows, file, lock)
+
+
+def append_files_to_file(source_files: Iterable[Path | str], file_path: Path | str) -> int:
+    """
+    Append the contents of the source files to the end of a file, in the given order.
+
+    The bytes are copied by the kernel (`copy_file_range`, falling back to `sendfile`), so they never go through a
+    Python buffer. If neither is supported (e.g. across some file systems) the files are copied with plain reads
+    and writes.
+
+    Args:
+        source_files (Iterable[Path | str]): The files to be appended.
+        file_path (Path | str): The file to append to, it must exist.
+
+    Returns:
+        int: The number of bytes appended.
+
+    Example:
+        >>> append_files_to_file(["part-1.csv", "part-2.csv"], "result.csv")
+        2048
+    """
+    copied = 0
+    # "a" mode cannot be used: `copy_file_range` refuses destinations opened with O_APPEND.
+    with open(file_path, "r+b") as destination:
+        destination.seek(0, os.SEEK_END)
+        for source_file in source_files:
+            with open(source_file, "rb") as source:
+                copied += _copy_file_contents(source.fileno(), destination.fileno())
+
+    return copied
+
+
+# Errors meaning that a zero-copy system call is not available for the given files.
+_ZERO_COPY_UNSUPPORTED_ERRORS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF, errno.EPERM}
+
+
+def _copy_file_contents(source_fd: int, destination_fd: int) -> int:
+    remaining = os.fstat(source_fd).st_size
+    copied = 0
+
+    for zero_copy in (_copy_file_range, _sendfile):
+        try:
+            while remaining > 0:
+                sent = zero_copy(source_fd, destination_fd, remaining)
+                if sent == 0:
+                    break
+                copied += sent
+                remaining -= sent
+            return copied
+
+        except OSError as error:
+            if error.errno not in _ZERO_COPY_UNSUPPORTED_ERRORS:
+                raise
+
+    # Both system calls advance the file offsets, so the plain copy resumes from where they stopped.
+    while chunk := os.read(source_fd, 1024**2):
+        os.write(destination_fd, chunk)
+        copied += len(chunk)
+
+    return copied
+
+
+def _copy_file_range(source_fd: int, destination_fd: int, count: int) -> int:
+    if not hasattr(os, "copy_file_range"):
+        raise OSError(errno.ENOSYS, "copy_file_range is not available")
+    return os.copy_file_range(source_fd, destination_fd, count)
+
+
+def _sendfile(source_fd: int, destination_fd: int, count: int) -> int:
+    return os.sendfile(destination_fd, source_fd, None, count)
+
+
+def save_dataframe_to_fragment(dataframe: DataFrame, directory: Path, fragment: str) -> Path:
+    """
+    Save a DataFrame as a new Arrow IPC fragment of a group directory.
+
+    Every group is a directory holding one fragment per write, so the fragments never have to be appended to
+    (or locked) and the whole group can be scanned lazily (and memory-mapped) with `polars.scan_ipc`.
+
+    Args:
+        dataframe (DataFrame): The DataFrame to be saved.
+        directory (Path): The group directory, it is created if it does not exist.
+        fragment (str): The fragment name, it must be unique within the group (e.g. the chunk offset).
+
+    Returns:
+        Path: The path to the fragment file.
+
+    Example:
+        >>> save_dataframe_to_fragment(df, Path("/tmp/task/5f0c6e0b"), fragment="000001")
+        PosixPath('/tmp/task/5f0c6e0b/000001.arrow')
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+
+    fragment_path = directory / f"{fragment}.arrow"
+    # Categorical columns would carry their whole dictionary (possibly every string of the chunk) into each
+    # fragment, plain strings keep the fragments as small as their own rows.
+    dataframe.with_columns(pl.col(pl.Categorical).cast(pl.Utf8)).write_ipc(fragment_path, compression="uncompressed")
+    return fragment_path
+
+
+def scan_group_fragments(group_dir: Path) -> pl.LazyFrame:
+    """
+    Lazily scan (memory-mapping) all the Arrow IPC fragments of a group directory.
+
+    Args:
+        group_dir (Path): The group directory.
+
+    Returns:
+        pl.LazyFrame: A lazy frame over the rows of every fragment of the group.
+    """
+    return pl.scan_ipc(group_dir / "*.arrow", memory_map=True)
+
+
+def save_dataframes_to_ipc_file(dataframes: Sequence[DataFrame], file_path: Path) -> Path:
+    """
+    Save DataFrames as the record batches of a single Arrow IPC file, one record batch per DataFrame in the given
+    order, so each of them can be read back on its own (see `read_ipc_record_batches`).
+
+    The DataFrames must share their schema, e.g. the partitions of the same chunk.
+
+    Args:
+        dataframes (Sequence[DataFrame]): The DataFrames to be saved.
+        file_path (Path): The path to the IPC file, its directory is created if it does not exist.
+
+    Returns:
+        Path: The path to the IPC file.
+
+    Example:
+        >>> save_dataframes_to_ipc_file([song_1, song_2], Path("/tmp/task/000000000000000.arrow"))
+        PosixPath('/tmp/task/000000000000000.arrow')
+    """
+    file_path.parent.mkdir(parents=True, exist_ok=True)
 
-    file_name = string_helper.remove_non_alphanumeric_chars(group)
-    has_header = group not in seen_groups
-    write_dataframe_to_file(dataframe, file=base_path / f"{file_name}.csv", has_header=has_header, lock=lock)
+    # Categorical columns would carry their whole dictionary (possibly every string of the chunk) into each
+    # record batch, plain strings keep the record batches as small as their own rows.
+    tables = [dataframe.with_columns(pl.col(pl.Categorical).cast(pl.Utf8)).to_arrow() for dataframe in dataframes]
+    schema = tables[0].schema if tables else pa.schema([])
+    with pa.OSFile(str(file_path), "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        for table in tables:
+            writer.write_batch(
+                pa.RecordBatch.from_arrays([column.combine_chunks() for column in table.columns], schema=schema)
+            )
 
-    seen_groups.add(group)
+    return file_path
+
+
+def read_ipc_record_batches(fragments: Iterable[Tuple[Path, int]]) -> pl.DataFrame:
+    """
+    Read record batches of Arrow IPC files (memory-mapped) into a single DataFrame.
+
+    Every file is opened once, however many of its record batches are read.
+
+    Args:
+        fragments (Iterable[Tuple[Path, int]]): The IPC files and the indexes of their record batches.
+
+    Returns:
+        pl.DataFrame: The rows of every record batch.
+    """
+    batch_indexes: Dict[Path, List[int]] = {}
+    for file_path, batch_index in fragments:
+        batch_indexes.setdefault(file_path, []).append(batch_index)
+
+    tables = []
+    for file_path, indexes in batch_indexes.items():
+        with pa.memory_map(str(file_path)) as source:
+            reader = pa.ipc.open_file(source)
+            tables.append(pa.Table.from_batches([reader.get_batch(index) for index in indexes], schema=reader.schema))
+
+    if not tables:
+        return pl.DataFrame()
+
+    return pl.from_arrow(pa.concat_tables(tables))
+
+
+def get_directory_size(directory: Path) -> int:
+    """
+    Get the total size, in bytes, of the files directly inside the directory.
+
+    Args:
+        directory (Path): The directory.
+
+    Returns:
+        int: The total size in bytes.
+    """
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
 
 
 def make_output_file_path(output_dir: Path | str, file_name: str, file_format: Literal["csv"] = "csv") -> Path:
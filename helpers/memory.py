@@ -0,0 +1,124 @@
+import os
+from pathlib import Path
+
+import polars as pl
+
+from logger import get_logger
+
+logger = get_logger(__file__)
+
+# Limits above this value mean "no limit" (cgroup v1 reports a huge number instead of "max").
+_UNLIMITED = 1 << 60
+
+
+def get_rss_bytes() -> int | None:
+    """
+    Get the current resident set size (RSS) of this process, read from `/proc/self/statm`.
+
+    Returns:
+        int | None: The RSS in bytes, or None if it cannot be read (e.g. not on Linux).
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            resident_pages = int(statm.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+
+    return resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def get_memory_limit() -> int | None:
+    """
+    Get the memory limit of the container (cgroup v2 or v1) this process runs in.
+
+    Returns:
+        int | None: The limit in bytes, or None if there is no limit (or it cannot be read).
+    """
+    for limit_file in (
+        Path("/sys/fs/cgroup/memory.max"),
+        Path("/sys/fs/cgroup/memory/memory.limit_in_bytes"),
+    ):
+        try:
+            limit = int(limit_file.read_text().strip())
+        except (OSError, ValueError):
+            # Missing file, or "max" (no limit).
+            continue
+
+        return limit if limit < _UNLIMITED else None
+
+    return None
+
+
+def get_task_memory_limit(memory_limit: int | None, concurrent_tasks: int) -> int | None:
+    """
+    Get the share of the memory limit of a task, when `concurrent_tasks` tasks are processed at once in the same
+    container (e.g. by the processes of a prefork celery worker).
+
+    Args:
+        memory_limit (int | None): The memory limit of the container in bytes, None if there is no limit.
+        concurrent_tasks (int): The tasks processed at once.
+
+    Returns:
+        int | None: The memory limit of a task in bytes, None if there is no limit.
+    """
+    if not memory_limit:
+        return None
+
+    return memory_limit // max(concurrent_tasks, 1)
+
+
+class ChunkSizeController:
+    """
+    Adapts the number of rows per chunk to a memory target.
+
+    After every chunk, the real size of its rows in memory (after parsing, e.g. with categoricals encoded, plus the
+    raw bytes they were parsed from) is measured and the next chunk size is the number of rows that fits in
+    `memory_target` bytes. When the RSS of the process gets above `HIGH_WATERMARK` of `memory_limit`, the chunk size
+    is halved again for every chunk read in that state, trading throughput for headroom instead of getting OOM
+    killed.
+
+    Example:
+        >>> controller = ChunkSizeController(2_000_000, memory_target=128 * 1024**2, memory_limit=1024**3)
+        >>> for chunk in reader:
+        ...     reader.chunk_size = controller.update(chunk.dataframe, chunk.end - chunk.start)
+    """
+
+    MIN_CHUNK_SIZE = 10_000
+    # Fraction of the memory limit above which the chunks shrink.
+    HIGH_WATERMARK = 0.8
+    # Lowest fraction of the memory target the chunks may shrink to.
+    MIN_SCALE = 1 / 64
+
+    def __init__(self, chunk_size: int, *, memory_target: int, memory_limit: int | None = None):
+        self.chunk_size = chunk_size
+        self.memory_target = memory_target
+        self.memory_limit = memory_limit
+        self.bytes_per_row: float | None = None
+        self._scale = 1.0
+
+    def update(self, dataframe: pl.DataFrame, raw_size: int = 0) -> int:
+        """
+        Measures the chunk just read and computes the size of the next one.
+
+        Args:
+            dataframe (pl.DataFrame): The chunk just read.
+            raw_size (int, optional): The size in bytes of the raw data the chunk was parsed from. Defaults to 0.
+
+        Returns:
+            int: The number of rows of the next chunk.
+        """
+        if dataframe.height:
+            self.bytes_per_row = (dataframe.estimated_size() + raw_size) / dataframe.height
+
+        rss = get_rss_bytes()
+        if self.memory_limit and rss is not None and rss > self.HIGH_WATERMARK * self.memory_limit:
+            self._scale = max(self._scale / 2, self.MIN_SCALE)
+            logger.warning(
+                f"RSS ({rss / 1024**2:.0f} MB) is close to the memory limit ({self.memory_limit / 1024**2:.0f} MB), "
+                f"shrinking the chunks to {self._scale:.3f} of the memory target."
+            )
+
+        if self.bytes_per_row:
+            self.chunk_size = max(int(self.memory_target * self._scale / self.bytes_per_row), self.MIN_CHUNK_SIZE)
+
+        return self.chunk_size
@@ -1,30 +1,383 @@
 import concurrent.futures
-from typing import Callable, List, Tuple
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Tuple,
+    TypeVar,
+)
 
+from logger import get_logger
 
-def execute_in_thread_pool(fn: Callable, args_list: List[Tuple]) -> None:
+logger = get_logger(__file__)
+
+T = TypeVar("T")
+ExecutorKind = Literal["thread", "process"]
+
+# Settings of the shared executors, see `configure_executors`.
+_EXECUTOR_SETTINGS: Dict[str, int] = {
+    "thread_workers": min(32, (os.cpu_count() or 1) + 4),
+    "process_workers": os.cpu_count() or 1,
+    "max_pending": 64,
+}
+_executors: Dict[ExecutorKind, "BoundedExecutor"] = {}
+_executors_lock = threading.Lock()
+_executors_pid = os.getpid()
+_worker_state = threading.local()
+
+
+class BoundedExecutor:
+    """
+    Wraps a thread or process pool, bounding the number of submitted calls that have not finished yet.
+
+    Once `max_pending` calls are pending, `submit` blocks until one of them finishes (backpressure), so the caller
+    never holds more than `max_pending` futures (and their arguments, e.g. dataframes) at the same time.
+
+    Example:
+        >>> executor = BoundedExecutor("thread", max_workers=4, max_pending=16)
+        >>> executor.map(pow, [(2, 3), (4, 5)])
+        [8, 1024]
+    """
+
+    def __init__(self, kind: ExecutorKind, *, max_workers: int, max_pending: int):
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pending = threading.BoundedSemaphore(max_pending)
+
+        if kind == "thread":
+            self._executor: concurrent.futures.Executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="shared-executor"
+            )
+        else:
+            # Forking a process that already runs the polars thread pool may deadlock.
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+    def submit(self, fn: Callable, *args: Any) -> concurrent.futures.Future:
+        """
+        Submits a call, blocking while `max_pending` calls are pending.
+
+        A call submitted from a worker of the shared thread pool is executed right away in the calling thread, since
+        waiting for a slot of the pool it is holding could deadlock.
+
+        Args:
+            fn (Callable): The function to be executed.
+            *args (Any): The arguments of the call.
+
+        Returns:
+            concurrent.futures.Future: The future of the call.
+        """
+        if self.kind == "thread" and getattr(_worker_state, "in_worker", False):
+            future: concurrent.futures.Future = concurrent.futures.Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as error:
+                future.set_exception(error)
+            return future
+
+        self._pending.acquire()
+        try:
+            if self.kind == "thread":
+                future = self._executor.submit(_run_in_worker, fn, *args)
+            else:
+                future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._pending.release()
+            raise
+
+        future.add_done_callback(lambda _: self._pending.release())
+        return future
+
+    def map(
+        self,
+        fn: Callable,
+        args_list: Iterable[Tuple],
+        *,
+        memory_budget: "MemoryBudget | None" = None,
+        weights: Iterable[int] | None = None,
+    ) -> List[Any]:
+        """
+        Executes the function for each argument tuple, stopping the submissions at the first exception.
+
+        With a `memory_budget`, every call is only submitted once its weight (the memory it is expected to use, in
+        bytes) fits in the budget, next to the calls still running. The calls are submitted in the given order.
+
+        Args:
+            fn (Callable): The function to be executed.
+            args_list (Iterable[Tuple]): The argument tuples to be passed to the function.
+            memory_budget (MemoryBudget | None, optional): The budget the calls are admitted under. Defaults to None.
+            weights (Iterable[int] | None, optional): The weight of each call, required with a `memory_budget`.
+
+        Raises:
+            Exception: The first exception raised by a call.
+
+        Returns:
+            List[Any]: The results of each call, in the same order of `args_list`.
+        """
+        failed = threading.Event()
+        futures = []
+        for args, weight in zip(args_list, weights if weights is not None else itertools.repeat(0)):
+            if failed.is_set():
+                break
+
+            if memory_budget is not None:
+                memory_budget.acquire(weight)
+
+            future = self.submit(fn, *args)
+            future.add_done_callback(lambda future: _failed(future) and failed.set())
+            if memory_budget is not None:
+                future.add_done_callback(lambda _, weight=weight: memory_budget.release(weight))
+            futures.append(future)
+
+        return wait_for_futures(futures)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+class MemoryBudget:
+    """
+    Admits work while the memory it is expected to use (its weight, in bytes) fits in a budget.
+
+    `acquire` blocks until the weight fits next to the weights acquired and not released yet. A single weight
+    larger than the whole budget is admitted once nothing else is in flight, so it runs alone instead of never.
+
+    Example:
+        >>> budget = MemoryBudget(256 * 1024**2)
+        >>> budget.acquire(64 * 1024**2)
+        >>> budget.release(64 * 1024**2)
+    """
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, weight: int) -> None:
+        with self._condition:
+            self._condition.wait_for(lambda: self.in_flight == 0 or self.in_flight + weight <= self.budget)
+            self.in_flight += weight
+
+    def release(self, weight: int) -> None:
+        with self._condition:
+            self.in_flight -= weight
+            self._condition.notify_all()
+
+
+def _run_in_worker(fn: Callable, *args: Any) -> Any:
+    _worker_state.in_worker = True
+    return fn(*args)
+
+
+def _failed(future: concurrent.futures.Future) -> bool:
+    return not future.cancelled() and future.exception() is not None
+
+
+def wait_for_futures(futures: List[concurrent.futures.Future]) -> List[Any]:
     """
-    Executes the given function in a thread pool with the provided arguments list.
+    Waits for the futures, cancelling the pending ones as soon as one of them raises an exception.
+
+    Args:
+        futures (List[concurrent.futures.Future]): The futures to be waited for.
+
+    Raises:
+        Exception: The first exception raised by a future.
+
+    Returns:
+        List[Any]: The results of the futures, in the same order.
+    """
+    concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_EXCEPTION)
+
+    for future in futures:
+        if future.done() and _failed(future):
+            for pending_future in futures:
+                pending_future.cancel()
+            raise future.exception()  # type: ignore
+
+    return [future.result() for future in futures]
+
+
+def configure_executors(
+    *, thread_workers: int | None = None, process_workers: int | None = None, max_pending: int | None = None
+) -> None:
+    """
+    Sets the size of the shared executors of this process. Executors already running with different settings are
+    shut down and created again on their next use.
+
+    Args:
+        thread_workers (int | None, optional): The number of threads of the shared thread pool.
+        process_workers (int | None, optional): The number of processes of the shared process pool.
+        max_pending (int | None, optional): The maximum number of pending calls of each executor.
+
+    Example:
+        >>> configure_executors(thread_workers=8, process_workers=4, max_pending=32)
+    """
+    settings = {"thread_workers": thread_workers, "process_workers": process_workers, "max_pending": max_pending}
+    with _executors_lock:
+        _EXECUTOR_SETTINGS.update({name: value for name, value in settings.items() if value is not None})
+        executors = list(_executors.values())
+        _executors.clear()
+
+    for executor in executors:
+        executor.shutdown()
+
+
+def get_executor(kind: ExecutorKind = "thread") -> BoundedExecutor:
+    """
+    Returns the shared executor of the given kind, creating it on its first use.
+
+    The executors live as long as the process (e.g. a celery worker), so their pools are not set up again for every
+    call. A forked child process (e.g. of a prefork celery worker) creates its own executors.
+
+    Args:
+        kind (Literal["thread", "process"], optional): The kind of pool. Defaults to "thread".
+
+    Returns:
+        BoundedExecutor: The shared executor.
+    """
+    global _executors_pid
+
+    with _executors_lock:
+        if _executors_pid != os.getpid():
+            # The pools inherited from the parent process do not have any worker in this process.
+            _executors.clear()
+            _executors_pid = os.getpid()
+
+        if kind not in _executors:
+            _executors[kind] = BoundedExecutor(
+                kind,
+                max_workers=_EXECUTOR_SETTINGS[f"{kind}_workers"],
+                max_pending=_EXECUTOR_SETTINGS["max_pending"],
+            )
+
+        return _executors[kind]
+
+
+def execute_in_thread_pool(
+    fn: Callable,
+    args_list: List[Tuple],
+    *,
+    memory_budget: MemoryBudget | None = None,
+    weights: List[int] | None = None,
+) -> List[Any]:
+    """
+    Executes the given function in the shared thread pool with the provided arguments list.
 
     Args:
         fn (Callable): The function to be executed in the thread pool.
         args_list (List[Tuple]): The list of argument tuples to be passed to the function.
+        memory_budget (MemoryBudget | None, optional): Admits the calls while their weights fit in the budget.
+            Defaults to None.
+        weights (List[int] | None, optional): The memory each call is expected to use, in bytes. Defaults to None.
 
     Raises:
         Exception: If any of the futures in the thread pool raises an exception.
 
     Returns:
-        None: This function does not return anything.
+        List[Any]: The results of each call, in the same order of `args_list`.
 
     Example:
         >>> def sum_numbers(x, y):
         ...     return x + y
         >>> execute_in_thread_pool(sum_numbers, [(2, 3), (4, 5), (6, 7)])
+        [5, 9, 13]
+    """
+    return get_executor("thread").map(fn, args_list, memory_budget=memory_budget, weights=weights)
+
+
+def execute_in_process_pool(fn: Callable, args_list: List[Tuple]) -> List[Any]:
     """
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = [executor.submit(fn, *args) for args in args_list]
-        concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_EXCEPTION)
+    Executes the given function in the shared process pool with the provided arguments list.
+
+    Daemonic processes (e.g. the children of a prefork celery worker) cannot start processes, in that case the
+    function is executed sequentially in the current process.
+
+    Args:
+        fn (Callable): The function to be executed in the process pool, it must be picklable.
+        args_list (List[Tuple]): The list of argument tuples to be passed to the function, they must be picklable.
+
+    Raises:
+        Exception: If any of the futures in the process pool raises an exception.
+
+    Returns:
+        List[Any]: The results of each call, in the same order of `args_list`.
+
+    Example:
+        >>> execute_in_process_pool(pow, [(2, 3), (4, 5)])
+        [8, 1024]
+    """
+    if multiprocessing.current_process().daemon:
+        logger.warning("Daemonic processes cannot start a process pool, executing sequentially instead.")
+        return [fn(*args) for args in args_list]
+
+    return get_executor("process").map(fn, args_list)
+
+
+def iterate_in_background(iterable: Iterable[T], max_queued: int = 1) -> Iterator[T]:
+    """
+    Iterates over the iterable in a background thread, keeping at most `max_queued` items ready ahead of the
+    consumer. Producing the next item (e.g. reading and parsing the next chunk) therefore overlaps with consuming the
+    current one, while the bounded queue makes the producer wait (backpressure) when the consumer is slower.
+
+    Args:
+        iterable (Iterable[T]): The iterable to be consumed in the background.
+        max_queued (int, optional): The maximum number of items produced but not consumed yet. Defaults to 1.
+
+    Raises:
+        Exception: Any exception raised by the iterable is raised again in the consumer.
+
+    Returns:
+        Iterator[T]: The items of the iterable, in the same order.
+
+    Example:
+        >>> for chunk in iterate_in_background(reader, max_queued=2):
+        ...     process(chunk)
+    """
+    items: queue.Queue = queue.Queue(maxsize=max_queued)
+    stopped = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except BaseException as error:
+            put((done, error))
 
-        for future in futures:
-            if future.exception() is not None:
-                raise future.exception()
+    producer = threading.Thread(target=produce, name="background-iterator", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+            del item
+    finally:
+        # Unblocks the producer if the consumer stopped early.
+        stopped.set()
+        producer.join()
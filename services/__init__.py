@@ -1,3 +1,4 @@
 from .check_task_status import CheckTaskStatusService
+from .chunked_upload import ChunkedUploadService
 from .create_task import CreateTaskService
 from .download_task_result import DownloadTaskResultService
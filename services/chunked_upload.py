@@ -0,0 +1,213 @@
+import contextlib
+import fcntl
+import uuid
+import zlib
+from http import HTTPStatus
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, Protocol, Tuple
+
+from flask import Request
+
+import dtos
+from background_tasks.planning import estimate_csv_size
+from background_tasks.tasks import process_csv
+from services.create_task import CreateTaskDAO
+from services.mixins import (
+    BuildNextMixin,
+    FileExtensionMixin,
+    ParseEngineMixin,
+    QueueRoutingMixin,
+)
+
+from app.api import exceptions
+
+
+class UploadDAO(Protocol):
+    def create_upload(self, upload_id: str, file_path: str, engine: dtos.ProcessingEngine | None = None) -> dtos.Upload:
+        ...
+
+    def get_upload(self, upload_id: str) -> dtos.Upload:
+        ...
+
+    def advance_upload(self, upload_id: str, *, offset: int, new_offset: int, checksum: int) -> dtos.Upload | None:
+        ...
+
+    def finalize_upload(self, upload_id: str) -> dtos.Upload | None:
+        ...
+
+
+class ChunkedUploadService(BuildNextMixin, FileExtensionMixin, ParseEngineMixin, QueueRoutingMixin):
+    """
+    Resumable upload of a file in chunks, written straight to its final path.
+
+    An upload session is started first, then the file is sent in order by PUT requests of any size, each one with the
+    `Upload-Offset` header holding the offset of its first byte. The body of a chunk is streamed to the file (there
+    is no multipart parsing nor temporary copy) and the offset and running crc32 of the upload are only moved
+    forward once the whole chunk was written. After a disconnect, the client reads the offset of the upload (GET or
+    HEAD) and resends the file from there. Finalizing the upload (optionally checking its crc32) creates and queues
+    the processing task, using the file in place.
+
+    Chunks of an upload must be sent one at a time: every write to the file (and the finalization) holds an exclusive
+    lock on it, so a request overlapping another one on the same upload (e.g. a retry after a timeout) is rejected
+    with a conflict instead of interleaving its bytes with the other one.
+
+    Example:
+        >>> service = ChunkedUploadService(request, uploads_dao, tasks_dao, upload_folder=upload_folder)
+        >>> service.upload_chunk(upload_id)
+        ({'upload': {'id': '...', 'status': 'IN_PROGRESS', 'offset': 67108864, ...}, ...}, 200, {...})
+    """
+
+    OFFSET_HEADER = "Upload-Offset"
+    BLOCK_SIZE = 1024**2
+
+    def __init__(
+        self,
+        request: Request,
+        dao: UploadDAO,
+        tasks_dao: CreateTaskDAO,
+        *,
+        upload_folder: Path,
+        heavy_task_size: int = 0,
+        light_queue: str = "light",
+        heavy_queue: str = "heavy",
+    ):
+        self.request = request
+        self.dao = dao
+        self.tasks_dao = tasks_dao
+        self.upload_folder = upload_folder
+        self.heavy_task_size = heavy_task_size
+        self.light_queue = light_queue
+        self.heavy_queue = heavy_queue
+
+    def start_upload(self) -> Tuple[Dict, int, Dict]:
+        data = self.request.get_json(silent=True) or {}
+        file_extension = self.get_file_extension_from_filename(data.get("filename"))
+        engine = self.parse_engine(data.get("engine"))
+
+        upload_id = str(uuid.uuid4())
+        file_path = self.upload_folder / f"{upload_id}.{file_extension}"
+        file_path.touch()
+
+        upload = self.dao.create_upload(upload_id=upload_id, file_path=str(file_path), engine=engine)
+        return self.build_upload_response(upload, HTTPStatus.CREATED)
+
+    def upload_chunk(self, upload_id: str) -> Tuple[Dict, int, Dict]:
+        upload = self.dao.get_upload(upload_id)
+        offset = self.get_offset_from_request()
+        self.check_offset(upload, offset)
+
+        with self.lock_upload_file(upload) as f:
+            # Another chunk may have been written between the first check and the lock.
+            upload = self.dao.get_upload(upload_id)
+            self.check_offset(upload, offset)
+
+            checksum = upload.checksum
+            f.seek(offset)
+            while block := self.request.stream.read(self.BLOCK_SIZE):
+                f.write(block)
+                checksum = zlib.crc32(block, checksum)
+
+            # Drop whatever a chunk interrupted after this offset had written.
+            f.truncate()
+            new_offset = f.tell()
+            advanced_upload = self.dao.advance_upload(
+                upload_id, offset=offset, new_offset=new_offset, checksum=checksum
+            )
+
+        if advanced_upload is None:
+            raise exceptions.ConflictAPIException(
+                details=[{"field": self.OFFSET_HEADER, "message": f"Another chunk was written at offset {offset}."}]
+            )
+
+        return self.build_upload_response(advanced_upload, HTTPStatus.OK)
+
+    def get_upload_status(self, upload_id: str) -> Tuple[Dict, int, Dict]:
+        return self.build_upload_response(self.dao.get_upload(upload_id), HTTPStatus.OK)
+
+    def finalize_upload(self, upload_id: str) -> Tuple[Dict, int]:
+        upload = self.dao.get_upload(upload_id)
+        self.check_in_progress(upload)
+        data = self.request.get_json(silent=True) or {}
+
+        # No chunk may be written while (nor after) the upload is finalized.
+        with self.lock_upload_file(upload):
+            upload = self.dao.get_upload(upload_id)
+            self.check_in_progress(upload)
+            if (checksum := data.get("checksum")) is not None and checksum != upload.checksum:
+                raise exceptions.BadRequestAPIException(
+                    details=[
+                        {
+                            "field": "checksum",
+                            "message": f"Checksum {checksum} does not match the upload ({upload.checksum}).",
+                        }
+                    ]
+                )
+
+            finalized_upload = self.dao.finalize_upload(upload_id)
+
+        if finalized_upload is None:
+            raise exceptions.ConflictAPIException(details=[{"upload": "Upload already finalized."}])
+
+        task = self.tasks_dao.create_new_task(
+            task_id=upload.id, input_file_path=finalized_upload.file_path, engine=finalized_upload.engine
+        )
+        process_csv.apply_async(args=(task.id,), queue=self.get_queue(estimate_csv_size(finalized_upload.file_path)))
+
+        response = dtos.TaskAPIResponse(task=dtos.PublicTaskInfo.from_task(task), next=self.build_next(task))
+        return response.dict(exclude_none=True), HTTPStatus.ACCEPTED
+
+    def get_file_extension_from_filename(self, filename: str | None) -> str:
+        if not filename:
+            raise exceptions.BadRequestAPIException(details=[{"field": "filename", "message": "No file name"}])
+
+        return self.get_file_extension(filename, "filename")
+
+    def get_offset_from_request(self) -> int:
+        offset = self.request.headers.get(self.OFFSET_HEADER, "")
+        if not offset.isdigit():
+            raise exceptions.BadRequestAPIException(
+                details=[{"field": self.OFFSET_HEADER, "message": "The offset of the chunk is missing or invalid."}]
+            )
+
+        return int(offset)
+
+    def check_in_progress(self, upload: dtos.Upload) -> None:
+        if upload.status == dtos.UploadStatus.EXPIRED:
+            raise exceptions.ConflictAPIException(details=[{"upload": "Upload expired, start a new one."}])
+
+        if upload.status != dtos.UploadStatus.IN_PROGRESS:
+            raise exceptions.ConflictAPIException(details=[{"upload": "Upload already finalized."}])
+
+    def check_offset(self, upload: dtos.Upload, offset: int) -> None:
+        self.check_in_progress(upload)
+        if offset != upload.offset:
+            raise exceptions.ConflictAPIException(
+                details=[{"field": self.OFFSET_HEADER, "message": f"Expected offset {upload.offset}, got {offset}."}]
+            )
+
+    @contextlib.contextmanager
+    def lock_upload_file(self, upload: dtos.Upload) -> Iterator[BinaryIO]:
+        """
+        Opens the file of the upload holding an exclusive lock on it (`flock`, shared by every worker process of the
+        host), released once the file is closed.
+
+        Raises:
+            ConflictAPIException: If another request holds the lock.
+        """
+        with open(upload.file_path, "r+b") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise exceptions.ConflictAPIException(
+                    details=[{"upload": "Another request is writing to the upload, retry once it is done."}]
+                )
+
+            yield f
+
+    def build_upload_response(self, upload: dtos.Upload, status: HTTPStatus) -> Tuple[Dict, int, Dict]:
+        next_endpoint = None
+        if upload.status == dtos.UploadStatus.IN_PROGRESS:
+            next_endpoint = f"/api/v1/file-processing/uploads/{upload.id}"
+
+        response = dtos.UploadAPIResponse(upload=dtos.PublicUploadInfo.from_upload(upload), next=next_endpoint)
+        return response.dict(exclude_none=True), status, {self.OFFSET_HEADER: str(upload.offset)}
@@ -1,43 +1,99 @@
 import uuid
 from http import HTTPStatus
 from pathlib import Path
-from typing import Dict, Literal, Protocol, Tuple
+from typing import Dict, Protocol, Tuple
 
 from flask import Request
 from werkzeug.datastructures import FileStorage
 
 import dtos
+from background_tasks.planning import estimate_csv_size
 from background_tasks.tasks import process_csv
-from services.mixins import BuildNextMixin
+from services.mixins import (
+    BuildNextMixin,
+    FileExtensionMixin,
+    ParseEngineMixin,
+    QueueRoutingMixin,
+)
 
 from app.api import exceptions
 
 
 class CreateTaskDAO(Protocol):
-    def create_new_task(self, task_id: str, input_file_path: str) -> dtos.Task:
+    def create_new_task(
+        self, task_id: str, input_file_path: str, engine: dtos.ProcessingEngine | None = None
+    ) -> dtos.Task:
         ...
 
+    def get_task(self, task_id: str) -> dtos.Task:
+        ...
 
-class CreateTaskService(BuildNextMixin):
-    ALLOWED_EXTENSIONS: Tuple[Literal["csv"]] = ("csv",)
 
-    def __init__(self, request: Request, dao: CreateTaskDAO, *, upload_folder: Path, download_folder: Path):
+class CreateTaskService(BuildNextMixin, FileExtensionMixin, ParseEngineMixin, QueueRoutingMixin):
+    def __init__(
+        self,
+        request: Request,
+        dao: CreateTaskDAO,
+        *,
+        upload_folder: Path,
+        download_folder: Path,
+        inline_max_size: int = 0,
+        heavy_task_size: int = 0,
+        light_queue: str = "light",
+        heavy_queue: str = "heavy",
+    ):
         self.request = request
         self.dao = dao
         self.upload_folder = upload_folder
         self.download_folder = download_folder
+        # Uploads up to this size (in bytes) are processed inline, within the request, 0 disables it.
+        self.inline_max_size = inline_max_size
+        self.heavy_task_size = heavy_task_size
+        self.light_queue = light_queue
+        self.heavy_queue = heavy_queue
         self.task_id = str(uuid.uuid4())
 
     def create_task(self) -> Tuple[Dict, int]:
         csv_file = self.get_file_from_request()
+        engine = self.get_engine_from_request()
 
-        input_file_path = self.upload_folder / f"{self.task_id}.csv"
+        # Compressed files are kept compressed, they are decompressed on the fly while being processed.
+        input_file_path = self.upload_folder / f"{self.task_id}.{self.get_file_extension(csv_file.filename, 'file')}"
 
         csv_file.save(input_file_path)
 
-        task = self.dao.create_new_task(task_id=self.task_id, input_file_path=str(input_file_path))
+        task = self.dao.create_new_task(task_id=self.task_id, input_file_path=str(input_file_path), engine=engine)
+
+        # The thresholds apply to the csv, a compressed upload may be many times larger once decompressed.
+        csv_size = estimate_csv_size(input_file_path)
+        if self.inline_max_size and csv_size <= self.inline_max_size:
+            return self.process_inline(task, csv_size)
+
+        return self.queue_task(task, csv_size)
+
+    def process_inline(self, task: dtos.Task, csv_size: int) -> Tuple[Dict, int]:
+        """
+        Small files take less time to process than the round trip through the queue, the task is processed right away
+        (still recorded as any other task, but never distributed) and the response links to its result.
+
+        A task that failed is returned with its errors (HTTP status 422), and one that could not be processed at all
+        (e.g. the database was unreachable) is queued as usual.
+        """
+        process_csv.apply(args=(task.id,), kwargs={"distribute": False})
+        processed_task = self.dao.get_task(task.id)
+        response = dtos.TaskAPIResponse(
+            task=dtos.PublicTaskInfo.from_task(processed_task), next=self.build_next(processed_task)
+        )
+        if processed_task.status == dtos.TaskStatus.COMPLETED:
+            return response.dict(exclude_none=True), HTTPStatus.OK
+
+        if processed_task.status == dtos.TaskStatus.FAILED:
+            return response.dict(exclude_none=True), HTTPStatus.UNPROCESSABLE_ENTITY
+
+        return self.queue_task(processed_task, csv_size)
 
-        process_csv.delay(task.id)
+    def queue_task(self, task: dtos.Task, csv_size: int) -> Tuple[Dict, int]:
+        process_csv.apply_async(args=(task.id,), queue=self.get_queue(csv_size))
         response = dtos.TaskAPIResponse(
             task=dtos.PublicTaskInfo.from_task(task), next=f"/api/v1/file-processing/tasks/{task.id}/status"
         )
@@ -54,9 +110,9 @@ class CreateTaskService(BuildNextMixin):
         if file.filename == "":
             raise exceptions.BadRequestAPIException(details=[{"field": "file", "message": "No file selected"}])
 
-        if file and (file_extension := file.filename.rsplit(".", 1)[1].lower()) not in self.ALLOWED_EXTENSIONS:
-            raise exceptions.BadRequestAPIException(
-                details=[{"field": "file", "message": f"File extension '{file_extension}' not supported."}]
-            )
+        self.get_file_extension(file.filename, "file")
 
         return file
+
+    def get_engine_from_request(self) -> dtos.ProcessingEngine | None:
+        return self.parse_engine(self.request.form.get("engine"))
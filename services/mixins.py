@@ -1,5 +1,9 @@
+from typing import Tuple
+
 import dtos
 
+from app.api import exceptions
+
 
 class BuildNextMixin:
     @staticmethod
@@ -18,3 +22,48 @@ class BuildNextMixin:
             return None
 
         return f"{base_uri}{endpoint}"
+
+
+class ParseEngineMixin:
+    @staticmethod
+    def parse_engine(engine: str | None) -> dtos.ProcessingEngine | None:
+        if not engine:
+            return None
+
+        try:
+            return dtos.ProcessingEngine(engine.upper())
+        except ValueError:
+            supported_engines = ", ".join(engine.value for engine in dtos.ProcessingEngine)
+            raise exceptions.BadRequestAPIException(
+                details=[
+                    {"field": "engine", "message": f"Engine '{engine}' not supported, use one of: {supported_engines}."}
+                ]
+            )
+
+
+class QueueRoutingMixin:
+    # Uploads of at least `heavy_task_size` bytes (of csv, see `estimate_csv_size`) are sent to `heavy_queue`, the
+    # others to `light_queue`.
+    heavy_task_size: int
+    light_queue: str
+    heavy_queue: str
+
+    def get_queue(self, file_size: int) -> str:
+        if self.heavy_task_size and file_size >= self.heavy_task_size:
+            return self.heavy_queue
+
+        return self.light_queue
+
+
+class FileExtensionMixin:
+    ALLOWED_EXTENSIONS: Tuple[str, ...] = ("csv", "csv.gz", "csv.zst")
+
+    def get_file_extension(self, filename: str, field: str) -> str:
+        for extension in self.ALLOWED_EXTENSIONS:
+            if filename.lower().endswith(f".{extension}"):
+                return extension
+
+        file_extension = filename.rsplit(".", 1)[-1].lower()
+        raise exceptions.BadRequestAPIException(
+            details=[{"field": field, "message": f"File extension '{file_extension}' not supported."}]
+        )
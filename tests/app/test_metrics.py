@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+
+import pytest
+from prometheus_client import REGISTRY
+from prometheus_client.parser import text_string_to_metric_families
+
+from dtos import Task, TaskStatus
+
+from app import create_app
+from app.extensions import metrics
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app("config.TestingConfig")
+    app.config.update(UPLOAD_FOLDER=tmp_path / "input", DOWNLOAD_FOLDER=tmp_path / "output")
+    app.config["UPLOAD_FOLDER"].mkdir()
+    app.config["DOWNLOAD_FOLDER"].mkdir()
+    return app
+
+
+def get_samples(response) -> dict:
+    return {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in text_string_to_metric_families(response.get_data(as_text=True))
+        for sample in family.samples
+    }
+
+
+def test_metrics_endpoint_exposes_the_latency_of_every_route(app):
+    client = app.test_client()
+    client.get("/metrics")
+
+    samples = get_samples(client.get("/metrics"))
+
+    labels = (("method", "GET"), ("route", "/metrics"), ("status", "200"))
+    assert samples[("csv_api_request_duration_seconds_count", labels)] >= 1
+
+
+def test_metrics_endpoint_exposes_the_disk_usage(app):
+    (app.config["UPLOAD_FOLDER"] / "task.csv").write_bytes(b"x" * 10)
+    (app.config["DOWNLOAD_FOLDER"] / "task.csv").write_bytes(b"x" * 20)
+    (app.config["DOWNLOAD_FOLDER"] / "task" / "group").mkdir(parents=True)
+    (app.config["DOWNLOAD_FOLDER"] / "task" / "group" / "000000000000000.arrow").write_bytes(b"x" * 30)
+    (app.config["DOWNLOAD_FOLDER"] / "task" / "manifest.json").write_bytes(b"x" * 40)
+
+    samples = get_samples(app.test_client().get("/metrics"))
+
+    assert samples[("csv_disk_usage_bytes", (("directory", "input"),))] == 10
+    assert samples[("csv_disk_usage_bytes", (("directory", "output"),))] == 20
+    assert samples[("csv_disk_usage_bytes", (("directory", "tmp"),))] == 70
+
+
+@pytest.mark.parametrize("status, observed", [(TaskStatus.QUEUED, True), (TaskStatus.IN_PROGRESS, False)])
+def test_queue_wait_of_a_task(status, observed):
+    count_before = REGISTRY.get_sample_value("csv_task_queue_wait_seconds_count")
+    sum_before = REGISTRY.get_sample_value("csv_task_queue_wait_seconds_sum")
+
+    metrics.observe_queue_wait(Task(id="task", status=status, queued_at=datetime.utcnow() - timedelta(seconds=30)))
+
+    assert REGISTRY.get_sample_value("csv_task_queue_wait_seconds_count") - count_before == int(observed)
+    assert (REGISTRY.get_sample_value("csv_task_queue_wait_seconds_sum") - sum_before >= 30) == observed
+
+
+def test_processed_file():
+    labels = {"engine": "EXTERNAL"}
+    bytes_before = REGISTRY.get_sample_value("csv_processed_bytes_total", labels) or 0
+    throughput_before = REGISTRY.get_sample_value("csv_processing_throughput_bytes_per_second_sum", labels) or 0
+
+    metrics.observe_processed_file("EXTERNAL", elapsed=2.0, input_bytes=64 * 1024**2, rows=1000)
+
+    assert REGISTRY.get_sample_value("csv_processed_bytes_total", labels) - bytes_before == 64 * 1024**2
+    throughput = REGISTRY.get_sample_value("csv_processing_throughput_bytes_per_second_sum", labels) - throughput_before
+    assert throughput == 32 * 1024**2
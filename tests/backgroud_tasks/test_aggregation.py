@@ -0,0 +1,50 @@
+import threading
+
+import polars as pl
+import pytest
+
+from background_tasks.aggregation import ExternalHashAggregator
+
+DTYPES = {"Song": pl.Categorical, "Date": pl.Categorical, "Number of Plays": pl.UInt32}
+
+
+def make_chunk(offset: int) -> pl.DataFrame:
+    return pl.DataFrame(
+        {
+            "Song": [f"Song {(offset + i) % 50}" for i in range(100)],
+            "Date": [f"2022-01-0{i % 3 + 1}" for i in range(100)],
+            "Number of Plays": list(range(100)),
+        },
+        schema_overrides=DTYPES,
+    )
+
+
+def aggregate(tmp_path, memory_budget: int) -> tuple:
+    tmp_path.mkdir(exist_ok=True)
+    aggregator = ExternalHashAggregator(tmp_path, memory_budget=memory_budget, num_partitions=4)
+    for offset in range(0, 500, 100):
+        aggregator.add(make_chunk(offset))
+
+    result_file = tmp_path / "result.csv"
+    with open(result_file, "a") as f:
+        aggregator.write_result(f, threading.Lock())
+
+    return sorted(result_file.read_text().splitlines()), aggregator.spill_count
+
+
+def test_aggregates_in_memory_when_the_budget_is_not_exceeded(tmp_path):
+    rows, spill_count = aggregate(tmp_path, memory_budget=1024**2)
+
+    assert spill_count == 0
+    assert len(rows) == 100
+    assert list(tmp_path.glob("run*")) == []
+
+
+@pytest.mark.parametrize("memory_budget", [1024, 1])
+def test_spilled_aggregates_match_the_in_memory_result(tmp_path, memory_budget):
+    expected_rows, _ = aggregate(tmp_path / "in_memory", memory_budget=1024**2)
+
+    rows, spill_count = aggregate(tmp_path / "spilled", memory_budget=memory_budget)
+
+    assert spill_count > 0
+    assert rows == expected_rows
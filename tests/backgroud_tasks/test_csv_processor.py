@@ -1,15 +1,23 @@
+import gzip
 import os
+import pstats
 import shutil
 from pathlib import Path
+from typing import Dict
 from unittest.mock import Mock
 
+import polars as pl
 import pytest
+import zstandard
 from pytest_mock import MockerFixture
 
+import helpers
 from background_tasks.csv_processor import CSVProcessor
 from background_tasks.exceptions import ProcessingError
+from background_tasks.manifest import PartitionManifest
+from background_tasks.splitting import PartitionSplitter
 from daos.mongo_db import MongoDAO, TasksMongoDAO
-from dtos import Task, TaskStatus
+from dtos import ProcessingEngine, Task, TaskStatus
 
 TASK_ID = "8bd7481e-1eb3-47e4-9b1f-a32b761b72eb"
 
@@ -24,6 +32,7 @@ def tmp_dir(tmp_path):
 def task_dao(mocker: MockerFixture, task):
     mock = mocker.Mock(spec=TasksMongoDAO)
     mock.get_task.return_value = task
+    mock.update_task.side_effect = lambda task: task
     return mock
 
 
@@ -59,9 +68,10 @@ def test_execute(task_dao, mocker: MockerFixture, task, tmp_dir):
     mocked_update_task.assert_has_calls(
         [
             mocker.call(status=TaskStatus.IN_PROGRESS),
-            mocker.call(status=TaskStatus.COMPLETED, output_file_path=fake_file_path),
+            mocker.call(status=TaskStatus.COMPLETED, output_file_path=fake_file_path, metrics=mocker.ANY),
         ]
     )
+    assert "validate" in mocked_update_task.call_args.kwargs["metrics"]
     mocked_validate_task.assert_called_once()
     mocked_process_task.assert_called_once()
 
@@ -109,3 +119,392 @@ def test_process_task(task_dao, mocker: MockerFixture, tmp_dir):
     assert file_path == fake_file_path
     mocked_split_file_into_multiple_tmp_files_by_name.assert_called_once()
     mocked_process_and_generate_result_file.assert_called_once()
+
+
+def read_result_rows(file_path: Path) -> list:
+    header, *rows = Path(file_path).read_text().splitlines()
+    assert header == "Song,Date,Total Number of Plays for Date"
+    return sorted(rows)
+
+
+@pytest.mark.parametrize(
+    "partitioning, engine",
+    [
+        ("song", ProcessingEngine.PARTITION),
+        ("hash", ProcessingEngine.PARTITION),
+        ("hash", ProcessingEngine.EXTERNAL),
+        ("hash", ProcessingEngine.STREAMING),
+        ("song", ProcessingEngine.IN_MEMORY),
+        ("song", ProcessingEngine.AUTO),
+    ],
+)
+def test_process_task_generates_the_aggregated_result_file(task_dao, tmp_dir, partitioning, engine):
+    with CSVProcessor(
+        task_id=TASK_ID,
+        dao=task_dao,  # type: ignore
+        output_dir=tmp_dir,
+        partitioning=partitioning,
+        num_buckets=4,
+        engine=engine,
+    ) as file_processor:
+        file_path = file_processor.process_task()
+
+    assert read_result_rows(file_path) == ["Song 1,2022-01-01,10", "Song 1,2022-01-02,15", "Song 2,2022-01-02,20"]
+
+
+def test_split_file_with_hash_partitioning_bounds_the_number_of_files(task_dao, task, tmp_dir):
+    rows = "".join(f"Song {i},2022-01-0{i % 3 + 1},{i}\n" for i in range(200))
+    Path(task.input_file_path).write_text(f"Song,Date,Number of Plays\n{rows}")
+
+    with CSVProcessor(
+        task_id=TASK_ID, dao=task_dao, output_dir=tmp_dir, partitioning="hash", num_buckets=8  # type: ignore
+    ) as file_processor:
+        manifest = file_processor.split_file_into_multiple_tmp_files_by_name()
+        chunk_files = list((tmp_dir / TASK_ID).glob("*.arrow"))
+
+    assert 0 < len(manifest) <= 8
+    # A single chunk, written to a single file whatever the number of groups.
+    assert len(chunk_files) == 1
+    assert manifest.rows == 200
+
+
+@pytest.mark.parametrize(
+    "partitioning, num_buckets, num_sub_partitions", [("name", 64, 16), ("hash", 0, 16), ("song", 64, 0)]
+)
+def test_invalid_partitioning_options(task_dao, tmp_dir, partitioning, num_buckets, num_sub_partitions):
+    with pytest.raises(ValueError):
+        CSVProcessor(
+            task_id=TASK_ID,
+            dao=task_dao,  # type: ignore
+            output_dir=tmp_dir,
+            partitioning=partitioning,
+            num_buckets=num_buckets,
+            num_sub_partitions=num_sub_partitions,
+        )
+
+
+def test_engine_set_on_the_task_takes_precedence(task_dao, task, tmp_dir):
+    task.engine = ProcessingEngine.STREAMING
+
+    file_processor = CSVProcessor(
+        task_id=TASK_ID, dao=task_dao, output_dir=tmp_dir, engine=ProcessingEngine.EXTERNAL  # type: ignore
+    )
+
+    assert file_processor.engine == ProcessingEngine.STREAMING
+
+
+@pytest.mark.parametrize("combine_chunks, expected_rows", [(True, 2), (False, 6)])
+def test_split_file_combines_repeated_pairs_of_a_chunk(task_dao, task, tmp_dir, combine_chunks, expected_rows):
+    rows = "Song 1,2022-01-01,10\nSong 1,2022-01-02,20\n" * 3
+    Path(task.input_file_path).write_text(f"Song,Date,Number of Plays\n{rows}")
+
+    with CSVProcessor(
+        task_id=TASK_ID, dao=task_dao, output_dir=tmp_dir, combine_chunks=combine_chunks  # type: ignore
+    ) as file_processor:
+        manifest = file_processor.split_file_into_multiple_tmp_files_by_name()
+        tmp_rows = helpers.read_ipc_record_batches(manifest.get_fragments([manifest.entries["Song 1"]])).height
+
+    assert tmp_rows == expected_rows
+
+
+@pytest.mark.parametrize("partitioning", ["song", "hash"])
+def test_process_task_with_multiple_split_workers(mocker: MockerFixture, task_dao, task, tmp_dir, partitioning):
+    mocker.patch.object(CSVProcessor, "MIN_BYTE_RANGE_SIZE", 1)
+    rows = "".join(f"Song {i % 7},2022-01-0{i % 3 + 1},{i}\n" for i in range(300))
+    Path(task.input_file_path).write_text(f"Song,Date,Number of Plays\n{rows}")
+    expected_rows = (
+        pl.read_csv(task.input_file_path)
+        .groupby("Song", "Date")
+        .agg(pl.sum("Number of Plays"))
+        .select(pl.concat_str(pl.all(), separator=","))
+        .to_series()
+        .to_list()
+    )
+
+    with CSVProcessor(
+        task_id=TASK_ID,
+        dao=task_dao,  # type: ignore
+        output_dir=tmp_dir,
+        chunk_size=20,
+        partitioning=partitioning,
+        split_workers=3,
+    ) as file_processor:
+        file_path = file_processor.process_task()
+
+    assert read_result_rows(file_path) == sorted(expected_rows)
+
+
+@pytest.mark.parametrize("partitioning", ["song", "hash"])
+def test_hot_groups_are_sub_partitioned(task_dao, task, tmp_dir, partitioning):
+    rows = "".join(f"Song {i % 2},2022-01-{i % 28 + 1:02d},{i}\n" for i in range(2000))
+    Path(task.input_file_path).write_text(f"Song,Date,Number of Plays\n{rows}")
+    expected_rows = (
+        pl.read_csv(task.input_file_path)
+        .groupby("Song", "Date")
+        .agg(pl.sum("Number of Plays"))
+        .select(pl.concat_str(pl.all(), separator=","))
+        .to_series()
+        .to_list()
+    )
+
+    with CSVProcessor(
+        task_id=TASK_ID,
+        dao=task_dao,  # type: ignore
+        output_dir=tmp_dir,
+        chunk_size=100,
+        partitioning=partitioning,
+        num_buckets=2,
+        combine_chunks=False,
+        hot_group_size=1,
+        num_sub_partitions=4,
+    ) as file_processor:
+        file_processor.split_file_into_multiple_tmp_files_by_name()
+        manifest = PartitionManifest.load(tmp_dir / TASK_ID)
+        file_path = file_processor.process_and_generate_result_file()
+
+    sub_partitions = {
+        (entry.group, fragment[2]) for entry in manifest for fragment in entry.fragments if fragment[2] is not None
+    }
+    assert 0 < len(sub_partitions) == sum(len(entry.sub_partitions) for entry in manifest) <= 2 * 4
+    assert read_result_rows(file_path) == sorted(expected_rows)
+
+
+def test_small_groups_spread_across_chunks_stay_cold(task_dao, task, tmp_dir):
+    # 1000 songs of 20 rows each, every chunk holding one row of every song.
+    rows = "".join(f"Song {i % 1000},2022-01-{i // 1000 + 1:02d},{i}\n" for i in range(20_000))
+    Path(task.input_file_path).write_text(f"Song,Date,Number of Plays\n{rows}")
+
+    with CSVProcessor(
+        task_id=TASK_ID,
+        dao=task_dao,  # type: ignore
+        output_dir=tmp_dir,
+        chunk_size=1000,
+        partitioning="song",
+        combine_chunks=False,
+        hot_group_size=4096,
+        num_sub_partitions=4,
+    ) as file_processor:
+        file_processor.split_file_into_multiple_tmp_files_by_name()
+        manifest = PartitionManifest.load(tmp_dir / TASK_ID)
+        chunk_files = list((tmp_dir / TASK_ID).glob("*.arrow"))
+
+    # A group is sized by its rows, not by the categorical dictionary every partition of a chunk shares.
+    assert len(manifest) == 1000
+    assert all(entry.rows == 20 and entry.bytes < 4096 for entry in manifest)
+    assert not any(entry.sub_partitions for entry in manifest)
+    # One file per chunk, not one per song and chunk.
+    assert len(chunk_files) == len({offset for entry in manifest for offset, _, _ in entry.fragments}) < 30
+
+
+def test_groups_with_colliding_names_are_kept_apart(task_dao, task, tmp_dir):
+    rows = "AC/DC,2022-01-01,10\nACDC,2022-01-01,20\n!!!,2022-01-01,5\n???,2022-01-01,7\n"
+    Path(task.input_file_path).write_text(f"Song,Date,Number of Plays\n{rows}")
+
+    with CSVProcessor(task_id=TASK_ID, dao=task_dao, output_dir=tmp_dir) as file_processor:  # type: ignore
+        file_path = file_processor.process_task()
+
+    assert read_result_rows(file_path) == sorted(
+        ["AC/DC,2022-01-01,10", "ACDC,2022-01-01,20", "!!!,2022-01-01,5", "???,2022-01-01,7"]
+    )
+
+
+@pytest.mark.parametrize("aggregation_batch_size", [0, 1024**2])
+def test_small_groups_are_aggregated_in_batches(task_dao, task, tmp_dir, aggregation_batch_size):
+    csv_path = Path(task.input_file_path)
+    rows = "".join(f"Song {song},2022-01-0{day},{song}\n" for song in range(20) for day in (1, 2, 1))
+    csv_path.write_text(f"Song,Date,Number of Plays\n{rows}")
+
+    with CSVProcessor(
+        task_id=TASK_ID,
+        dao=task_dao,  # type: ignore
+        output_dir=tmp_dir,
+        aggregation_batch_size=aggregation_batch_size,
+    ) as file_processor:
+        file_path = file_processor.process_task()
+        num_parts = len(list((tmp_dir / TASK_ID / "result-parts").iterdir()))
+
+    # One part file per pool thread at most, not one per batch.
+    assert 1 <= num_parts <= (helpers.get_executor("thread").max_workers if aggregation_batch_size == 0 else 1)
+    assert read_result_rows(file_path) == sorted(
+        f"Song {song},2022-01-0{day},{song * plays}" for song in range(20) for day, plays in ((1, 2), (2, 1))
+    )
+
+
+@pytest.mark.parametrize(
+    "in_memory_limit, expected_engine", [(1024**2, ProcessingEngine.IN_MEMORY), (0, "PARTITION")]
+)
+def test_auto_engine_records_the_plan_on_the_task(task_dao, task, tmp_dir, in_memory_limit, expected_engine):
+    with CSVProcessor(
+        task_id=TASK_ID,
+        dao=task_dao,  # type: ignore
+        output_dir=tmp_dir,
+        engine=ProcessingEngine.AUTO,
+        in_memory_limit=in_memory_limit,
+    ) as file_processor:
+        file_path = file_processor.process_task()
+
+    assert file_processor.engine == expected_engine
+    assert task.plan.engine == expected_engine
+    assert (task.plan.estimated_rows, task.plan.estimated_groups) == (3, 3)
+    assert read_result_rows(file_path) == ["Song 1,2022-01-01,10", "Song 1,2022-01-02,15", "Song 2,2022-01-02,20"]
+
+
+@pytest.mark.parametrize("suffix", [".csv.gz", ".csv.zst"])
+@pytest.mark.parametrize(
+    "engine",
+    [
+        ProcessingEngine.PARTITION,
+        ProcessingEngine.EXTERNAL,
+        ProcessingEngine.STREAMING,
+        ProcessingEngine.IN_MEMORY,
+        ProcessingEngine.AUTO,
+    ],
+)
+def test_process_task_with_a_compressed_input_file(task_dao, task, csv_file, tmp_dir, suffix, engine):
+    compressed_file = tmp_dir / f"test{suffix}"
+    content = csv_file.read_bytes()
+    compressed_file.write_bytes(
+        gzip.compress(content) if suffix == ".csv.gz" else zstandard.ZstdCompressor().compress(content)
+    )
+    task.input_file_path = str(compressed_file)
+
+    with CSVProcessor(
+        task_id=TASK_ID,
+        dao=task_dao,  # type: ignore
+        output_dir=tmp_dir,
+        num_buckets=4,
+        split_workers=2,
+        engine=engine,
+    ) as file_processor:
+        file_path = file_processor.process_task()
+
+    assert file_processor.is_input_compressed()
+    assert file_processor.engine != ProcessingEngine.STREAMING
+    assert read_result_rows(file_path) == ["Song 1,2022-01-01,10", "Song 1,2022-01-02,15", "Song 2,2022-01-02,20"]
+    # The bytes read are the decompressed ones, not the size of the compressed file.
+    assert file_processor.get_bytes_read() == len(content)
+    stages = file_processor.metrics.stages
+    assert stages["split" if "split" in stages else "aggregate"].bytes_in == len(content)
+
+
+def test_split_resumes_from_the_last_checkpoint_after_a_crash(mocker: MockerFixture, task_dao, task, tmp_dir):
+    rows = [(f"Song {i % 50}", f"2022-01-0{i % 3 + 1}", i) for i in range(3000)]
+    Path(task.input_file_path).write_text(
+        "Song,Date,Number of Plays\n" + "".join(f"{song},{date},{plays}\n" for song, date, plays in rows)
+    )
+    totals: Dict[str, int] = {}
+    for song, date, plays in rows:
+        totals[f"{song},{date}"] = totals.get(f"{song},{date}", 0) + plays
+
+    def start_attempt(task_id):
+        task.attempts += 1
+        return task
+
+    task_dao.start_attempt.side_effect = start_attempt
+    settings = dict(
+        output_dir=tmp_dir,
+        chunk_size=200,
+        partitioning="hash",
+        num_buckets=4,
+        combine_chunks=False,
+        checkpoint_interval=1,
+    )
+    partition = PartitionSplitter.partition
+
+    def partition_until_killed(splitter, dataframe):
+        if crashing_partition.call_count == 6:
+            raise MemoryError("Killed")
+        return partition(splitter, dataframe)
+
+    # The worker dies while partitioning the 6th chunk: `__exit__` never runs.
+    crashing_partition = mocker.patch.object(
+        PartitionSplitter, "partition", autospec=True, side_effect=partition_until_killed
+    )
+    file_processor = CSVProcessor(task_id=TASK_ID, dao=task_dao, **settings)  # type: ignore
+    assert file_processor.begin_attempt()
+    with pytest.raises(MemoryError):
+        file_processor.process_task()
+
+    checkpoint = task.checkpoint
+    assert (checkpoint.chunks, checkpoint.completed) == (5, False)
+    assert 0 < checkpoint.rows < len(rows)
+    # The fragments of chunks written after the last checkpoint (whatever their size) are discarded by the next
+    # attempt.
+    chunk_file = next((tmp_dir / TASK_ID).glob("*.arrow"))
+    shutil.copy(chunk_file, chunk_file.with_name(f"{checkpoint.offset + 1:015d}.arrow"))
+
+    mocker.stop(crashing_partition)
+    partition_spy = mocker.spy(PartitionSplitter, "partition")
+    with CSVProcessor(task_id=TASK_ID, dao=task_dao, **settings) as file_processor:  # type: ignore
+        assert file_processor.begin_attempt()
+        file_path = file_processor.process_task()
+
+    assert task.attempts == 2
+    # Only the chunks after the checkpoint were split again.
+    assert task.checkpoint.chunks == checkpoint.chunks + partition_spy.call_count
+    assert (task.checkpoint.rows, task.checkpoint.completed) == (len(rows), True)
+    assert read_result_rows(file_path) == sorted(f"{pair},{total}" for pair, total in totals.items())
+
+
+@pytest.mark.parametrize(
+    "engine, expected_stages",
+    [
+        (
+            ProcessingEngine.PARTITION,
+            {"validate", "split", "split_read", "split_partition", "split_write", "aggregate", "output"},
+        ),
+        (ProcessingEngine.EXTERNAL, {"validate", "aggregate", "output"}),
+        (ProcessingEngine.STREAMING, {"validate", "aggregate", "output"}),
+        (ProcessingEngine.AUTO, {"validate", "plan", "aggregate", "output"}),
+    ],
+)
+def test_stage_metrics_are_recorded_on_the_task(task_dao, task, csv_file, tmp_dir, engine, expected_stages):
+    with CSVProcessor(task_id=TASK_ID, dao=task_dao, output_dir=tmp_dir, engine=engine) as file_processor:  # type: ignore
+        file_processor.execute()
+
+    assert task.status == TaskStatus.COMPLETED
+    assert set(task.metrics) == expected_stages
+    assert all(stage.runs >= 1 and stage.wall_time >= 0 and stage.cpu_time >= 0 for stage in task.metrics.values())
+    assert task.metrics["aggregate"].bytes_in > 0
+    assert task.metrics["output"].bytes_out == os.path.getsize(task.output_file_path)
+
+
+def test_stage_metrics_of_the_partition_engine(task_dao, task, csv_file, tmp_dir):
+    with CSVProcessor(
+        task_id=TASK_ID, dao=task_dao, output_dir=tmp_dir, partitioning="song", keep_tmp_files=True  # type: ignore
+    ) as file_processor:
+        file_processor.execute()
+    manifest = PartitionManifest.load(tmp_dir / TASK_ID)
+
+    metrics = task.metrics
+    assert metrics["split"].bytes_in == os.path.getsize(csv_file)
+    # The rows read, without the header.
+    assert metrics["split_read"].bytes_in == metrics["split_partition"].bytes_in == os.path.getsize(csv_file) - 26
+    # One group, and one record batch, per song.
+    assert metrics["split"].partitions == metrics["split_partition"].partitions == 2
+    assert metrics["split_write"].partitions == metrics["aggregate"].partitions == 2
+    assert metrics["split_write"].bytes_out == sum(path.stat().st_size for path in (tmp_dir / TASK_ID).glob("*.arrow"))
+    assert metrics["aggregate"].bytes_in == sum(entry.bytes for entry in manifest) > 0
+    assert metrics["aggregate"].bytes_out + len(CSVProcessor.RESULT_FILE_HEADER) == metrics["output"].bytes_out
+
+
+def test_stage_metrics_are_recorded_on_failure(task_dao, task, csv_file, tmp_dir):
+    task.input_file_path = str(csv_file.with_suffix(".txt"))
+
+    with CSVProcessor(task_id=TASK_ID, dao=task_dao, output_dir=tmp_dir) as file_processor:  # type: ignore
+        file_processor.execute()
+
+    assert task.status == TaskStatus.FAILED
+    assert set(task.metrics) == {"validate"}
+
+
+def test_profile_dump(task_dao, task, csv_file, tmp_dir):
+    profile_dir = tmp_dir / "profiles"
+
+    with CSVProcessor(
+        task_id=TASK_ID, dao=task_dao, output_dir=tmp_dir, profile_dir=profile_dir  # type: ignore
+    ) as file_processor:
+        file_processor.execute()
+
+    assert task.status == TaskStatus.COMPLETED
+    assert "process_task" in str(pstats.Stats(str(profile_dir / f"{TASK_ID}.pstats")).stats)
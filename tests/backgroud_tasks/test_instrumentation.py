@@ -0,0 +1,86 @@
+import pstats
+import threading
+
+from background_tasks.instrumentation import Instrumentation, profile_to_file
+
+
+def test_runs_of_a_stage_add_up():
+    metrics = Instrumentation()
+
+    for _ in range(3):
+        with metrics.measure("split_write") as run:
+            run.bytes_out += 10
+            run.partitions += 1
+
+    stage = metrics.stages["split_write"]
+    assert stage.runs == 3
+    assert stage.bytes_out == 30
+    assert stage.partitions == 3
+    assert stage.wall_time > 0
+    assert stage.peak_rss is None or stage.peak_rss > 0
+
+
+def test_stages_measured_by_many_threads():
+    metrics = Instrumentation()
+
+    def write():
+        for _ in range(100):
+            with metrics.measure("split_write", threaded=True) as run:
+                run.bytes_out += 1
+
+    threads = [threading.Thread(target=write) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert metrics.stages["split_write"].runs == 400
+    assert metrics.stages["split_write"].bytes_out == 400
+
+
+def test_record_adds_counters_without_a_run():
+    metrics = Instrumentation()
+    with metrics.measure("aggregate"):
+        metrics.record("aggregate", bytes_in=100, bytes_out=20, partitions=2)
+        metrics.record("aggregate", bytes_in=50, bytes_out=10, partitions=1)
+
+    stage = metrics.stages["aggregate"]
+    assert stage.runs == 1
+    assert (stage.bytes_in, stage.bytes_out, stage.partitions) == (150, 30, 3)
+
+
+def test_failed_runs_are_measured():
+    metrics = Instrumentation()
+    try:
+        with metrics.measure("validate"):
+            raise ValueError
+    except ValueError:
+        pass
+
+    assert metrics.stages["validate"].runs == 1
+
+
+def test_stages_are_copies():
+    metrics = Instrumentation()
+    with metrics.measure("output"):
+        pass
+
+    metrics.stages["output"].bytes_out = 10
+
+    assert metrics.stages["output"].bytes_out == 0
+
+
+def test_profile_to_file(tmp_path):
+    dump_file = tmp_path / "profiles" / "task.pstats"
+
+    with profile_to_file(dump_file):
+        sorted(range(1000), key=lambda number: -number)
+
+    assert "sorted" in str(pstats.Stats(str(dump_file)).stats)
+
+
+def test_nothing_is_profiled_without_a_file(tmp_path):
+    with profile_to_file(None):
+        pass
+
+    assert not any(tmp_path.iterdir())
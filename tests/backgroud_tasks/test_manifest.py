@@ -0,0 +1,45 @@
+from background_tasks.manifest import PartitionManifest
+
+
+def test_groups_are_recorded_by_their_name(tmp_path):
+    manifest = PartitionManifest(tmp_path)
+
+    for batch_index, group in enumerate(["AC/DC", "ACDC", "", "!!!", "Beyoncé"]):
+        manifest.record(group, rows=1, size=8, fragment=(0, batch_index))
+
+    assert len(manifest) == 5
+    assert manifest.get_fragments([manifest.entries["ACDC"]]) == [(tmp_path / "000000000000000.arrow", 1)]
+
+
+def test_record_counts_rows_bytes_and_sub_partitions(tmp_path):
+    manifest = PartitionManifest(tmp_path)
+    manifest.record("Song 1", rows=10, size=100, fragment=(0, 0))
+    manifest.record("Song 1", rows=5, size=50, fragment=(1024, 2), sub_partition=3)
+
+    entry = manifest.entries["Song 1"]
+    assert (entry.rows, entry.bytes, entry.sub_partitions) == (15, 150, [3])
+    assert manifest.get_fragments([entry]) == [(manifest.chunk_file(0), 0)]
+    assert manifest.get_fragments([entry], sub_partition=3) == [(manifest.chunk_file(1024), 2)]
+    assert manifest.get_group_size("Song 1") == 150
+
+
+def test_merge_and_reload(tmp_path):
+    manifest = PartitionManifest(tmp_path)
+    manifest.record("Song 1", rows=10, size=100, fragment=(0, 0))
+    other = PartitionManifest(tmp_path)
+    other.record("Song 1", rows=1, size=10, fragment=(1024, 0), sub_partition=0)
+    other.record("Song 2", rows=2, size=20, fragment=(1024, 1))
+
+    manifest.merge(other)
+    manifest.save()
+    loaded = PartitionManifest.load(tmp_path)
+
+    assert loaded.to_dict() == manifest.to_dict()
+    assert loaded.entries["Song 1"].rows == 11
+    assert loaded.entries["Song 1"].sub_partitions == [0]
+    assert loaded.entries["Song 1"].fragments == [(0, 0, None), (1024, 0, 0)]
+    assert loaded.rows == 13
+
+
+def test_load_without_manifest(tmp_path):
+    assert len(PartitionManifest.load(tmp_path)) == 0
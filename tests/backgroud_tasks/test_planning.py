@@ -0,0 +1,40 @@
+import polars as pl
+
+from background_tasks.planning import plan_processing
+from dtos import ProcessingEngine
+
+DTYPES = {"Song": pl.Categorical, "Date": pl.Categorical, "Number of Plays": pl.UInt32}
+
+
+def test_plan_estimates_the_rows_and_groups_of_the_file(tmp_path):
+    csv_path = tmp_path / "input.csv"
+    rows = "".join(f"Song {n % 10},2022-01-0{n % 2 + 1},{n}\n" for n in range(1000))
+    csv_path.write_text(f"Song,Date,Number of Plays\n{rows}")
+
+    plan = plan_processing(csv_path, dtypes=DTYPES, in_memory_limit=1024**2)
+
+    assert plan.engine == ProcessingEngine.IN_MEMORY
+    assert plan.file_size == csv_path.stat().st_size
+    assert plan.estimated_rows == 1000
+    assert plan.estimated_groups == 10
+    assert 0 < plan.estimated_memory <= 1024**2
+
+
+def test_files_not_fitting_in_memory_are_partitioned(tmp_path):
+    csv_path = tmp_path / "input.csv"
+    rows = "".join(f"Song {n},2022-01-01,{n}\n" for n in range(1000))
+    csv_path.write_text(f"Song,Date,Number of Plays\n{rows}")
+
+    plan = plan_processing(csv_path, dtypes=DTYPES, in_memory_limit=1024)
+
+    assert plan.engine == ProcessingEngine.PARTITION
+    assert plan.estimated_memory > 1024
+
+
+def test_empty_file_is_aggregated_in_memory(tmp_path):
+    csv_path = tmp_path / "input.csv"
+    csv_path.write_text("Song,Date,Number of Plays\n")
+
+    plan = plan_processing(csv_path, dtypes=DTYPES, in_memory_limit=0)
+
+    assert (plan.engine, plan.estimated_rows, plan.estimated_groups) == (ProcessingEngine.IN_MEMORY, 0, 0)
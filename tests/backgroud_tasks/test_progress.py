@@ -0,0 +1,91 @@
+from typing import List
+
+import pytest
+
+from background_tasks.progress import ProgressReporter
+from dtos import ProcessingStage, TaskProgress
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class RecordingDAO:
+    def __init__(self):
+        self.writes: List[TaskProgress] = []
+
+    def update_task_progress(self, task_id: str, progress: TaskProgress) -> None:
+        self.writes.append(progress)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def dao():
+    return RecordingDAO()
+
+
+def test_writes_are_throttled(clock, dao):
+    progress = ProgressReporter("task", dao, total_bytes=1000, min_interval=2.0, clock=clock)
+    progress.start_stage(ProcessingStage.SPLITTING)
+
+    for step in range(1, 41):
+        clock.now = step * 0.25
+        progress.advance(bytes_read=step * 10, rows=1)
+
+    # The start of the stage, then one write every 2 seconds.
+    assert len(dao.writes) == 1 + 5
+    assert dao.writes[-1].rows_parsed == 40
+    assert progress.progress.bytes_read == 400
+
+
+def test_eta_of_a_reading_stage_is_extrapolated_from_the_bytes_read(clock, dao):
+    progress = ProgressReporter("task", dao, total_bytes=1000, min_interval=0, clock=clock)
+    progress.start_stage(ProcessingStage.SPLITTING, bytes_read=200)
+
+    clock.now = 10.0
+    progress.advance(bytes_read=400, rows=50)
+
+    assert dao.writes[-1].throughput == 5.0
+    assert dao.writes[-1].eta == pytest.approx(30.0)
+
+
+def test_eta_of_the_aggregation_is_extrapolated_from_the_rows_aggregated(clock, dao):
+    progress = ProgressReporter("task", dao, total_bytes=1000, min_interval=0, clock=clock)
+    progress.start_stage(ProcessingStage.AGGREGATING, total_rows=400, total_partitions=8)
+
+    clock.now = 4.0
+    progress.advance(rows=100, partitions=2)
+
+    assert (dao.writes[-1].partitions_aggregated, dao.writes[-1].total_partitions) == (2, 8)
+    assert dao.writes[-1].rows_parsed == 0
+    assert dao.writes[-1].eta == pytest.approx(12.0)
+
+
+def test_unknown_size_has_no_eta(clock, dao):
+    progress = ProgressReporter("task", dao, total_bytes=None, min_interval=0, clock=clock)
+    progress.start_stage(ProcessingStage.READING)
+
+    clock.now = 1.0
+    progress.advance(bytes_read=400, rows=10)
+
+    assert dao.writes[-1].throughput == 10.0
+    assert dao.writes[-1].eta is None
+
+
+def test_finish_is_always_published(clock, dao):
+    progress = ProgressReporter("task", dao, total_bytes=1000, min_interval=60, clock=clock)
+    progress.start_stage(ProcessingStage.READING)
+    progress.advance(bytes_read=1000, rows=10)
+
+    progress.finish()
+
+    assert [write.stage for write in dao.writes] == [ProcessingStage.READING, ProcessingStage.DONE]
+    assert dao.writes[-1].eta == 0
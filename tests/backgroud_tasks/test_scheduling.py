@@ -0,0 +1,48 @@
+from background_tasks.manifest import PartitionEntry
+from background_tasks.scheduling import (
+    MAX_GROUPS_PER_BATCH,
+    group_weight,
+    plan_aggregation_batches,
+)
+
+
+def make_entry(group: str, size: int, sub_partitions=()) -> PartitionEntry:
+    return PartitionEntry(group=group, rows=1, bytes=size, sub_partitions=list(sub_partitions))
+
+
+def test_group_weight_of_a_hot_group_is_a_single_sub_partition():
+    assert group_weight(make_entry("cold", 1600), num_sub_partitions=16) == 1600
+    assert group_weight(make_entry("hot", 1600, sub_partitions=[0, 1]), num_sub_partitions=16) == 100
+
+
+def test_large_groups_first_and_small_groups_packed_together():
+    entries = [make_entry("a", 10), make_entry("b", 500), make_entry("c", 60), make_entry("d", 40), make_entry("e", 30)]
+
+    batches = plan_aggregation_batches(entries, num_sub_partitions=16, batch_size=100)
+
+    assert [[entry.group for entry in batch.entries] for batch in batches] == [["b"], ["c", "d"], ["e", "a"]]
+    assert [batch.weight for batch in batches] == [500, 100, 40]
+
+
+def test_hot_groups_are_never_batched():
+    entries = [make_entry("hot", 320, sub_partitions=[0]), make_entry("cold", 10)]
+
+    batches = plan_aggregation_batches(entries, num_sub_partitions=16, batch_size=100)
+
+    assert [[entry.group for entry in batch.entries] for batch in batches] == [["hot"], ["cold"]]
+
+
+def test_batching_disabled():
+    entries = [make_entry("a", 10), make_entry("b", 20)]
+
+    batches = plan_aggregation_batches(entries, num_sub_partitions=16, batch_size=0)
+
+    assert [[entry.group for entry in batch.entries] for batch in batches] == [["b"], ["a"]]
+
+
+def test_number_of_groups_per_batch_is_bounded():
+    entries = [make_entry(f"song {n}", 1) for n in range(MAX_GROUPS_PER_BATCH + 1)]
+
+    batches = plan_aggregation_batches(entries, num_sub_partitions=16, batch_size=1024**2)
+
+    assert [len(batch.entries) for batch in batches] == [MAX_GROUPS_PER_BATCH, 1]
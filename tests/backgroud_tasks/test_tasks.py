@@ -0,0 +1,396 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+from prometheus_client import REGISTRY
+from pytest_mock import MockerFixture
+
+# The services import the tasks module through the app, importing the tasks module first is a circular import.
+import services  # noqa: F401
+from background_tasks import tasks
+from dtos import (
+    ProcessingEngine,
+    ProcessingStage,
+    SplitCheckpoint,
+    Task,
+    TaskProgress,
+    TaskStatus,
+    Upload,
+    UploadStatus,
+)
+
+from app import create_app
+
+TASK_ID = "8bd7481e-1eb3-47e4-9b1f-a32b761b72eb"
+
+
+class InMemoryTasksDAO:
+    tasks: Dict[str, Task] = {}
+
+    def __init__(self, db=None):
+        pass
+
+    def get_task(self, task_id: str) -> Task:
+        return self.tasks[task_id].copy(deep=True)
+
+    def update_task(self, task: Task) -> Task:
+        task.updated_at = datetime.utcnow()
+        stored_task = self.tasks[task.id]
+        self.tasks[task.id] = task.copy(
+            deep=True,
+            update={
+                "completed_ranges": stored_task.completed_ranges,
+                "attempts": stored_task.attempts,
+                "checkpoint": stored_task.checkpoint,
+                "progress": stored_task.progress,
+            },
+        )
+        return task
+
+    def increment_completed_ranges(self, task_id: str) -> int:
+        self.tasks[task_id].completed_ranges += 1
+        self.tasks[task_id].updated_at = datetime.utcnow()
+        return self.tasks[task_id].completed_ranges
+
+    def start_attempt(self, task_id: str) -> Task:
+        self.tasks[task_id].attempts += 1
+        self.tasks[task_id].updated_at = datetime.utcnow()
+        return self.get_task(task_id)
+
+    def save_checkpoint(self, task_id: str, checkpoint: SplitCheckpoint) -> None:
+        self.tasks[task_id].checkpoint = checkpoint.copy()
+        self.tasks[task_id].updated_at = datetime.utcnow()
+
+    def update_task_progress(self, task_id: str, progress: TaskProgress) -> None:
+        self.tasks[task_id].progress = progress.copy()
+        self.tasks[task_id].updated_at = datetime.utcnow()
+
+    def get_stuck_tasks(self, updated_before: datetime) -> List[Task]:
+        stuck_tasks = [task for task in self.tasks.values() if task.status == TaskStatus.IN_PROGRESS]
+        stuck_tasks = [task for task in stuck_tasks if task.updated_at < updated_before and not task.distributed_ranges]
+        return [task.copy(deep=True) for task in stuck_tasks]
+
+    def requeue_task(self, task: Task) -> bool:
+        stored_task = self.tasks[task.id]
+        if stored_task.status != TaskStatus.IN_PROGRESS or stored_task.updated_at != task.updated_at:
+            return False
+
+        stored_task.status = TaskStatus.QUEUED
+        stored_task.queued_at = datetime.utcnow()
+        return True
+
+    def get_tasks_with_their_workflow_done(self) -> List[Task]:
+        return []
+
+
+class InMemoryUploadsDAO:
+    uploads: Dict[str, Upload] = {}
+
+    def __init__(self, db=None):
+        pass
+
+    def get_expired_uploads(self, updated_before: datetime) -> List[Upload]:
+        return [
+            upload.copy()
+            for upload in self.uploads.values()
+            if upload.status == UploadStatus.IN_PROGRESS and upload.updated_at < updated_before
+        ]
+
+    def expire_upload(self, upload: Upload) -> bool:
+        stored_upload = self.uploads[upload.id]
+        if stored_upload.status != UploadStatus.IN_PROGRESS or stored_upload.updated_at != upload.updated_at:
+            return False
+
+        stored_upload.status = UploadStatus.EXPIRED
+        return True
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app("config.TestingConfig")
+    app.config.update(
+        DOWNLOAD_FOLDER=tmp_path / "output",
+        CSV_PROCESSING_ENGINE="PARTITION",
+        CSV_DISTRIBUTED_RANGE_SIZE=1,
+        CSV_DISTRIBUTED_MAX_RANGES=4,
+    )
+    app.extensions["celery"].conf.update(task_always_eager=True, task_eager_propagates=True)
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def dao(mocker: MockerFixture, tmp_path):
+    input_file = tmp_path / "input.csv"
+    rows = "".join(f"Song {i % 7},2022-01-0{i % 3 + 1},{i}\n" for i in range(300))
+    input_file.write_text(f"Song,Date,Number of Plays\n{rows}")
+
+    InMemoryTasksDAO.tasks = {TASK_ID: Task(id=TASK_ID, input_file_path=str(input_file))}
+    mocker.patch.object(tasks, "TasksMongoDAO", InMemoryTasksDAO)
+    return InMemoryTasksDAO()
+
+
+def expected_rows(input_file: str) -> list:
+    totals: Dict[str, int] = {}
+    for line in Path(input_file).read_text().splitlines()[1:]:
+        song, date, plays = line.split(",")
+        totals[f"{song},{date}"] = totals.get(f"{song},{date}", 0) + int(plays)
+    return sorted(f"{pair},{total}" for pair, total in totals.items())
+
+
+def test_process_csv_distributes_the_byte_ranges(app, dao, mocker: MockerFixture):
+    map_spy = mocker.spy(tasks.split_csv_byte_range, "run")
+    reduce_spy = mocker.spy(tasks.reduce_csv_byte_ranges, "run")
+
+    tasks.process_csv.delay(TASK_ID)
+
+    task = dao.get_task(TASK_ID)
+    assert task.status == TaskStatus.COMPLETED
+    assert task.distributed_ranges == 4
+    assert task.completed_ranges == 4
+    assert map_spy.call_count == 4
+    # Only the names of the manifest files go through the result backend.
+    manifest_files = reduce_spy.call_args.args[0]
+    assert manifest_files == [f"manifest-{call.args[1]}.json" for call in map_spy.call_args_list]
+
+    header, *rows = Path(task.output_file_path).read_text().splitlines()
+    assert header == "Song,Date,Total Number of Plays for Date"
+    assert sorted(rows) == expected_rows(task.input_file_path)
+    assert not (app.config["DOWNLOAD_FOLDER"] / TASK_ID).exists()
+
+
+def test_process_csv_in_a_single_worker_when_the_file_is_small(app, dao, mocker: MockerFixture):
+    app.config["CSV_DISTRIBUTED_RANGE_SIZE"] = 1024**3
+    map_spy = mocker.spy(tasks.split_csv_byte_range, "run")
+
+    tasks.process_csv.delay(TASK_ID)
+
+    task = dao.get_task(TASK_ID)
+    assert task.status == TaskStatus.COMPLETED
+    assert task.distributed_ranges is None
+    assert map_spy.call_count == 0
+
+
+@pytest.mark.parametrize(
+    "concurrent_tasks, worker_concurrency, in_memory_limit, memory_budget",
+    [
+        (0, 1, 512 * 1024**2, 256 * 1024**2),
+        (0, 4, 128 * 1024**2, 64 * 1024**2),
+        (2, 4, 256 * 1024**2, 128 * 1024**2),
+    ],
+)
+def test_tasks_share_the_memory_limit(app, dao, concurrent_tasks, worker_concurrency, in_memory_limit, memory_budget):
+    app.config.update(
+        CSV_MEMORY_LIMIT=1024**3,
+        CSV_CONCURRENT_TASKS=concurrent_tasks,
+        CELERY={**app.config["CELERY"], "worker_concurrency": worker_concurrency},
+    )
+
+    file_processor = tasks.make_csv_processor(TASK_ID, dao)
+
+    assert file_processor.memory_limit == 1024**3 // (concurrent_tasks or worker_concurrency)
+    assert file_processor.in_memory_limit == in_memory_limit
+    assert file_processor.memory_budget == memory_budget
+
+
+def test_process_csv_is_not_distributed_when_asked_not_to(app, dao, mocker: MockerFixture):
+    map_spy = mocker.spy(tasks.split_csv_byte_range, "run")
+
+    tasks.process_csv.apply(args=(TASK_ID,), kwargs={"distribute": False})
+
+    task = dao.get_task(TASK_ID)
+    assert task.status == TaskStatus.COMPLETED
+    assert task.distributed_ranges is None
+    assert map_spy.call_count == 0
+
+
+def test_process_csv_publishes_its_progress(app, dao):
+    app.config["CSV_DISTRIBUTED_RANGE_SIZE"] = 0
+
+    tasks.process_csv.delay(TASK_ID)
+
+    progress = dao.get_task(TASK_ID).progress
+    assert progress.stage == ProcessingStage.DONE
+    assert progress.bytes_read == progress.total_bytes == Path(dao.get_task(TASK_ID).input_file_path).stat().st_size
+    assert progress.rows_parsed == 300
+    assert progress.partitions_aggregated == progress.total_partitions == 7
+
+
+@pytest.mark.parametrize("engine_name, rows", [("PARTITION", 300), ("IN_MEMORY", 300), ("STREAMING", 0)])
+def test_process_csv_records_its_metrics(app, dao, engine_name, rows):
+    app.config.update(CSV_DISTRIBUTED_RANGE_SIZE=0, CSV_PROCESSING_ENGINE=engine_name)
+    dao.tasks[TASK_ID].queued_at = datetime.utcnow() - timedelta(seconds=5)
+    engine = {"engine": engine_name}
+    task_labels = {"task": tasks.process_csv.name, "state": "SUCCESS"}
+    before = {
+        "wait": REGISTRY.get_sample_value("csv_task_queue_wait_seconds_sum"),
+        "bytes": REGISTRY.get_sample_value("csv_processed_bytes_total", engine) or 0,
+        "rows": REGISTRY.get_sample_value("csv_processed_rows_total", engine) or 0,
+        "tasks": REGISTRY.get_sample_value("csv_celery_task_duration_seconds_count", task_labels) or 0,
+    }
+
+    tasks.process_csv.delay(TASK_ID)
+
+    assert REGISTRY.get_sample_value("csv_task_queue_wait_seconds_sum") - before["wait"] >= 5
+    input_size = Path(dao.get_task(TASK_ID).input_file_path).stat().st_size
+    assert REGISTRY.get_sample_value("csv_processed_bytes_total", engine) - before["bytes"] == input_size
+    # The STREAMING engine does not count the rows.
+    assert (REGISTRY.get_sample_value("csv_processed_rows_total", engine) or 0) - before["rows"] == rows
+    assert REGISTRY.get_sample_value("csv_celery_task_duration_seconds_count", task_labels) - before["tasks"] == 1
+    assert REGISTRY.get_sample_value("csv_celery_tasks_in_flight", {"task": tasks.process_csv.name}) == 0
+
+
+@pytest.mark.parametrize("profile_task_ids, profiled", [([TASK_ID], True), (["*"], True), (["other-task"], False)])
+def test_process_csv_profiles_the_selected_tasks(app, dao, tmp_path, profile_task_ids, profiled):
+    app.config.update(CSV_DISTRIBUTED_RANGE_SIZE=0, CSV_PROFILE_TASK_IDS=profile_task_ids, CSV_PROFILE_DIR=tmp_path)
+
+    tasks.process_csv.delay(TASK_ID)
+
+    assert dao.get_task(TASK_ID).metrics["aggregate"].partitions == 7
+    assert (tmp_path / f"{TASK_ID}.pstats").exists() == profiled
+
+
+def test_process_csv_in_a_single_worker_when_planned_in_memory(app, dao, mocker: MockerFixture):
+    app.config["CSV_PROCESSING_ENGINE"] = "AUTO"
+    map_spy = mocker.spy(tasks.split_csv_byte_range, "run")
+
+    tasks.process_csv.delay(TASK_ID)
+
+    task = dao.get_task(TASK_ID)
+    assert task.status == TaskStatus.COMPLETED
+    assert task.plan.engine == ProcessingEngine.IN_MEMORY
+    assert task.distributed_ranges is None
+    assert map_spy.call_count == 0
+
+
+def test_reduce_skips_a_task_with_a_failed_byte_range(app, dao, mocker: MockerFixture):
+    mocker.patch("background_tasks.csv_processor.PartitionSplitter.split", side_effect=OSError("disk full"))
+
+    tasks.process_csv.delay(TASK_ID)
+
+    task = dao.get_task(TASK_ID)
+    assert task.distributed_ranges == 4
+    assert task.status == TaskStatus.FAILED
+    assert task.output_file_path is None
+    assert not (app.config["DOWNLOAD_FOLDER"] / TASK_ID).exists()
+
+
+def test_failed_byte_range_only_discards_its_own_fragments(app, dao, mocker: MockerFixture):
+    dao.tasks[TASK_ID].status, dao.tasks[TASK_ID].distributed_ranges = TaskStatus.IN_PROGRESS, 2
+    tmp_dir = app.config["DOWNLOAD_FOLDER"] / TASK_ID
+    tmp_dir.mkdir(parents=True)
+    other_fragment = tmp_dir / f"{0:015d}.arrow"
+    other_fragment.touch()
+    own_fragment = tmp_dir / f"{100:015d}.arrow"
+
+    def split_and_fail(*args, **kwargs):
+        own_fragment.touch()
+        raise OSError("disk full")
+
+    mocker.patch("background_tasks.csv_processor.PartitionSplitter.split", side_effect=split_and_fail)
+
+    tasks.split_csv_byte_range.delay(TASK_ID, 100, 200)
+
+    assert dao.get_task(TASK_ID).status == TaskStatus.FAILED
+    assert other_fragment.exists()
+    assert not own_fragment.exists()
+
+
+def test_stuck_tasks_are_requeued_and_resumed(app, dao, mocker: MockerFixture):
+    app.config["CSV_DISTRIBUTED_RANGE_SIZE"] = 0
+    stuck_task = dao.tasks[TASK_ID]
+    stuck_task.status, stuck_task.attempts = TaskStatus.IN_PROGRESS, 1
+    stuck_task.updated_at = datetime.utcnow() - timedelta(seconds=app.config["CSV_STUCK_TASK_TIMEOUT"] + 1)
+    process_csv_spy = mocker.spy(tasks.process_csv, "apply_async")
+
+    tasks.requeue_stuck_tasks.delay()
+
+    process_csv_spy.assert_called_once_with(args=(TASK_ID,), queue="light")
+    task = dao.get_task(TASK_ID)
+    assert task.status == TaskStatus.COMPLETED
+    assert task.attempts == 2
+    assert sorted(Path(task.output_file_path).read_text().splitlines()[1:]) == expected_rows(task.input_file_path)
+
+
+def test_distributed_tasks_are_not_requeued(app, dao, mocker: MockerFixture):
+    stuck_task = dao.tasks[TASK_ID]
+    stuck_task.status, stuck_task.distributed_ranges = TaskStatus.IN_PROGRESS, 4
+    stuck_task.updated_at = datetime.utcnow() - timedelta(seconds=app.config["CSV_STUCK_TASK_TIMEOUT"] + 1)
+    process_csv_spy = mocker.spy(tasks.process_csv, "apply_async")
+
+    tasks.requeue_stuck_tasks.delay()
+
+    process_csv_spy.assert_not_called()
+    assert dao.get_task(TASK_ID).status == TaskStatus.IN_PROGRESS
+    assert dao.get_task(TASK_ID).distributed_ranges == 4
+
+
+def test_stuck_tasks_without_their_input_file_fail(app, dao, mocker: MockerFixture, tmp_path):
+    missing_task = Task(id="missing", input_file_path=str(tmp_path / "missing.csv"))
+    dao.tasks[missing_task.id] = missing_task
+    for task in dao.tasks.values():
+        task.status = TaskStatus.IN_PROGRESS
+        task.updated_at = datetime.utcnow() - timedelta(seconds=app.config["CSV_STUCK_TASK_TIMEOUT"] + 1)
+    process_csv_spy = mocker.spy(tasks.process_csv, "apply_async")
+
+    tasks.requeue_stuck_tasks.delay()
+
+    # The other stuck tasks are still requeued.
+    process_csv_spy.assert_called_once_with(args=(TASK_ID,), queue="light")
+    task = dao.get_task("missing")
+    assert task.status == TaskStatus.FAILED
+    assert task.errors == {"input_file": ["The input file of the task is missing."]}
+
+
+def test_recently_updated_tasks_are_not_requeued(app, dao, mocker: MockerFixture):
+    dao.tasks[TASK_ID].status, dao.tasks[TASK_ID].updated_at = TaskStatus.IN_PROGRESS, datetime.utcnow()
+    process_csv_spy = mocker.spy(tasks.process_csv, "apply_async")
+
+    tasks.requeue_stuck_tasks.delay()
+
+    process_csv_spy.assert_not_called()
+    assert dao.get_task(TASK_ID).status == TaskStatus.IN_PROGRESS
+
+
+def test_process_csv_gives_up_after_the_maximum_attempts(app, dao):
+    dao.tasks[TASK_ID].status = TaskStatus.IN_PROGRESS
+    dao.tasks[TASK_ID].attempts = app.config["CSV_MAX_TASK_ATTEMPTS"]
+
+    tasks.process_csv.delay(TASK_ID)
+
+    task = dao.get_task(TASK_ID)
+    assert task.status == TaskStatus.FAILED
+    assert task.attempts == app.config["CSV_MAX_TASK_ATTEMPTS"] + 1
+    assert "3 attempts" in task.errors["error"]
+
+
+def test_process_csv_delivered_again_after_completion_does_nothing(app, dao, mocker: MockerFixture):
+    dao.tasks[TASK_ID].status = TaskStatus.COMPLETED
+    execute_spy = mocker.spy(tasks.CSVProcessor, "execute")
+
+    tasks.process_csv.delay(TASK_ID)
+
+    execute_spy.assert_not_called()
+    assert dao.get_task(TASK_ID).attempts == 0
+
+
+def test_cleanup_files_expires_the_stale_uploads(app, dao, mocker: MockerFixture, tmp_path):
+    mocker.patch.object(tasks, "UploadsMongoDAO", InMemoryUploadsDAO)
+    expiry = timedelta(seconds=app.config["CSV_UPLOAD_EXPIRY"])
+    uploads = {
+        "stale": datetime.utcnow() - expiry - timedelta(minutes=1),
+        "recent": datetime.utcnow() - expiry + timedelta(minutes=1),
+    }
+    InMemoryUploadsDAO.uploads = {}
+    for upload_id, updated_at in uploads.items():
+        file_path = tmp_path / f"{upload_id}.csv"
+        file_path.write_text("Song,Date,Number of Plays\n")
+        InMemoryUploadsDAO.uploads[upload_id] = Upload(id=upload_id, file_path=str(file_path), updated_at=updated_at)
+
+    tasks.cleanup_files.delay()
+
+    assert InMemoryUploadsDAO.uploads["stale"].status == UploadStatus.EXPIRED
+    assert not (tmp_path / "stale.csv").exists()
+    assert InMemoryUploadsDAO.uploads["recent"].status == UploadStatus.IN_PROGRESS
+    assert (tmp_path / "recent.csv").exists()
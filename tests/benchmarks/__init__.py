@@ -0,0 +1,11 @@
+"""
+Benchmarks of the `CSVProcessor` across data shapes (row counts, song and date cardinalities, Zipf-skewed hot songs,
+song name lengths) and processor settings (engines, chunk sizes).
+
+    python -m tests.benchmarks --suite standard --output report.json
+    python -m tests.benchmarks --suite standard --baseline report.json  # exits with 1 on a regression
+
+Every case is run in a fresh process, its report gives the throughput, peak RSS and temporary bytes written, plus
+the metrics of every stage. A baseline is only meaningful on the machine it was produced on, a report is never
+compared with a baseline of another platform or CPU count.
+"""
@@ -0,0 +1,53 @@
+import argparse
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+from tests.benchmarks.suite import (
+    DEFAULT_TOLERANCE,
+    SUITES,
+    compare_with_baseline,
+    run_suite,
+)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m tests.benchmarks", description="Benchmarks the CSVProcessor.")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="quick")
+    parser.add_argument("--match", default="", help="Only run the cases whose name contains this text.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of every case, the fastest one is kept.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", type=Path, help="Where the csv files are generated (and reused).")
+    parser.add_argument("--output", type=Path, help="Writes the JSON report to this file (stdout by default).")
+    parser.add_argument("--baseline", type=Path, help="Fails if the results regress compared with this report.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    cases = [case for case in SUITES[args.suite]() if args.match in case.name]
+    data_dir = args.data_dir or Path(tempfile.gettempdir()) / "csv-processor-benchmarks"
+    report = run_suite(cases, data_dir, repeat=args.repeat, seed=args.seed)
+    report["suite"] = args.suite
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline is None:
+        return 0
+
+    try:
+        regressions = compare_with_baseline(report, json.loads(args.baseline.read_text()), tolerance=args.tolerance)
+    except ValueError as error:
+        print(f"NOT COMPARED {error} Produce a new baseline on this machine.", file=sys.stderr)
+        return 2
+
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+from datetime import date, timedelta
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import polars as pl
+
+
+class DatasetShape(NamedTuple):
+    rows: int
+    # Distinct songs and dates the rows are drawn from.
+    songs: int
+    dates: int
+    # Exponent of the Zipf distribution of the songs: 0 draws them uniformly, the higher the more skewed towards a
+    # few hot songs (1.0 is the classic Zipf law, the top song then gets ~8% of 100k songs' plays).
+    zipf_exponent: float = 0.0
+    # Length of the song names, padded with "x" (the shortest names are "Song <rank>").
+    song_name_length: int = 12
+
+    @property
+    def name(self) -> str:
+        return (
+            f"rows={self.rows},songs={self.songs},dates={self.dates},zipf={self.zipf_exponent:g},"
+            f"name_length={self.song_name_length}"
+        )
+
+
+def make_song_names(shape: DatasetShape) -> np.ndarray:
+    return np.array([f"Song {rank}".ljust(shape.song_name_length, "x") for rank in range(shape.songs)])
+
+
+def make_song_probabilities(shape: DatasetShape) -> np.ndarray:
+    weights = 1.0 / np.arange(1, shape.songs + 1, dtype=np.float64) ** shape.zipf_exponent
+    return weights / weights.sum()
+
+
+def write_dataset(shape: DatasetShape, file_path: Path, *, seed: int = 0, batch_rows: int = 1_000_000) -> Path:
+    """
+    Writes a csv file of the given shape, the same file for the same shape and seed.
+
+    The rows are generated and written `batch_rows` at a time, so files larger than memory can be generated.
+
+    Args:
+        shape (DatasetShape): The shape of the rows.
+        file_path (Path): The csv file.
+        seed (int, optional): The seed of the random generator. Defaults to 0.
+        batch_rows (int, optional): The rows generated at a time. Defaults to 1_000_000.
+
+    Returns:
+        Path: The csv file.
+
+    Example:
+        >>> write_dataset(DatasetShape(rows=1_000_000, songs=10_000, dates=365, zipf_exponent=1.1), path)
+    """
+    rng = np.random.default_rng(seed)
+    song_names = make_song_names(shape)
+    probabilities = make_song_probabilities(shape)
+    first_date = date(2022, 1, 1)
+    date_names = np.array([(first_date + timedelta(days=day)).isoformat() for day in range(shape.dates)])
+
+    with open(file_path, "wb") as f:
+        f.write(b"Song,Date,Number of Plays\n")
+        for start in range(0, shape.rows, batch_rows):
+            size = min(batch_rows, shape.rows - start)
+            batch = pl.DataFrame(
+                {
+                    "Song": song_names[rng.choice(shape.songs, size=size, p=probabilities)],
+                    "Date": date_names[rng.integers(0, shape.dates, size=size)],
+                    "Number of Plays": rng.integers(1, 1000, size=size, dtype=np.uint32),
+                }
+            )
+            batch.write_csv(f, has_header=False)
+
+    return file_path
@@ -0,0 +1,258 @@
+import logging
+import multiprocessing
+import platform
+import resource
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple
+
+import polars as pl
+
+from background_tasks.csv_processor import CSVProcessor
+from daos.dummy_dao import DummyDAO
+from dtos import TaskStatus
+from tests.benchmarks.datasets import DatasetShape, write_dataset
+
+# Compared with the baseline, a case regresses when its throughput is lower, or its peak RSS or temporary bytes
+# written higher, by more than this fraction.
+DEFAULT_TOLERANCE = 0.2
+# Temporary bytes written under this size are never a regression (e.g. a few KB of manifest).
+MIN_COMPARED_TMP_BYTES = 1024**2
+# A report is only compared with a baseline produced on the same kind of machine: the CPUs change the size of the
+# process pools, so both the throughput and the peak RSS.
+COMPARED_ENVIRONMENT = ("platform", "cpus")
+
+
+class BenchmarkCase(NamedTuple):
+    shape: DatasetShape
+    # Keyword arguments of the `CSVProcessor`, e.g. the engine and the chunk size.
+    processor_kwargs: Dict[str, Any]
+
+    @property
+    def name(self) -> str:
+        kwargs = ",".join(f"{key}={value}" for key, value in sorted(self.processor_kwargs.items()))
+        return f"{self.shape.name}|{kwargs}"
+
+
+def make_cases(rows: int) -> List[BenchmarkCase]:
+    """
+    Builds the cases of a suite whose largest files have `rows` rows.
+
+    Every engine is run on every data shape: uniform and Zipf-skewed songs, few and many keys, long song names, and
+    a tenth and the whole of `rows`. The chunk size is swept on the uniform shape.
+    """
+    shapes = [
+        DatasetShape(rows=rows // 10, songs=10_000, dates=365),
+        DatasetShape(rows=rows, songs=10_000, dates=365),
+        DatasetShape(rows=rows, songs=10_000, dates=365, zipf_exponent=1.1),
+        DatasetShape(rows=rows, songs=100_000, dates=365, zipf_exponent=1.5),
+        DatasetShape(rows=rows, songs=20, dates=30),
+        DatasetShape(rows=rows, songs=rows // 4, dates=365),
+        DatasetShape(rows=rows, songs=10_000, dates=365, song_name_length=64),
+    ]
+    engines = [
+        {"engine": "PARTITION", "partitioning": "hash"},
+        {"engine": "EXTERNAL"},
+        {"engine": "STREAMING"},
+        {"engine": "IN_MEMORY"},
+    ]
+    cases = [BenchmarkCase(shape, kwargs) for shape in shapes for kwargs in engines]
+
+    uniform = shapes[1]
+    for chunk_size in (rows // 20, rows // 4):
+        cases.append(BenchmarkCase(uniform, {"engine": "PARTITION", "partitioning": "hash", "chunk_size": chunk_size}))
+        cases.append(BenchmarkCase(uniform, {"engine": "EXTERNAL", "chunk_size": chunk_size}))
+
+    # One group per song: a record batch per song in every chunk file, and a group aggregated per song. That per-group
+    # overhead grows with the songs, not the rows, so it is only run on the 10,000 songs shape.
+    cases.append(BenchmarkCase(shapes[2], {"engine": "PARTITION", "partitioning": "song"}))
+    return cases
+
+
+SUITES = {
+    "quick": lambda: make_cases(rows=200_000),
+    "standard": lambda: make_cases(rows=2_000_000),
+    "large": lambda: make_cases(rows=20_000_000),
+}
+
+
+def get_written_bytes() -> int | None:
+    """
+    Returns the bytes this process has written so far (by every write call, to any file), None if unknown.
+    """
+    try:
+        with open("/proc/self/io") as io:
+            counters = dict(line.split(": ") for line in io.read().splitlines())
+    except (OSError, ValueError):
+        return None
+
+    return int(counters["wchar"])
+
+
+def get_peak_rss() -> int:
+    """
+    Returns the peak RSS of this process in bytes.
+
+    It is read from `VmHWM`, which starts over with a new program, unlike `ru_maxrss` which a spawned process inherits
+    from its parent (it survives `execve`).
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    # ru_maxrss is reported in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_case(case: BenchmarkCase, csv_file: Path, work_dir: Path) -> Dict[str, Any]:
+    """
+    Processes the csv file with a `CSVProcessor` (and a `DummyDAO`), meant to be run in a fresh process so the peak
+    RSS is the one of this case only.
+
+    Returns:
+        Dict[str, Any]: The measures of the run: time, throughput, peak RSS, temporary bytes written and the metrics
+            of every stage recorded on the task.
+    """
+    logging.disable(logging.CRITICAL)
+    dao = DummyDAO(input_dir=csv_file.parent)
+    task = dao.create_new_task(task_id=str(uuid.uuid4()), input_file_path=str(csv_file))
+    output_dir = work_dir / task.id
+    output_dir.mkdir()
+
+    written_bytes = get_written_bytes()
+    start_time = time.perf_counter()
+    with CSVProcessor(task.id, dao, output_dir=output_dir, **case.processor_kwargs) as processor:
+        processor.execute()
+    elapsed_time = time.perf_counter() - start_time
+
+    task = dao.get_task(task.id)
+    if task.status != TaskStatus.COMPLETED:
+        raise RuntimeError(f"Case {case.name} failed: {task.errors}")
+
+    output_bytes = Path(task.output_file_path).stat().st_size
+    tmp_bytes = None
+    if written_bytes is not None:
+        # Everything written by the run but the result file.
+        tmp_bytes = max(get_written_bytes() - written_bytes - output_bytes, 0)  # type: ignore[operator]
+
+    input_bytes = csv_file.stat().st_size
+    shutil.rmtree(output_dir)
+    return {
+        "case": case.name,
+        "shape": case.shape._asdict(),
+        "processor": case.processor_kwargs,
+        "seconds": elapsed_time,
+        "rows_per_second": case.shape.rows / elapsed_time,
+        "bytes_per_second": input_bytes / elapsed_time,
+        "input_bytes": input_bytes,
+        "output_bytes": output_bytes,
+        "tmp_bytes_written": tmp_bytes,
+        "peak_rss": get_peak_rss(),
+        "stages": {name: stage.dict() for name, stage in (task.metrics or {}).items()},
+    }
+
+
+def run_suite(cases: List[BenchmarkCase], data_dir: Path, *, repeat: int = 1, seed: int = 0) -> Dict[str, Any]:
+    """
+    Runs every case `repeat` times, each run in a fresh process, keeping the fastest run of each case.
+
+    The csv file of every shape is written once to `data_dir` (and reused if it is already there).
+
+    Returns:
+        Dict[str, Any]: The environment and the results of the cases, ready to be dumped as JSON.
+    """
+    data_dir.mkdir(parents=True, exist_ok=True)
+    work_dir = data_dir / "work"
+    work_dir.mkdir(exist_ok=True)
+
+    results = []
+    for case in cases:
+        csv_file = data_dir / f"{uuid.uuid5(uuid.NAMESPACE_OID, f'{case.shape.name},seed={seed}')}.csv"
+        if not csv_file.exists():
+            write_dataset(case.shape, csv_file, seed=seed)
+
+        runs = []
+        for _ in range(repeat):
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                runs.append(executor.submit(run_case, case, csv_file, work_dir).result())
+
+        results.append(min(runs, key=lambda run: run["seconds"]))
+
+    shutil.rmtree(work_dir)
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "polars": pl.__version__,
+            "platform": platform.platform(),
+            "cpus": multiprocessing.cpu_count(),
+        },
+        "seed": seed,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare_with_baseline(
+    report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = DEFAULT_TOLERANCE
+) -> List[str]:
+    """
+    Compares the results of a suite with the ones of a baseline report, case by case.
+
+    Args:
+        report (Dict[str, Any]): The report of `run_suite`.
+        baseline (Dict[str, Any]): The baseline report.
+        tolerance (float, optional): The fraction a measure may get worse by. Defaults to DEFAULT_TOLERANCE.
+
+    Raises:
+        ValueError: If the baseline was produced on a different environment (see `COMPARED_ENVIRONMENT`).
+
+    Returns:
+        List[str]: The regressions, empty if there is none. Cases missing from the baseline are not compared.
+    """
+    environment, baseline_environment = report.get("environment", {}), baseline.get("environment", {})
+    differences = [
+        f"{key} {environment.get(key)!r} (baseline {baseline_environment.get(key)!r})"
+        for key in COMPARED_ENVIRONMENT
+        if environment.get(key) != baseline_environment.get(key)
+    ]
+    if differences:
+        raise ValueError(f"The baseline was produced on a different environment: {', '.join(differences)}.")
+
+    baseline_results = {result["case"]: result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        expected = baseline_results.get(result["case"])
+        if expected is None:
+            continue
+
+        if result["rows_per_second"] < expected["rows_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{result['case']}: {result['rows_per_second']:,.0f} rows/s, "
+                f"baseline {expected['rows_per_second']:,.0f} rows/s"
+            )
+
+        if result["peak_rss"] > expected["peak_rss"] * (1 + tolerance):
+            regressions.append(
+                f"{result['case']}: peak RSS {result['peak_rss'] / 1024**2:,.0f}MB, "
+                f"baseline {expected['peak_rss'] / 1024**2:,.0f}MB"
+            )
+
+        tmp_bytes, expected_tmp_bytes = result["tmp_bytes_written"], expected["tmp_bytes_written"]
+        if tmp_bytes is None or expected_tmp_bytes is None:
+            continue
+
+        if tmp_bytes > max(expected_tmp_bytes * (1 + tolerance), MIN_COMPARED_TMP_BYTES):
+            regressions.append(
+                f"{result['case']}: {tmp_bytes / 1024**2:,.1f}MB of temporary files written, "
+                f"baseline {expected_tmp_bytes / 1024**2:,.1f}MB"
+            )
+
+    return regressions
@@ -0,0 +1,151 @@
+import polars as pl
+import pytest
+
+from daos.dummy_dao import DummyDAO
+from dtos import ProcessingStage, SplitCheckpoint, TaskProgress, TaskStatus
+from tests.benchmarks.datasets import DatasetShape, write_dataset
+from tests.benchmarks.suite import (
+    SUITES,
+    BenchmarkCase,
+    compare_with_baseline,
+    run_case,
+)
+
+SHAPE = DatasetShape(rows=5_000, songs=100, dates=10)
+
+
+def make_result(case: str, rows_per_second: float, peak_rss: int, tmp_bytes_written: int | None) -> dict:
+    return {
+        "case": case,
+        "rows_per_second": rows_per_second,
+        "peak_rss": peak_rss,
+        "tmp_bytes_written": tmp_bytes_written,
+    }
+
+
+def test_write_dataset_is_reproducible(tmp_path):
+    first_file = write_dataset(SHAPE, tmp_path / "first.csv", seed=1)
+    second_file = write_dataset(SHAPE, tmp_path / "second.csv", seed=1)
+    other_file = write_dataset(SHAPE, tmp_path / "other.csv", seed=2)
+
+    assert first_file.read_bytes() == second_file.read_bytes()
+    assert first_file.read_bytes() != other_file.read_bytes()
+
+
+def test_write_dataset_shape(tmp_path):
+    file_path = write_dataset(SHAPE._replace(song_name_length=20), tmp_path / "data.csv")
+
+    dataframe = pl.read_csv(file_path)
+    assert dataframe.columns == ["Song", "Date", "Number of Plays"]
+    assert len(dataframe) == SHAPE.rows
+    assert dataframe["Song"].n_unique() <= SHAPE.songs
+    assert dataframe["Date"].n_unique() <= SHAPE.dates
+    assert (dataframe["Song"].str.lengths() == 20).all()
+
+
+def test_write_dataset_zipf_skew(tmp_path):
+    uniform = pl.read_csv(write_dataset(SHAPE, tmp_path / "uniform.csv"))
+    skewed = pl.read_csv(write_dataset(SHAPE._replace(zipf_exponent=1.5), tmp_path / "skewed.csv"))
+
+    def top_song_share(dataframe: pl.DataFrame) -> float:
+        return dataframe["Song"].value_counts(sort=True)["counts"][0] / len(dataframe)
+
+    assert top_song_share(uniform) < 0.05
+    assert top_song_share(skewed) > 0.3
+
+
+def test_suites_have_unique_case_names():
+    for make_cases in SUITES.values():
+        names = [case.name for case in make_cases()]
+        assert len(names) == len(set(names))
+
+
+@pytest.mark.parametrize(
+    "processor_kwargs",
+    [
+        {"engine": "EXTERNAL"},
+        {"engine": "PARTITION", "partitioning": "hash", "chunk_size": 1_000},
+        {"engine": "PARTITION", "partitioning": "hash", "chunk_size": 1_000, "checkpoint_interval": 1},
+    ],
+)
+def test_run_case(tmp_path, processor_kwargs):
+    case = BenchmarkCase(SHAPE, processor_kwargs)
+    csv_file = write_dataset(SHAPE, tmp_path / "data.csv")
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+
+    result = run_case(case, csv_file, work_dir)
+
+    assert result["case"] == case.name
+    assert result["rows_per_second"] > 0
+    assert result["input_bytes"] == csv_file.stat().st_size
+    assert result["output_bytes"] > 0
+    assert result["peak_rss"] > 0
+    assert {"validate", "aggregate", "output"} <= set(result["stages"])
+    assert not any(work_dir.iterdir())
+
+
+def test_compare_with_baseline():
+    baseline = {
+        "results": [
+            make_result("throughput", 1_000, 100 * 1024**2, 0),
+            make_result("rss", 1_000, 100 * 1024**2, 0),
+            make_result("tmp", 1_000, 100 * 1024**2, 10 * 1024**2),
+            make_result("noise", 1_000, 100 * 1024**2, 1024),
+            make_result("unknown tmp", 1_000, 100 * 1024**2, None),
+        ]
+    }
+    report = {
+        "results": [
+            make_result("throughput", 700, 100 * 1024**2, 0),
+            make_result("rss", 1_100, 150 * 1024**2, 0),
+            make_result("tmp", 900, 110 * 1024**2, 20 * 1024**2),
+            make_result("noise", 900, 110 * 1024**2, 10 * 1024),
+            make_result("unknown tmp", 900, 110 * 1024**2, 20 * 1024**2),
+            make_result("new case", 1, 1024**3, 1024**3),
+        ]
+    }
+
+    regressions = compare_with_baseline(report, baseline, tolerance=0.2)
+
+    assert [regression.split(":")[0] for regression in regressions] == ["throughput", "rss", "tmp"]
+
+
+def test_dummy_dao_keeps_the_tasks(tmp_path):
+    dao = DummyDAO(input_dir=tmp_path)
+    task = dao.create_new_task(task_id="task", input_file_path=str(tmp_path / "task.csv"))
+    progress = TaskProgress(stage=ProcessingStage.AGGREGATING, bytes_read=10, total_bytes=20)
+
+    dao.update_task_progress(task.id, progress)
+    task.status = TaskStatus.COMPLETED
+    dao.update_task(task)
+
+    stored_task = dao.get_task("task")
+    assert stored_task.status == TaskStatus.COMPLETED
+    assert stored_task.progress == progress
+    assert stored_task.input_file_path == str(tmp_path / "task.csv")
+    assert dao.get_task("unknown").input_file_path.startswith(str(tmp_path))
+
+
+def test_dummy_dao_keeps_the_counters_and_checkpoint(tmp_path):
+    dao = DummyDAO(input_dir=tmp_path)
+    task = dao.create_new_task(task_id="task", input_file_path=str(tmp_path / "task.csv"))
+    checkpoint = SplitCheckpoint(offset=100, chunks=1, rows=10, manifest_file="checkpoint.json")
+
+    assert dao.start_attempt(task.id).attempts == 1
+    assert dao.increment_completed_ranges(task.id) == 1
+    dao.save_checkpoint(task.id, checkpoint)
+    # A stale copy of the task does not overwrite them.
+    dao.update_task(task)
+
+    stored_task = dao.get_task("task")
+    assert (stored_task.attempts, stored_task.completed_ranges) == (1, 1)
+    assert stored_task.checkpoint == checkpoint
+
+
+def test_compare_with_a_baseline_of_another_environment():
+    baseline = {"environment": {"platform": "Linux", "cpus": 1}, "results": [make_result("case", 1_000, 1024, 0)]}
+    report = {"environment": {"platform": "Linux", "cpus": 8}, "results": [make_result("case", 1_000, 1024, 0)]}
+
+    with pytest.raises(ValueError, match="cpus 8 \\(baseline 1\\)"):
+        compare_with_baseline(report, baseline)
@@ -0,0 +1,76 @@
+import gzip
+
+import polars as pl
+import pytest
+import zstandard
+
+from helpers.compression import get_compression, open_input_file
+from helpers.csv_reader import CSVChunkReader
+
+DTYPES = {"Song": pl.Categorical, "Date": pl.Categorical, "Number of Plays": pl.UInt32}
+CSV_CONTENT = "Song,Date,Number of Plays\n" + "".join(f"Song {i},2022-01-0{i % 9 + 1},{i}\n" for i in range(1000))
+
+
+def compress(content: bytes, suffix: str) -> bytes:
+    if suffix == ".csv.gz":
+        return gzip.compress(content)
+
+    if suffix == ".csv.zst":
+        return zstandard.ZstdCompressor().compress(content)
+
+    return content
+
+
+@pytest.mark.parametrize(
+    "file_name, compression",
+    [("plays.csv", None), ("plays.csv.gz", "gzip"), ("plays.CSV.GZ", "gzip"), ("plays.csv.zst", "zstd")],
+)
+def test_get_compression(file_name, compression):
+    assert get_compression(file_name) == compression
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".csv.gz", ".csv.zst"])
+def test_open_input_file_decompresses_on_the_fly(tmp_path, suffix):
+    file_path = tmp_path / f"plays{suffix}"
+    file_path.write_bytes(compress(CSV_CONTENT.encode(), suffix))
+
+    with open_input_file(file_path) as file:
+        assert file.read() == CSV_CONTENT.encode()
+
+
+@pytest.mark.parametrize("suffix", [".csv.gz", ".csv.zst"])
+@pytest.mark.parametrize("chunk_size", [7, 100, None])
+def test_chunks_of_a_compressed_file_cover_the_whole_file(tmp_path, suffix, chunk_size):
+    file_path = tmp_path / f"plays{suffix}"
+    file_path.write_bytes(compress(CSV_CONTENT.encode(), suffix))
+
+    with pl.StringCache():
+        chunks = list(CSVChunkReader(file_path, dtypes=DTYPES, chunk_size=chunk_size))
+        dataframe = pl.concat([chunk.dataframe for chunk in chunks])
+
+    assert dataframe["Number of Plays"].to_list() == list(range(1000))
+    # The offsets are the ones of the decompressed stream.
+    assert chunks[-1].end == len(CSV_CONTENT)
+    assert all(previous.end == chunk.start for previous, chunk in zip(chunks, chunks[1:]))
+
+
+@pytest.mark.parametrize("suffix", [".csv.gz", ".csv.zst"])
+def test_compressed_file_read_from_an_offset(tmp_path, suffix):
+    file_path = tmp_path / f"plays{suffix}"
+    file_path.write_bytes(compress(CSV_CONTENT.encode(), suffix))
+    chunks = list(CSVChunkReader(file_path, dtypes=DTYPES, chunk_size=100))
+    middle = chunks[len(chunks) // 2]
+
+    resumed_chunks = list(CSVChunkReader(file_path, dtypes=DTYPES, chunk_size=100, start=middle.start))
+
+    assert resumed_chunks[0].start == middle.start
+    plays = [plays for chunk in resumed_chunks for plays in chunk.dataframe["Number of Plays"]]
+    assert plays == list(range(middle.dataframe["Number of Plays"][0], 1000))
+
+
+def test_compressed_file_cannot_be_read_up_to_an_end(tmp_path):
+    file_path = tmp_path / "plays.csv.gz"
+    file_path.write_bytes(compress(CSV_CONTENT.encode(), ".csv.gz"))
+
+    with pytest.raises(ValueError):
+        list(CSVChunkReader(file_path, dtypes=DTYPES, chunk_size=100, start=0, end=100))
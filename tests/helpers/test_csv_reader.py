@@ -0,0 +1,71 @@
+import polars as pl
+import pytest
+
+from helpers.csv_reader import CSVChunkReader, split_file_into_byte_ranges
+
+DTYPES = {"Song": pl.Categorical, "Date": pl.Categorical, "Number of Plays": pl.UInt32}
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    csv_path = tmp_path / "test.csv"
+    rows = "".join(f"Song {i},2022-01-0{i % 9 + 1},{i}\n" for i in range(1000))
+    csv_path.write_text(f"Song,Date,Number of Plays\n{rows}")
+    return csv_path
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 100, 5000, None])
+def test_chunks_cover_the_whole_file(csv_file, chunk_size):
+    with pl.StringCache():
+        chunks = list(CSVChunkReader(csv_file, dtypes=DTYPES, chunk_size=chunk_size))
+        dataframe = pl.concat([chunk.dataframe for chunk in chunks])
+
+    assert dataframe.schema == DTYPES
+    assert dataframe["Number of Plays"].to_list() == list(range(1000))
+    assert chunks[0].start == len("Song,Date,Number of Plays\n")
+    assert chunks[-1].end == csv_file.stat().st_size
+    assert all(previous.end == chunk.start for previous, chunk in zip(chunks, chunks[1:]))
+
+
+def test_chunk_size_is_approximately_respected(csv_file):
+    heights = [chunk.dataframe.height for chunk in CSVChunkReader(csv_file, dtypes=DTYPES, chunk_size=100)]
+
+    assert len(heights) > 5
+    assert all(height <= 150 for height in heights)
+
+
+def test_reads_a_byte_range(csv_file):
+    chunks = list(CSVChunkReader(csv_file, dtypes=DTYPES, chunk_size=100))
+    middle = chunks[len(chunks) // 2]
+
+    ranged_chunks = list(CSVChunkReader(csv_file, dtypes=DTYPES, chunk_size=100, start=middle.start))
+
+    assert sum(chunk.dataframe.height for chunk in ranged_chunks) == sum(
+        chunk.dataframe.height for chunk in chunks[len(chunks) // 2 :]
+    )
+
+
+def test_last_row_without_line_break(tmp_path):
+    csv_path = tmp_path / "test.csv"
+    csv_path.write_text("Song,Date,Number of Plays\nSong 1,2022-01-01,10\nSong 2,2022-01-01,20")
+
+    chunks = list(CSVChunkReader(csv_path, dtypes=DTYPES, chunk_size=1))
+
+    assert chunks[-1].end == csv_path.stat().st_size
+    assert chunks[-1].dataframe.row(-1) == ("Song 2", "2022-01-01", 20)
+
+
+@pytest.mark.parametrize("num_ranges", [1, 2, 3, 16])
+def test_byte_ranges_are_aligned_on_rows(csv_file, num_ranges):
+    ranges = split_file_into_byte_ranges(csv_file, num_ranges)
+    content = csv_file.read_bytes()
+
+    assert len(ranges) == num_ranges
+    assert ranges[0][0] == len("Song,Date,Number of Plays\n")
+    assert ranges[-1][1] == len(content)
+    assert all(previous_end == start for (_, previous_end), (start, _) in zip(ranges, ranges[1:]))
+    assert all(content[start - 1 : start] == b"\n" for start, _ in ranges)
+
+
+def test_byte_ranges_respect_the_minimum_size(csv_file):
+    assert len(split_file_into_byte_ranges(csv_file, 16, min_range_size=csv_file.stat().st_size)) == 1
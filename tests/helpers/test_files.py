@@ -0,0 +1,41 @@
+import errno
+import os
+
+import pytest
+
+from helpers.files import append_files_to_file
+
+
+@pytest.fixture
+def part_files(tmp_path):
+    parts = []
+    for number in range(3):
+        part = tmp_path / f"part-{number}.csv"
+        part.write_bytes(f"Song {number},2022-01-01,{number}\n".encode() * 1000)
+        parts.append(part)
+    return parts
+
+
+def test_append_files_to_file(tmp_path, part_files):
+    result = tmp_path / "result.csv"
+    result.write_bytes(b"Song,Date,Total Number of Plays for Date\n")
+    expected = result.read_bytes() + b"".join(part.read_bytes() for part in part_files)
+
+    copied = append_files_to_file(part_files, result)
+
+    assert result.read_bytes() == expected
+    assert copied == sum(part.stat().st_size for part in part_files)
+
+
+def test_append_files_to_file_without_zero_copy(mocker, tmp_path, part_files):
+    def unsupported(*args):
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+    mocker.patch("helpers.files.os.copy_file_range", side_effect=unsupported, create=True)
+    mocker.patch("helpers.files.os.sendfile", side_effect=unsupported)
+    result = tmp_path / "result.csv"
+    result.write_bytes(b"header\n")
+
+    append_files_to_file(part_files, result)
+
+    assert result.read_bytes() == b"header\n" + b"".join(part.read_bytes() for part in part_files)
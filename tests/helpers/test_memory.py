@@ -0,0 +1,61 @@
+import polars as pl
+import pytest
+from pytest_mock import MockerFixture
+
+from helpers.csv_reader import CSVChunkReader
+from helpers.memory import ChunkSizeController, get_rss_bytes
+
+
+@pytest.fixture
+def dataframe():
+    return pl.DataFrame({"Number of Plays": pl.Series(range(1000), dtype=pl.UInt32)})
+
+
+def test_get_rss_bytes():
+    rss = get_rss_bytes()
+
+    assert rss is None or rss > 0
+
+
+def test_chunk_size_fits_the_memory_target(mocker: MockerFixture, dataframe):
+    mocker.patch("helpers.memory.get_rss_bytes", return_value=None)
+    controller = ChunkSizeController(1000, memory_target=4 * 100_000)
+
+    # 4 bytes per parsed row plus 4 raw bytes per row.
+    assert controller.update(dataframe, raw_size=4000) == 50_000
+
+
+def test_chunk_size_shrinks_close_to_the_memory_limit(mocker: MockerFixture, dataframe):
+    rss = mocker.patch("helpers.memory.get_rss_bytes", return_value=100)
+    controller = ChunkSizeController(1000, memory_target=4 * 100_000, memory_limit=1000)
+
+    assert controller.update(dataframe) == 100_000
+
+    rss.return_value = 900
+    assert controller.update(dataframe) == 50_000
+    assert controller.update(dataframe) == 25_000
+
+
+def test_chunk_size_never_goes_below_the_minimum(mocker: MockerFixture, dataframe):
+    mocker.patch("helpers.memory.get_rss_bytes", return_value=None)
+    controller = ChunkSizeController(1000, memory_target=1)
+
+    assert controller.update(dataframe) == ChunkSizeController.MIN_CHUNK_SIZE
+
+
+def test_reader_adapts_the_chunk_size(mocker: MockerFixture, tmp_path):
+    mocker.patch("helpers.memory.get_rss_bytes", return_value=None)
+    mocker.patch.object(ChunkSizeController, "MIN_CHUNK_SIZE", 1)
+    csv_path = tmp_path / "test.csv"
+    csv_path.write_text("Number of Plays\n" + "".join(f"{i}\n" for i in range(1000)))
+
+    controller = ChunkSizeController(10, memory_target=100 * 8)
+    reader = CSVChunkReader(
+        csv_path, dtypes={"Number of Plays": pl.UInt32}, chunk_size=10, chunk_size_controller=controller
+    )
+    heights = [chunk.dataframe.height for chunk in reader]
+
+    assert sum(heights) == 1000
+    # About 4 raw bytes and 4 parsed bytes per row.
+    assert heights[0] < 50
+    assert max(heights[1:]) > 50
@@ -0,0 +1,146 @@
+import threading
+import time
+
+import pytest
+
+from helpers import parallel_execution
+from helpers.parallel_execution import (
+    BoundedExecutor,
+    MemoryBudget,
+    configure_executors,
+    execute_in_thread_pool,
+    iterate_in_background,
+    wait_for_futures,
+)
+
+
+@pytest.fixture
+def shared_executors():
+    settings = dict(parallel_execution._EXECUTOR_SETTINGS)
+    yield
+    configure_executors(**settings)
+
+
+def test_iterate_in_background_keeps_the_order():
+    assert list(iterate_in_background(range(100), max_queued=3)) == list(range(100))
+
+
+def test_iterate_in_background_raises_the_producer_exception():
+    def produce():
+        yield 1
+        raise ValueError("broken chunk")
+
+    iterator = iterate_in_background(produce())
+
+    assert next(iterator) == 1
+    with pytest.raises(ValueError, match="broken chunk"):
+        next(iterator)
+
+
+def test_iterate_in_background_bounds_the_items_ahead_of_the_consumer():
+    produced = []
+
+    def produce():
+        for item in range(10):
+            produced.append(item)
+            yield item
+
+    iterator = iterate_in_background(produce(), max_queued=2)
+    assert next(iterator) == 0
+    # Gives the producer time to run ahead.
+    time.sleep(0.3)
+
+    # The item being consumed, the queued ones and the one waiting to be queued.
+    assert len(produced) <= 4
+
+    iterator.close()
+    assert len(produced) < 10
+
+
+def test_executor_returns_the_results_in_order():
+    executor = BoundedExecutor("thread", max_workers=4, max_pending=2)
+
+    assert executor.map(pow, [(2, i) for i in range(20)]) == [2**i for i in range(20)]
+
+    executor.shutdown()
+
+
+def test_executor_stops_submitting_after_an_exception():
+    executor = BoundedExecutor("thread", max_workers=1, max_pending=1)
+    calls = []
+
+    def fail_on_three(value):
+        calls.append(value)
+        if value == 3:
+            raise ValueError("three")
+        return value
+
+    with pytest.raises(ValueError, match="three"):
+        executor.map(fail_on_three, [(i,) for i in range(100)])
+
+    executor.shutdown()
+    assert len(calls) < 100
+
+
+def test_executor_bounds_the_pending_calls():
+    executor = BoundedExecutor("thread", max_workers=4, max_pending=3)
+    running = []
+    max_running = []
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            running.append(1)
+            max_running.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.pop()
+
+    futures = [executor.submit(work) for _ in range(30)]
+    wait_for_futures(futures)
+    executor.shutdown()
+
+    assert max(max_running) <= 3
+
+
+def test_nested_calls_run_in_the_calling_worker(shared_executors):
+    configure_executors(thread_workers=1, max_pending=1)
+
+    def outer(value):
+        return sum(execute_in_thread_pool(pow, [(value, 2), (value, 3)]))
+
+    assert execute_in_thread_pool(outer, [(2,), (3,)]) == [12, 36]
+
+
+def test_memory_budget_bounds_the_weight_running_at_the_same_time():
+    budget = MemoryBudget(100)
+    in_flight = []
+    max_in_flight = []
+    lock = threading.Lock()
+
+    def work(weight):
+        with lock:
+            in_flight.append(weight)
+            max_in_flight.append(sum(in_flight))
+        time.sleep(0.01)
+        with lock:
+            in_flight.remove(weight)
+        return weight
+
+    executor = BoundedExecutor("thread", max_workers=4, max_pending=8)
+    weights = [60, 50, 40, 30, 20, 10]
+    results = executor.map(work, [(weight,) for weight in weights], memory_budget=budget, weights=weights)
+    executor.shutdown()
+
+    assert results == weights
+    assert max(max_in_flight) <= 100
+    assert budget.in_flight == 0
+
+
+def test_memory_budget_admits_a_call_heavier_than_the_budget_alone():
+    budget = MemoryBudget(100)
+
+    budget.acquire(500)
+    budget.release(500)
+
+    assert budget.in_flight == 0
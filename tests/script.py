@@ -2,12 +2,23 @@
 Use this module to create large csv files to be processed by the application.
 
 The output file will live in /tests/static/
+
+`compare_read_throughput` compares reading a csv file with its gzip and zstd versions (decompressed on the fly).
 """
 
+import gzip
+import shutil
+import sys
 import time
 from functools import wraps
+from pathlib import Path
 
 import polars as pl
+import zstandard
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from helpers.compression import open_input_file  # noqa: E402
 
 
 def log_elapsed_time(func):
@@ -50,5 +61,31 @@ def create_larger_csv_file(n: int = 1000):
     df.collect(streaming=True).write_csv(final_sample_file, has_header=True, batch_size=100_000)
 
 
+def compress_csv_file(csv_file: str) -> list[str]:
+    """Writes the gzip and zstd versions of `csv_file` next to it."""
+    gzip_file, zstd_file = f"{csv_file}.gz", f"{csv_file}.zst"
+    with open(csv_file, "rb") as source, gzip.open(gzip_file, "wb", compresslevel=1) as target:
+        shutil.copyfileobj(source, target)
+
+    with open(csv_file, "rb") as source, open(zstd_file, "wb") as target:
+        zstandard.ZstdCompressor().copy_stream(source, target)
+
+    return [gzip_file, zstd_file]
+
+
+def compare_read_throughput(csv_file: str, block_size: int = 1024**2):
+    """Compares the throughput (MB/s of csv) of reading the plain, gzip and zstd versions of `csv_file`."""
+    for file_path in [csv_file, *compress_csv_file(csv_file)]:
+        start_time = time.time()
+        read_bytes = 0
+        with open_input_file(file_path) as file:
+            while block := file.read(block_size):
+                read_bytes += len(block)
+
+        elapsed_time = time.time() - start_time
+        file_size = Path(file_path).stat().st_size
+        print(f"{file_path}: {file_size / 1024**2:.0f}MB on disk, {read_bytes / 1024**2 / elapsed_time:.0f}MB/s of csv")
+
+
 if __name__ == "__main__":
     create_larger_csv_file()
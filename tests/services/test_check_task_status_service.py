@@ -1,7 +1,7 @@
 from http import HTTPStatus
 
 from daos.dummy_dao import DummyDAO
-from dtos.tasks import PublicTaskInfo, Task
+from dtos.tasks import ProcessingStage, PublicTaskInfo, Task, TaskProgress, TaskStatus
 from services.check_task_status import CheckTaskStatusService
 
 
@@ -21,3 +21,23 @@ def test_check_task_status():
 
     assert response == expected_response
     assert status == expected_status
+
+
+def test_check_task_status_reports_the_progress(mocker):
+    progress = TaskProgress(
+        stage=ProcessingStage.SPLITTING, bytes_read=512, total_bytes=2048, rows_parsed=16, throughput=8.0, eta=6.0
+    )
+    dao = mocker.Mock()
+    dao.get_task.return_value = Task(id="task_id", status=TaskStatus.IN_PROGRESS, progress=progress)
+
+    response, _ = CheckTaskStatusService(dao=dao).check_status("task_id")
+
+    assert response["task"]["progress"] == {
+        "stage": ProcessingStage.SPLITTING,
+        "bytes_read": 512,
+        "total_bytes": 2048,
+        "rows_parsed": 16,
+        "partitions_aggregated": 0,
+        "throughput": 8.0,
+        "eta": 6.0,
+    }
@@ -0,0 +1,233 @@
+import zlib
+from http import HTTPStatus
+from io import BytesIO
+from pathlib import Path
+from typing import Dict
+
+import pytest
+from flask import Request
+
+import dtos
+from daos.dummy_dao import DummyDAO
+from services import ChunkedUploadService
+
+from app.api import exceptions
+
+CSV_CONTENT = b"Song,Date,Number of Plays\nSong 1,2022-01-01,10\nSong 2,2022-01-02,20\n"
+
+
+class InMemoryUploadsDAO:
+    def __init__(self):
+        self.uploads: Dict[str, dtos.Upload] = {}
+
+    def create_upload(self, upload_id: str, file_path: str, engine: dtos.ProcessingEngine | None = None) -> dtos.Upload:
+        self.uploads[upload_id] = dtos.Upload(id=upload_id, file_path=file_path, engine=engine)
+        return self.uploads[upload_id].copy()
+
+    def get_upload(self, upload_id: str) -> dtos.Upload:
+        return self.uploads[upload_id].copy()
+
+    def advance_upload(self, upload_id: str, *, offset: int, new_offset: int, checksum: int) -> dtos.Upload | None:
+        upload = self.uploads[upload_id]
+        if upload.offset != offset or upload.status != dtos.UploadStatus.IN_PROGRESS:
+            return None
+
+        upload.offset, upload.checksum = new_offset, checksum
+        return upload.copy()
+
+    def finalize_upload(self, upload_id: str) -> dtos.Upload | None:
+        upload = self.uploads[upload_id]
+        if upload.status != dtos.UploadStatus.IN_PROGRESS:
+            return None
+
+        upload.status = dtos.UploadStatus.FINALIZED
+        return upload.copy()
+
+
+@pytest.fixture
+def upload_folder(tmp_path):
+    return tmp_path
+
+
+@pytest.fixture
+def uploads_dao():
+    return InMemoryUploadsDAO()
+
+
+@pytest.fixture
+def make_service(mocker, uploads_dao, upload_folder):
+    def make_service(json=None, body=b"", offset=None, **kwargs):
+        request = mocker.MagicMock(spec=Request)
+        request.get_json.return_value = json
+        request.stream = BytesIO(body)
+        request.headers = {} if offset is None else {"Upload-Offset": str(offset)}
+        return ChunkedUploadService(
+            request=request,
+            dao=uploads_dao,
+            tasks_dao=DummyDAO(input_dir=upload_folder),
+            upload_folder=upload_folder,
+            **kwargs,
+        )
+
+    return make_service
+
+
+@pytest.fixture
+def upload_id(make_service):
+    response, status, headers = make_service(json={"filename": "plays.csv"}).start_upload()
+    assert status == HTTPStatus.CREATED
+    assert headers == {"Upload-Offset": "0"}
+    return response["upload"]["id"]
+
+
+def test_chunks_are_written_to_the_final_file(make_service, uploads_dao, upload_id):
+    for offset in range(0, len(CSV_CONTENT), 16):
+        response, status, headers = make_service(body=CSV_CONTENT[offset : offset + 16], offset=offset).upload_chunk(
+            upload_id
+        )
+        assert status == HTTPStatus.OK
+
+    upload = uploads_dao.get_upload(upload_id)
+    assert Path(upload.file_path).read_bytes() == CSV_CONTENT
+    assert response["upload"]["offset"] == len(CSV_CONTENT) == int(headers["Upload-Offset"])
+    assert response["upload"]["checksum"] == zlib.crc32(CSV_CONTENT)
+
+
+def test_chunk_at_an_unexpected_offset_is_rejected(make_service, upload_id):
+    make_service(body=CSV_CONTENT[:16], offset=0).upload_chunk(upload_id)
+
+    with pytest.raises(exceptions.ConflictAPIException) as exc_info:
+        make_service(body=CSV_CONTENT[32:48], offset=32).upload_chunk(upload_id)
+
+    assert exc_info.value.response.details == [{"field": "Upload-Offset", "message": "Expected offset 16, got 32."}]
+
+
+def test_upload_resumes_from_the_last_complete_chunk(make_service, uploads_dao, upload_id):
+    make_service(body=CSV_CONTENT[:16], offset=0).upload_chunk(upload_id)
+    # A chunk interrupted by a disconnect leaves bytes after the offset of the upload.
+    with open(uploads_dao.get_upload(upload_id).file_path, "ab") as f:
+        f.write(b"garbage")
+
+    _, _, headers = make_service().get_upload_status(upload_id)
+    make_service(body=CSV_CONTENT[16:], offset=int(headers["Upload-Offset"])).upload_chunk(upload_id)
+
+    upload = uploads_dao.get_upload(upload_id)
+    assert Path(upload.file_path).read_bytes() == CSV_CONTENT
+    assert upload.checksum == zlib.crc32(CSV_CONTENT)
+
+
+class InterruptedStream(BytesIO):
+    """
+    Request body that runs another request on the same upload while its first block is read.
+    """
+
+    def __init__(self, body: bytes, overlapping_request):
+        super().__init__(body)
+        self.overlapping_request = overlapping_request
+        self.error = None
+
+    def read(self, size: int = -1) -> bytes:
+        if self.overlapping_request is not None:
+            overlapping_request, self.overlapping_request = self.overlapping_request, None
+            try:
+                overlapping_request()
+            except exceptions.ConflictAPIException as error:
+                self.error = error
+
+        return super().read(size)
+
+
+def test_overlapping_chunks_at_the_same_offset(make_service, uploads_dao, upload_id):
+    retry = make_service(body=b"X" * len(CSV_CONTENT), offset=0)
+    service = make_service(offset=0)
+    service.request.stream = InterruptedStream(CSV_CONTENT, lambda: retry.upload_chunk(upload_id))
+
+    _, status, _ = service.upload_chunk(upload_id)
+
+    assert status == HTTPStatus.OK
+    assert service.request.stream.error.response.details == [
+        {"upload": "Another request is writing to the upload, retry once it is done."}
+    ]
+    upload = uploads_dao.get_upload(upload_id)
+    assert Path(upload.file_path).read_bytes() == CSV_CONTENT
+    assert (upload.offset, upload.checksum) == (len(CSV_CONTENT), zlib.crc32(CSV_CONTENT))
+
+
+def test_upload_is_not_finalized_while_a_chunk_is_written(make_service, mocker, uploads_dao, upload_id):
+    mocked_process_csv = mocker.patch("services.chunked_upload.process_csv")
+    service = make_service(offset=0)
+    service.request.stream = InterruptedStream(CSV_CONTENT, lambda: make_service().finalize_upload(upload_id))
+
+    service.upload_chunk(upload_id)
+
+    assert service.request.stream.error is not None
+    assert uploads_dao.get_upload(upload_id).status == dtos.UploadStatus.IN_PROGRESS
+    mocked_process_csv.apply_async.assert_not_called()
+
+
+def test_finalize_creates_and_queues_the_task(make_service, mocker, upload_id):
+    mocked_process_csv = mocker.patch("services.chunked_upload.process_csv")
+    make_service(body=CSV_CONTENT, offset=0).upload_chunk(upload_id)
+
+    response, status = make_service(json={"checksum": zlib.crc32(CSV_CONTENT)}).finalize_upload(upload_id)
+
+    assert status == HTTPStatus.ACCEPTED
+    assert response == {
+        "task": {"id": upload_id, "status": dtos.TaskStatus.QUEUED},
+        "next": f"/api/v1/file-processing/tasks/{upload_id}/status",
+    }
+    mocked_process_csv.apply_async.assert_called_once_with(args=(upload_id,), queue="light")
+
+    with pytest.raises(exceptions.ConflictAPIException):
+        make_service(body=b"more rows", offset=len(CSV_CONTENT)).upload_chunk(upload_id)
+
+
+@pytest.mark.parametrize("call", ["upload_chunk", "finalize_upload"])
+def test_expired_upload(make_service, mocker, uploads_dao, upload_id, call):
+    mocked_process_csv = mocker.patch("services.chunked_upload.process_csv")
+    uploads_dao.uploads[upload_id].status = dtos.UploadStatus.EXPIRED
+
+    with pytest.raises(exceptions.ConflictAPIException) as exc_info:
+        getattr(make_service(body=CSV_CONTENT, offset=0), call)(upload_id)
+
+    assert exc_info.value.response.details == [{"upload": "Upload expired, start a new one."}]
+    mocked_process_csv.apply_async.assert_not_called()
+
+
+def test_finalize_with_a_wrong_checksum(make_service, mocker, uploads_dao, upload_id):
+    mocked_process_csv = mocker.patch("services.chunked_upload.process_csv")
+    make_service(body=CSV_CONTENT, offset=0).upload_chunk(upload_id)
+
+    with pytest.raises(exceptions.BadRequestAPIException) as exc_info:
+        make_service(json={"checksum": 1234}).finalize_upload(upload_id)
+
+    assert exc_info.value.response.details[0]["field"] == "checksum"
+    assert uploads_dao.get_upload(upload_id).status == dtos.UploadStatus.IN_PROGRESS
+    mocked_process_csv.apply_async.assert_not_called()
+
+
+def test_compressed_uploads_keep_their_suffix(make_service, uploads_dao):
+    response, _, _ = make_service(json={"filename": "plays.csv.zst"}).start_upload()
+
+    assert uploads_dao.get_upload(response["upload"]["id"]).file_path.endswith(".csv.zst")
+
+
+@pytest.mark.parametrize("filename, expected_queue", [("plays.csv", "light"), ("plays.csv.zst", "heavy")])
+def test_finalize_routes_compressed_uploads_by_their_estimated_csv(make_service, mocker, filename, expected_queue):
+    mocked_process_csv = mocker.patch("services.chunked_upload.process_csv")
+    response, _, _ = make_service(json={"filename": filename}).start_upload()
+    upload_id = response["upload"]["id"]
+    make_service(body=CSV_CONTENT, offset=0).upload_chunk(upload_id)
+
+    # Compressed files are assumed to be 10 times larger once decompressed.
+    make_service(heavy_task_size=len(CSV_CONTENT) * 5).finalize_upload(upload_id)
+
+    mocked_process_csv.apply_async.assert_called_once_with(args=(upload_id,), queue=expected_queue)
+
+
+@pytest.mark.parametrize(
+    "json", [None, {"filename": "plays.txt"}, {"filename": "plays.gz"}, {"filename": "plays.csv", "engine": "spark"}]
+)
+def test_start_upload_with_invalid_data(make_service, json):
+    with pytest.raises(exceptions.BadRequestAPIException):
+        make_service(json=json).start_upload()
@@ -17,6 +17,7 @@ def request_with_file(mocker):
     file_storage = FileStorage(stream=BytesIO(b"file content"), filename="test.csv")
     request = mocker.MagicMock(spec=Request)
     request.files = {"file": file_storage}
+    request.form = {}
     return request
 
 
@@ -27,7 +28,9 @@ def create_task_dao(upload_folder):
 
 @pytest.fixture
 def upload_folder(tmp_path):
-    return tmp_path / "uploads"
+    upload_folder = tmp_path / "uploads"
+    upload_folder.mkdir()
+    return upload_folder
 
 
 @pytest.fixture
@@ -39,11 +42,7 @@ def test_create_task(request_with_file, create_task_dao, upload_folder, download
     service = CreateTaskService(
         request=request_with_file, dao=create_task_dao, upload_folder=upload_folder, download_folder=download_folder
     )
-    mocked_get_file_from_request = mocker.patch("services.create_task.CreateTaskService.get_file_from_request")
-    mocked_get_file_from_request.save = mocker.Mock()
-
     mocked_process_csv = mocker.patch("services.create_task.process_csv")
-    mocked_process_csv.delay = mocker.Mock()
 
     expected_task_id = service.task_id
     expected_response = {
@@ -59,7 +58,7 @@ def test_create_task(request_with_file, create_task_dao, upload_folder, download
 
     assert response == expected_response
     assert status == expected_status
-    mocked_process_csv.delay.assert_called_once_with(expected_task_id)
+    mocked_process_csv.apply_async.assert_called_once_with(args=(expected_task_id,), queue="light")
 
 
 def test_create_task_missing_file(request_with_file, create_task_dao, upload_folder, download_folder):
@@ -96,3 +95,178 @@ def test_create_task_invalid_file_extension(request_with_file, create_task_dao,
         service.create_task()
 
         assert exc_info.value.details == [{"field": "file", "message": "File extension 'txt' not supported."}]
+
+
+@pytest.mark.parametrize("filename, suffix", [("test.csv.gz", ".csv.gz"), ("TEST.CSV.ZST", ".csv.zst")])
+def test_create_task_keeps_compressed_files_compressed(
+    request_with_file, create_task_dao, upload_folder, download_folder, mocker, filename, suffix
+):
+    request_with_file.files["file"].filename = filename
+    service = CreateTaskService(
+        request=request_with_file, dao=create_task_dao, upload_folder=upload_folder, download_folder=download_folder
+    )
+    mocker.patch("services.create_task.process_csv")
+    spy_create_new_task = mocker.spy(create_task_dao, "create_new_task")
+
+    service.create_task()
+
+    assert spy_create_new_task.spy_return.input_file_path == str(upload_folder / f"{service.task_id}{suffix}")
+
+
+@pytest.mark.parametrize("engine", ["streaming", "EXTERNAL"])
+def test_create_task_with_engine(request_with_file, create_task_dao, upload_folder, download_folder, mocker, engine):
+    request_with_file.form = {"engine": engine}
+    service = CreateTaskService(
+        request=request_with_file, dao=create_task_dao, upload_folder=upload_folder, download_folder=download_folder
+    )
+    mocker.patch("services.create_task.process_csv")
+    spy_create_new_task = mocker.spy(create_task_dao, "create_new_task")
+
+    service.create_task()
+
+    assert spy_create_new_task.spy_return.engine == dtos.ProcessingEngine(engine.upper())
+
+
+def test_create_task_with_invalid_engine(request_with_file, create_task_dao, upload_folder, download_folder):
+    request_with_file.form = {"engine": "spark"}
+    service = CreateTaskService(
+        request=request_with_file, dao=create_task_dao, upload_folder=upload_folder, download_folder=download_folder
+    )
+
+    with pytest.raises(exceptions.BadRequestAPIException) as exc_info:
+        service.create_task()
+
+    assert exc_info.value.response.details[0]["field"] == "engine"
+
+
+def test_create_task_processes_small_files_inline(
+    request_with_file, create_task_dao, upload_folder, download_folder, mocker
+):
+    service = CreateTaskService(
+        request=request_with_file,
+        dao=create_task_dao,
+        upload_folder=upload_folder,
+        download_folder=download_folder,
+        inline_max_size=1024,
+    )
+    mocked_process_csv = mocker.patch("services.create_task.process_csv")
+    completed_task = dtos.Task(id=service.task_id, status=dtos.TaskStatus.COMPLETED, output_file_path="result.csv")
+    mocker.patch.object(create_task_dao, "get_task", return_value=completed_task)
+
+    response, status = service.create_task()
+
+    assert status == HTTPStatus.OK
+    assert response == {
+        "task": {"id": service.task_id, "status": dtos.TaskStatus.COMPLETED},
+        "next": f"/api/v1/file-processing/tasks/{service.task_id}/download",
+    }
+    mocked_process_csv.apply.assert_called_once_with(args=(service.task_id,), kwargs={"distribute": False})
+    mocked_process_csv.apply_async.assert_not_called()
+
+
+def test_create_task_returns_the_errors_of_a_task_that_failed_inline(
+    request_with_file, create_task_dao, upload_folder, download_folder, mocker
+):
+    service = CreateTaskService(
+        request=request_with_file,
+        dao=create_task_dao,
+        upload_folder=upload_folder,
+        download_folder=download_folder,
+        inline_max_size=1024,
+    )
+    mocked_process_csv = mocker.patch("services.create_task.process_csv")
+    errors = {"input_file": ["Invalid csv."]}
+    failed_task = dtos.Task(id=service.task_id, status=dtos.TaskStatus.FAILED, errors=errors)
+    mocker.patch.object(create_task_dao, "get_task", return_value=failed_task)
+
+    response, status = service.create_task()
+
+    assert status == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert response == {"task": {"id": service.task_id, "status": dtos.TaskStatus.FAILED, "errors": errors}}
+    mocked_process_csv.apply_async.assert_not_called()
+
+
+def test_create_task_queues_a_task_not_processed_inline(
+    request_with_file, create_task_dao, upload_folder, download_folder, mocker
+):
+    service = CreateTaskService(
+        request=request_with_file,
+        dao=create_task_dao,
+        upload_folder=upload_folder,
+        download_folder=download_folder,
+        inline_max_size=1024,
+    )
+    mocked_process_csv = mocker.patch("services.create_task.process_csv")
+    mocker.patch.object(
+        create_task_dao, "get_task", return_value=dtos.Task(id=service.task_id, status=dtos.TaskStatus.QUEUED)
+    )
+
+    response, status = service.create_task()
+
+    assert status == HTTPStatus.ACCEPTED
+    assert response["next"] == f"/api/v1/file-processing/tasks/{service.task_id}/status"
+    mocked_process_csv.apply_async.assert_called_once_with(args=(service.task_id,), queue="light")
+
+
+def test_create_task_queues_files_larger_than_the_inline_size(
+    request_with_file, create_task_dao, upload_folder, download_folder, mocker
+):
+    service = CreateTaskService(
+        request=request_with_file,
+        dao=create_task_dao,
+        upload_folder=upload_folder,
+        download_folder=download_folder,
+        inline_max_size=4,
+    )
+    mocked_process_csv = mocker.patch("services.create_task.process_csv")
+
+    response, status = service.create_task()
+
+    assert status == HTTPStatus.ACCEPTED
+    mocked_process_csv.apply_async.assert_called_once_with(args=(service.task_id,), queue="light")
+    mocked_process_csv.apply.assert_not_called()
+
+
+@pytest.mark.parametrize("heavy_task_size, expected_queue", [(0, "csv-light"), (13, "csv-light"), (12, "csv-heavy")])
+def test_create_task_routes_the_task_by_file_size(
+    request_with_file, create_task_dao, upload_folder, download_folder, mocker, heavy_task_size, expected_queue
+):
+    service = CreateTaskService(
+        request=request_with_file,
+        dao=create_task_dao,
+        upload_folder=upload_folder,
+        download_folder=download_folder,
+        heavy_task_size=heavy_task_size,
+        light_queue="csv-light",
+        heavy_queue="csv-heavy",
+    )
+    mocked_process_csv = mocker.patch("services.create_task.process_csv")
+
+    service.create_task()
+
+    mocked_process_csv.apply_async.assert_called_once_with(args=(service.task_id,), queue=expected_queue)
+
+
+@pytest.mark.parametrize("filename, inline", [("test.csv", True), ("test.csv.gz", False), ("test.csv.zst", False)])
+def test_create_task_sizes_compressed_files_by_their_estimated_csv(
+    request_with_file, create_task_dao, upload_folder, download_folder, mocker, filename, inline
+):
+    # The file content is 12 bytes, compressed files are assumed to be 10 times larger once decompressed.
+    request_with_file.files["file"].filename = filename
+    service = CreateTaskService(
+        request=request_with_file,
+        dao=create_task_dao,
+        upload_folder=upload_folder,
+        download_folder=download_folder,
+        inline_max_size=64,
+        heavy_task_size=100,
+        light_queue="csv-light",
+        heavy_queue="csv-heavy",
+    )
+    mocked_process_csv = mocker.patch("services.create_task.process_csv")
+
+    service.create_task()
+
+    assert mocked_process_csv.apply.called == inline
+    if not inline:
+        mocked_process_csv.apply_async.assert_called_once_with(args=(service.task_id,), queue="csv-heavy")